@@ -1,9 +1,10 @@
 # -*- coding:utf-8 -*-
+import atexit
 import importlib
 import os
 import sys
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
-from functools import lru_cache
 from re import finditer
 from urllib.parse import urlencode
 
@@ -12,11 +13,11 @@ import pytz
 import rdflib
 import sadi
 import sadi.mimeparse
-from celery import Celery
+from celery import Celery, Task
 from celery.schedules import crontab
 from depot.manager import DepotManager
 from depot.middleware import FileServeApp
-from flask import render_template, g, redirect, url_for, request, flash, send_from_directory, abort
+from flask import render_template, g, redirect, url_for, request, flash, send_from_directory, abort, Response
 from flask_security import Security
 from flask_security.core import current_user
 from flask_security.forms import RegisterForm
@@ -37,6 +38,8 @@ from whyis.blueprint.tableview import tableview_blueprint
 from whyis.blueprint.sparql import sparql_blueprint
 from whyis.data_extensions import DATA_EXTENSIONS
 from whyis.data_formats import DATA_FORMATS
+from whyis.http_session import configure_http
+from whyis.metrics import REGISTRY, caller, configure_metrics, counter, gauge_callback, histogram, timed
 from whyis.datastore import WhyisUserDatastore
 from whyis.decorator import conditional_login_required
 from whyis.empty import Empty
@@ -45,13 +48,16 @@ from whyis.namespace import NS
 from whyis.nanopub import NanopublicationManager
 # from flask_login.config import EXEMPT_METHODS
 from whyis.task_utils import is_waiting, is_running_waiting
+from whyis.description_cache import DescriptionCache, describe
+from whyis.label_service import LabelService
+from whyis.view_index import ViewIndex
 
 rdflib.plugin.register('sparql', Result,
         'rdflib.plugins.sparql.processor', 'SPARQLResult')
 rdflib.plugin.register('sparql', Processor,
-        'rdflib.plugins.sparql.processor', 'SPARQLProcessor')
+        'whyis.database.thread_local', 'ThreadSafeSPARQLProcessor')
 rdflib.plugin.register('sparql', UpdateProcessor,
-        'rdflib.plugins.sparql.processor', 'SPARQLUpdateProcessor')
+        'whyis.database.thread_local', 'ThreadSafeSPARQLUpdateProcessor')
 
 # apps is a special folder where you can place your blueprints
 PROJECT_PATH = os.path.abspath(os.path.dirname(__file__))
@@ -63,6 +69,11 @@ sys.path.insert(0, os.path.join(PROJECT_PATH, "apps"))
 # increase probability that the rule will be near or at the bottom 
 bottom_compare_key = True, 100, [(2, 0)]
 
+view_seconds = histogram('whyis_view_seconds', 'Time taken to render views.', ('view',))
+view_errors = counter('whyis_view_errors', 'Views that failed to render.', ('view',))
+task_seconds = histogram('whyis_task_seconds', 'Time taken by Celery tasks.', ('task',))
+task_errors = counter('whyis_task_errors', 'Celery tasks that failed.', ('task',))
+
 
 # Setup Flask-Security
 class ExtendedRegisterForm(RegisterForm):
@@ -81,12 +92,42 @@ class App(Empty):
     def configure_extensions(self):
 
         Empty.configure_extensions(self)
-        self.celery = Celery(self.name, broker=self.config['CELERY_BROKER_URL'], beat=True)
-        self.celery.conf.update(self.config)
-        
         app = self
 
+        class WhyisTask(Task):
+            def __call__(self, *args, **kwargs):
+                for db in [app.db, app.admin_db]:
+                    if hasattr(db.store, 'unpin'):
+                        db.store.unpin()
+                with ExitStack() as stack:
+                    stack.enter_context(caller('task:%s' % self.name))
+                    stack.enter_context(timed(task_seconds, task_errors, task=self.name))
+                    if app.config.get('buffer_updates', False):
+                        stack.enter_context(app.buffered_updates())
+                    return Task.__call__(self, *args, **kwargs)
+
+        self.celery = Celery(self.name, broker=self.config['CELERY_BROKER_URL'], beat=True, task_cls=WhyisTask)
+        self.celery.conf.update(self.config)
+
         self.redis = self.celery.broker_connection().default_channel.client
+        for db in [self.db, self.admin_db]:
+            # Keep result cache generations in Redis so that writes from
+            # any process invalidate every process's cache.
+            if getattr(db.store, 'result_cache', None) is not None:
+                db.store.result_cache.redis = self.redis
+            if getattr(db.store, 'single_flight', None) is not None:
+                db.store.single_flight.redis = self.redis
+
+        self.query_log = None
+        if self.config.get('slow_query_log', False):
+            self.query_log = database.QueryLog(self.redis,
+                                               threshold=self.config.get('slow_query_threshold', 0),
+                                               interval=self.config.get('slow_query_interval', 10),
+                                               samples=self.config.get('slow_query_samples', 1000))
+            atexit.register(self.query_log.flush)
+            for db in [self.db, self.admin_db]:
+                if hasattr(db.store, 'query_log'):
+                    db.store.query_log = self.query_log
         
         if 'root_path' in self.config:
             self.root_path = self.config['root_path']
@@ -105,7 +146,8 @@ class App(Empty):
                 print("Deferring to a later invocation.", service_name)
                 return
             print(service_name)
-            service.process_graph(app.db)
+            with caller('agent:%s' % service_name):
+                service.process_graph(app.db)
 
         @self.celery.task
         def process_nanopub(nanopub_uri, service_name, taskid=None):
@@ -113,7 +155,8 @@ class App(Empty):
             print(service, nanopub_uri)
             if app.nanopub_manager.is_current(nanopub_uri):
                 nanopub = app.nanopub_manager.get(nanopub_uri)
-                service.process_graph(nanopub)
+                with caller('agent:%s' % service_name):
+                    service.process_graph(nanopub)
             else:
                 print("Skipping retired nanopub", nanopub_uri)
 
@@ -130,7 +173,8 @@ class App(Empty):
                 resource = app.get_resource(uri)
 
                 # result never used
-                task['service'].process_graph(resource.graph)
+                with caller('agent:%s' % task['name']):
+                    task['service'].process_graph(resource.graph)
 
             task['service'].app = app
             task['find_instances'] = find_instances
@@ -166,6 +210,10 @@ class App(Empty):
                 return
             nanopub = app.nanopub_manager.get(nanopub_uri)
             nanopub_graph = ConjunctiveGraph(nanopub.store)
+            if app.description_cache is not None and app.description_cache.redis is not None:
+                # Descriptions were invalidated when the nanopub was
+                # published, so describe the hot ones again for everyone.
+                app.description_cache.warm(app.nanopub_manager.described_subjects(nanopub))
             if 'inferencers' in self.config:
                 for name, service in list(self.config['inferencers'].items()):
                     service.app = self
@@ -221,6 +269,21 @@ class App(Empty):
                                                       self,
                                                       update_listener=self.nanopub_update_listener)
 
+        def cache_stats():
+            caches = [('nanopub', self.nanopub_manager.cache_stats())]
+            for db in [self.db, self.admin_db]:
+                if getattr(db.store, 'result_cache', None) is not None:
+                    caches.append((db.store.metrics_name, db.store.result_cache.stats()))
+            if getattr(self, 'label_service', None) is not None:
+                caches.append(('label', self.label_service.stats()))
+            if getattr(self, 'description_cache', None) is not None:
+                caches.append(('description', self.description_cache.stats()))
+            for name, stats in caches:
+                for key, value in stats.items():
+                    if isinstance(value, (int, float)):
+                        yield {'cache': name, 'stat': key}, value
+        gauge_callback('whyis_cache', 'Nanopublication, SPARQL result, label and description cache statistics.', cache_stats)
+
     _file_depot = None
     @property
     def file_depot(self):
@@ -246,22 +309,59 @@ class App(Empty):
         self.NS = NS
         self.NS.local = rdflib.Namespace(self.config['lod_prefix']+'/')
 
+        configure_http(self.config)
+        configure_metrics(self.config)
+        database.configure_query_pool(self.config)
         self.admin_db = database.engine_from_config(self.config, "admin_")
         self.db = database.engine_from_config(self.config, "knowledge_")
         self.db.app = self
 
+        @self.before_request
+        def unpin_replicas():
+            for db in [self.db, self.admin_db]:
+                if hasattr(db.store, 'unpin'):
+                    db.store.unpin()
+
+        if self.config.get('buffer_updates', False):
+            @self.before_request
+            def begin_buffered_updates():
+                g.buffered_updates = ExitStack()
+                g.buffered_updates.enter_context(self.buffered_updates())
+
+            @self.after_request
+            def flush_buffered_updates(response):
+                g.pop('buffered_updates').close()
+                return response
+
+            @self.teardown_request
+            def discard_buffered_updates(exc):
+                # Only reached with the buffer open if the request failed.
+                stack = g.pop('buffered_updates', None)
+                if stack is not None:
+                    if exc is None:
+                        exc = RuntimeError("Request ended before its updates were sent.")
+                    stack.__exit__(type(exc), exc, None)
+
         self.vocab = ConjunctiveGraph()
         #print URIRef(self.config['vocab_file'])
         default_vocab = Graph(store=self.vocab.store)
         default_vocab.parse(source=os.path.abspath(os.path.join(os.path.dirname(__file__), "default_vocab.ttl")), format="turtle", publicID=str(self.NS.local))
         custom_vocab = Graph(store=self.vocab.store)
         custom_vocab.parse(self.config['vocab_file'], format="turtle", publicID=str(self.NS.local))
+        self.view_index = ViewIndex(self.vocab)
 
 
         self.datastore = WhyisUserDatastore(self.admin_db, {}, self.config['lod_prefix'])
         self.security = Security(self, self.datastore,
                                  register_form=ExtendedRegisterForm)
 
+    @contextmanager
+    def buffered_updates(self):
+        '''Buffers edits to the knowledge and admin graphs made in this
+        thread, and sends them when the block ends.'''
+        with database.buffered(self.db.store), database.buffered(self.admin_db.store):
+            yield
+
     def __weighted_route(self, *args, **kwargs):
         """
         Override the match_compare_key function of the Rule created by invoking Flask.route.
@@ -307,55 +407,16 @@ class App(Empty):
 
         def description(self):
             if self._description is None:
-#                try:
+                app = getattr(self._graph, 'app', None)
+                cache = getattr(app, 'description_cache', None)
+                if cache is not None and self._graph is app.db:
+                    triples = cache.get(self.identifier)
+                else:
+                    triples = describe(self._graph, self.identifier)
                 result = Graph()
-#                try:
-                for quad in self._graph.query('''
-construct {
-    ?e ?p ?o.
-    ?o rdfs:label ?label.
-    ?o skos:prefLabel ?prefLabel.
-    ?o dc:title ?title.
-    ?o foaf:name ?name.
-    ?o ?pattr ?oattr.
-    ?oattr rdfs:label ?oattrlabel
-} where {
-    graph ?g {
-      ?e ?p ?o.
-    }
-    ?g a np:Assertion.
-    optional {
-      ?e sio:hasAttribute|sio:hasPart ?o.
-      ?o ?pattr ?oattr.
-      optional {
-        ?oattr rdfs:label ?oattrlabel.
-      }
-    }
-    optional {
-      ?o rdfs:label ?label.
-    }
-    optional {
-      ?o skos:prefLabel ?prefLabel.
-    }
-    optional {
-      ?o dc:title ?title.
-    }
-    optional {
-      ?o foaf:name ?name.
-    }
-}''', initNs=NS.prefixes, initBindings={'e':self.identifier}):
-                    if len(quad) == 3:
-                        s,p,o = quad
-                    else:
-                        # Last term is never used
-                        s,p,o,_ = quad
-                    result.add((s,p,o))
-#                except:
-#                    pass
+                for triple in triples:
+                    result.add(triple)
                 self._description = result.resource(self.identifier)
-#                except Exception as e:
-#                    print str(e), self.identifier
-#                    raise e
             return self._description
         
     def get_resource(self, entity, async_=True, retrieve=True):
@@ -466,7 +527,7 @@ construct {
                 self.nanopub_manager.retire(old_np)
 
             for n in self.nanopub_manager.prepare(nanopub):
-                self.nanopub_manager.publish(n)
+                self.nanopub_manager.publish(n).wait()
 
     def _can_edit(self, uri):
         if self.managed:
@@ -497,49 +558,36 @@ construct {
 
         label_properties = [self.NS.skos.prefLabel, self.NS.RDFS.label, self.NS.schema.name, self.NS.dc.title, self.NS.foaf.name, self.NS.schema.name, self.NS.skos.notation]
 
-        @lru_cache(maxsize=1000)
-        def get_remote_label(uri):
-            for db in [self.db, self.admin_db]:
-                g = Graph()
-                try:
-                    db.nsBindings = {}
-                    g += db.query('''select ?s ?p ?o where {
-                        hint:Query hint:optimizer "Runtime" .
-
-                         ?s ?p ?o.}''',
-                                  initNs=self.NS.prefixes, initBindings=dict(s=uri))
-                    db.nsBindings = {}
-                except:
-                    pass
-                resource_entity = g.resource(uri)
-                if len(resource_entity.graph) == 0:
-                    #print "skipping", db
-                    continue
-                for property in label_properties:
-                    labels = self.lang_filter(resource_entity[property])
-                    if len(labels) > 0:
-                        return labels[0]
-                    
-                if len(labels) == 0:
-                    name = [x.value for x in [resource_entity.value(self.NS.foaf.givenName),
-                                              resource_entity.value(self.NS.foaf.familyName)] if x is not None]
-                    if len(name) > 0:
-                        label = ' '.join(name)
-                        return label
+        def local_label(uri):
             try:
                 label = self.db.qname(uri).split(":")[1].replace("_"," ")
                 return ' '.join(camel_case_split(label)).title()
             except Exception as e:
                 print(str(e), uri)
                 return str(uri)
-        
+
+        self.label_service = LabelService([self.db, self.admin_db], label_properties,
+                                          [self.NS.foaf.givenName, self.NS.foaf.familyName],
+                                          lang_filter=self.lang_filter, fallback=local_label,
+                                          redis=self.redis if self.config.get('label_cache_redis', False) else None,
+                                          ttl=self.config.get('label_cache_ttl', 3600),
+                                          maxsize=self.config.get('label_cache_size', 100000))
+
+        self.description_cache = None
+        if self.config.get('description_cache', False):
+            self.description_cache = DescriptionCache(lambda uri: describe(self.db, uri),
+                                                      redis=self.redis if self.config.get('description_cache_redis', False) else None,
+                                                      ttl=self.config.get('description_cache_ttl', 3600),
+                                                      maxsize=self.config.get('description_cache_size', 10000),
+                                                      hot_size=self.config.get('description_cache_hot', 1000))
+
         def get_label(resource):
             for property in label_properties:
                 labels = self.lang_filter(resource[property])
                 #print "mem", property, label
                 if len(labels) > 0:
                     return labels[0]
-            return get_remote_label(resource.identifier)
+            return self.label_service.label(resource.identifier)
             
         @self.before_request
         def load_forms():
@@ -708,31 +756,20 @@ construct {
 
             types = []
             if 'as' in request.args:
-                types = [URIRef(request.args['as']), 0]
+                types = [(URIRef(request.args['as']), 0)]
 
             types.extend((x, 1) for x in self.vocab[resource.identifier : NS.RDF.type])
             if not types: # KG types cannot override vocab types. This should keep views stable where critical.
                 types.extend([(x.identifier, 1) for x in resource[NS.RDF.type]])
             #if len(types) == 0:
-            types.append([self.NS.RDFS.Resource, 100])
-            type_string = ' '.join(["(%s %d '%s')" % (x.n3(), i, view) for x, i in types])
-            view_query = '''select ?id ?view (count(?mid)+?priority as ?rank) ?class ?c where {
-    values (?c ?priority ?id) { %s }
-    ?c rdfs:subClassOf* ?mid.
-    ?mid rdfs:subClassOf* ?class.
-    ?class ?viewProperty ?view.
-    ?viewProperty rdfs:subPropertyOf* whyis:hasView.
-    ?viewProperty dc:identifier ?id.
-} group by ?c ?class order by ?rank
-''' % type_string
-
-            #print view_query
-            views = list(self.vocab.query(view_query, initNs=dict(whyis=self.NS.whyis, dc=self.NS.dc)))
+            types.append((self.NS.RDFS.Resource, 100))
+
+            views = self.view_index.views(types, view)
             if len(views) == 0:
                 abort(404)
 
             headers = {'Content-Type': "text/html"}
-            extension = views[0]['view'].value.split(".")[-1]
+            extension = str(views[0].view).split(".")[-1]
             if extension in DATA_EXTENSIONS:
                 headers['Content-Type'] = DATA_EXTENSIONS[extension]
                 
@@ -740,9 +777,16 @@ construct {
             # default view (list of nanopubs)
             # if available, replace with class view
             # if available, replace with instance view
-            return render_template(views[0]['view'].value, **template_args), 200, headers
+            template = str(views[0].view)
+            with caller('view:%s' % template), timed(view_seconds, view_errors, view=template):
+                return render_template(template, **template_args), 200, headers
         self.render_view = render_view
 
+        if self.config.get('metrics', False):
+            @self.route('/metrics')
+            def metrics():
+                return Response(REGISTRY.exposition(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
         # Register blueprints
         self.register_blueprint(nanopub_blueprint)
         self.register_blueprint(sparql_blueprint)
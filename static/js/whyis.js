@@ -906,8 +906,37 @@ function whyis() {
         };
     }]);
 
-    // Returns a promise that resolves to the label
-    app.factory("getLabel", ["$http", function($http) {
+    // Returns a promise that resolves to the label. Labels asked for
+    // in the same tick are fetched together, in one request per batch.
+    app.factory("getLabel", ["$http", "$q", "$timeout", function($http, $q, $timeout) {
+	var pending = {};
+	var scheduled = false;
+
+	function fetchBatch(uris, deferreds) {
+	    $http.post(ROOT_URL+"labels", uris)
+		.then(function(response) {
+		    uris.forEach(function(uri) {
+			if(response.data[uri] !== undefined)
+			    getLabel.labels[uri].label = response.data[uri];
+			deferreds[uri].resolve(getLabel.labels[uri].label);
+		    });
+		}, function(response) {
+		    uris.forEach(function(uri) {
+			deferreds[uri].reject(response);
+		    });
+		});
+	}
+
+	function fetchLabels() {
+	    var deferreds = pending;
+	    var uris = Object.keys(deferreds);
+	    pending = {};
+	    scheduled = false;
+	    for (var i = 0; i < uris.length; i += getLabel.batchSize) {
+		fetchBatch(uris.slice(i, i + getLabel.batchSize), deferreds);
+	    }
+	}
+
 	function getLabel(uri) {
 	    if(getLabel.labels[uri] === undefined) {
 		var localPart = uri.split("#").filter(function(d) {return d.length > 0});
@@ -916,16 +945,18 @@ function whyis() {
                 localPart = localPart[localPart.length-1];
                 getLabel.labels[uri] = { label: localPart };
 
-		getLabel.labels[uri].promise = $http.get(ROOT_URL+"about", {params: {uri, view: "label"}, responseType: "text"})
-						    .then(function(response) {
-							if(response.status === 200)
-							    getLabel.labels[uri].label = response.data;
-							return getLabel.labels[uri].label;
-						    });
+		pending[uri] = $q.defer();
+		getLabel.labels[uri].promise = pending[uri].promise;
+		if(!scheduled) {
+		    scheduled = true;
+		    $timeout(fetchLabels, 0, false);
+		}
 	    }
 	    return getLabel.labels[uri].promise;
 	}
 	getLabel.labels = {};
+	// As many as the server takes in one request.
+	getLabel.batchSize = typeof LABELS_MAX_URIS === 'undefined' ? 1000 : LABELS_MAX_URIS;
 	return getLabel;
     }]);
 
@@ -1909,9 +1940,9 @@ FILTER ( !strstarts(str(?id), "bnode:") )\n\
                                 });
                         }
                         if (! nodeEntry.data.label) {
-                            $http.get(ROOT_URL+'about',{ params: {uri:uri,view:'label'}})
-                                .then(function(response) {
-                                    nodeEntry.data.label = response.data;
+                            getLabel(uri)
+                                .then(function(label) {
+                                    nodeEntry.data.label = label;
                                     if (update) update();
                                 });
                         }
@@ -2074,8 +2105,8 @@ FILTER ( !strstarts(str(?id), "bnode:") )\n\
         }
     }]);
     
-    app.directive("explore", ["$http", 'links', '$timeout', '$mdSidenav', "resolveEntity", 'getSummary', 'getView',
-                              function($http, links, $timeout, $mdSidenav, resolveEntity, getSummary, getView) {
+    app.directive("explore", ["$http", 'links', '$timeout', '$mdSidenav', "resolveEntity", 'getSummary', 'getView', 'getLabel',
+                              function($http, links, $timeout, $mdSidenav, resolveEntity, getSummary, getView, getLabel) {
 	return {
             scope: {
                 elements : "=?",
@@ -2332,9 +2363,9 @@ FILTER ( !strstarts(str(?id), "bnode:") )\n\
                     data.loaded = 0;
                     if (! data.label) {
                         data.loading += 1;
-                        $http.get('about',{ params: {uri:data.uri,view:'label'}})
-                            .then(function(response) {
-                                data.label = response.data;
+                        getLabel(data.uri)
+                            .then(function(label) {
+                                data.label = label;
                                 data.loaded += 1;
                                 if (update) render();
                             });
@@ -2347,9 +2378,9 @@ FILTER ( !strstarts(str(?id), "bnode:") )\n\
                             };
                             console.log(d);
                             data.loading += 1;
-                            $http.get(ROOT_URL+'about',{ params: {uri:d,view:'label'}})
-                                .then(function(response) {
-                                    result.label = response.data;
+                            getLabel(d)
+                                .then(function(label) {
+                                    result.label = label;
                                     data.loaded += 1; 
                                 });
                             return result;
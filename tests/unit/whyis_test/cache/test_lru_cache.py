@@ -0,0 +1,36 @@
+from unittest import TestCase
+
+from whyis.cache import LRUCache
+
+
+class LRUCacheTestCase(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.hits, 3)
+        self.assertEqual(cache.misses, 1)
+
+    def test_size_bound(self):
+        cache = LRUCache(5, getsizeof=len)
+        cache.set('a', 'xxx')
+        cache.set('b', 'yyy')
+        self.assertNotIn('a', cache)
+        self.assertEqual(cache.currsize, 3)
+        cache.set('c', 'zzzzzz')
+        self.assertNotIn('c', cache)
+        self.assertIn('b', cache)
+
+    def test_delete(self):
+        cache = LRUCache(5, getsizeof=len)
+        cache.set('a', 'xxx')
+        cache.delete('a')
+        cache.delete('b')
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.currsize, 0)
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from flask import Flask
+from rdflib import Namespace
+
+from whyis.commands.load_nanopub import LoadNanopub, default_checkpoint, find_input_files, read_checkpoint
+from whyis.nanopub.write_behind import PublishHandle
+
+PERSON = '''@prefix schema: <http://schema.org/> .
+<http://example.com/%s> a schema:Person .
+'''
+
+
+class Namespaces(object):
+    local = Namespace('http://example.com/')
+
+
+class RecordingManager(object):
+    prefix = Namespace('http://example.com/pub/')
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, *graphs):
+        for graph in graphs:
+            self.published.extend(str(s) for s, p, o in graph.triples((None, None, None))
+                                  if str(s).startswith('http://example.com/') and not str(s).startswith(self.prefix))
+        return PublishHandle(done=True)
+
+
+class LoadNanopubTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.app = Flask(__name__)
+        self.app.NS = Namespaces()
+        self.app.nanopub_manager = RecordingManager()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(data)
+        return path
+
+    def load(self, batch_size=1):
+        files = find_input_files(self.dir)
+        with self.app.app_context():
+            LoadNanopub().load_files(self.dir, files, 'turtle', None, 1, batch_size, None)
+
+    def test_find_input_files(self):
+        a = self.write('a.ttl', '')
+        b = self.write('sub/b.ttl', '')
+        self.write('.hidden.ttl', '')
+        self.write('.git/c.ttl', '')
+        self.assertEqual(find_input_files(self.dir), [a, b])
+        self.assertEqual(find_input_files(os.path.join(self.dir, '**', '*.ttl')), [a, b])
+        self.assertEqual(find_input_files(a), [a])
+        self.assertEqual(find_input_files(os.path.join(self.dir, 'missing')), [])
+
+    def test_default_checkpoint(self):
+        a = self.write('sub/a.ttl', '')
+        checkpoint = default_checkpoint(self.dir, [a])
+        self.assertEqual(os.path.dirname(checkpoint), self.dir)
+        # Checkpoints are not loaded as input.
+        self.assertEqual(find_input_files(self.dir), [a])
+        glob_checkpoint = default_checkpoint(os.path.join(self.dir, 'sub', '*.ttl'), [a])
+        self.assertEqual(os.path.dirname(glob_checkpoint), os.path.join(self.dir, 'sub'))
+        self.assertEqual(os.path.dirname(default_checkpoint(self.dir, [a], '/data/loaded')), '/data/loaded')
+
+    def test_load(self):
+        for name in ['a', 'b', 'c']:
+            self.write(name + '.ttl', PERSON % name)
+        self.load(batch_size=2)
+        self.assertEqual(sorted(self.app.nanopub_manager.published),
+                         ['http://example.com/a', 'http://example.com/b', 'http://example.com/c'])
+        self.assertFalse(os.path.exists(default_checkpoint(self.dir, find_input_files(self.dir))))
+
+    def test_worker_error_and_resume(self):
+        a = self.write('a.ttl', PERSON % 'a')
+        self.write('b.ttl', 'not turtle')
+        self.write('c.ttl', PERSON % 'c')
+        self.assertRaises(Exception, self.load)
+        checkpoint = default_checkpoint(self.dir, find_input_files(self.dir))
+        # Files published before the error are recorded.
+        self.assertEqual(read_checkpoint(checkpoint), set([a]))
+        self.assertEqual(self.app.nanopub_manager.published, ['http://example.com/a'])
+
+        self.write('b.ttl', PERSON % 'b')
+        self.load()
+        self.assertEqual(self.app.nanopub_manager.published,
+                         ['http://example.com/a', 'http://example.com/b', 'http://example.com/c'])
+        self.assertFalse(os.path.exists(checkpoint))
@@ -0,0 +1,87 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from whyis.database.blazegraph_bulk_loader import BlazeGraphBulkLoader, BulkLoadError
+
+DATA = b'<http://example.com/a> <http://example.com/p> <http://example.com/b> <http://example.com/g> .\n'
+
+
+class Response(object):
+
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+
+class BlazeGraphBulkLoaderTestCase(TestCase):
+
+    def setUp(self):
+        self.load_dir = tempfile.mkdtemp()
+        self.loader = BlazeGraphBulkLoader({
+            'knowledge_bulkLoadEndpoint': 'http://localhost:8080/blazegraph/dataloader',
+            'knowledge_bulkLoadNamespace': 'knowledge',
+            'knowledge_BlazeGraphProperties': '/opt/whyis/knowledge.properties',
+            'load_dir': self.load_dir,
+            'lod_prefix': 'http://example.com',
+        }, 'knowledge_')
+        self.session = mock.Mock()
+        patcher = mock.patch('whyis.database.blazegraph_bulk_loader.get_session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.load_dir)
+
+    def respond(self, status_code, text, fail=False):
+        def post(endpoint, data=None, headers=None):
+            self.posted = data.decode('utf8')
+            path = self.posted.split('fileOrDirs=')[1].strip()
+            # Blazegraph renames the files it loaded.
+            os.rename(path, path + ('.fail' if fail else '.good'))
+            return Response(status_code, text)
+        self.session.post.side_effect = post
+
+    def test_load(self):
+        self.respond(200, '<?xml version="1.0"?><data modified="1" milliseconds="12"/>')
+        stats = self.loader.load(io.BytesIO(DATA))
+        self.assertEqual(stats['statements'], 1)
+        self.assertEqual(stats['milliseconds'], 12)
+        self.assertEqual(os.path.dirname(stats['file']), self.load_dir)
+        self.assertIn('namespace=knowledge', self.posted)
+        # The staged copy is removed once it is loaded.
+        self.assertEqual(os.listdir(self.load_dir), [])
+        self.assertEqual((self.loader.files, self.loader.statements), (1, 1))
+
+    def test_file_in_load_dir(self):
+        self.respond(200, '<data modified="1" milliseconds="3"/>')
+        path = os.path.join(self.load_dir, 'chunk.nq')
+        with open(path, 'wb') as f:
+            f.write(DATA)
+        with open(path, 'rb') as f:
+            stats = self.loader.load(f)
+        # Files already in load_dir are loaded where they are.
+        self.assertEqual(stats['file'], path)
+        self.assertEqual(os.listdir(self.load_dir), [])
+
+    def test_failed_load(self):
+        self.respond(200, '<data modified="0" milliseconds="3"/>', fail=True)
+        self.assertRaises(BulkLoadError, self.loader.load, io.BytesIO(DATA))
+        # Failed files are left for inspection.
+        self.assertEqual([x.endswith('.nq.fail') for x in os.listdir(self.load_dir)], [True])
+        self.assertEqual(self.loader.files, 0)
+
+    def test_error_response(self):
+        self.respond(500, 'java.lang.RuntimeException: bad namespace')
+        with self.assertRaises(BulkLoadError) as context:
+            self.loader.load(io.BytesIO(DATA))
+        self.assertIn('bad namespace', str(context.exception))
+
+    def test_parse_response(self):
+        self.assertEqual(self.loader._parse_response('<data modified="5" milliseconds="7"/>'),
+                         {'statements': 5, 'milliseconds': 7})
+        self.assertEqual(self.loader._parse_response('<html><body><data modified="2"/></body></html>'),
+                         {'statements': 2, 'milliseconds': None})
+        self.assertEqual(self.loader._parse_response('Loaded.'), {'statements': None, 'milliseconds': None})
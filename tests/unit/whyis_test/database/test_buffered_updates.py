@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+from rdflib import ConjunctiveGraph, Graph, Literal, URIRef
+
+from whyis.database import WhyisSPARQLUpdateStore, buffered
+
+a = URIRef('http://example.com/a')
+p = URIRef('http://example.com/p')
+g = URIRef('http://example.com/g')
+
+
+class RecordingStore(WhyisSPARQLUpdateStore):
+
+    def __init__(self):
+        WhyisSPARQLUpdateStore.__init__(self, queryEndpoint='http://localhost/sparql',
+                                        update_endpoint='http://localhost/sparql')
+        self.updates = []
+
+    def _update(self, update):
+        self.updates.append(update)
+
+
+class BufferedUpdateTestCase(TestCase):
+
+    def test_coalesce(self):
+        store = RecordingStore()
+        graph = Graph(store, g)
+        with buffered(store):
+            for i in range(3):
+                graph.add((a, p, Literal(i)))
+            graph.remove((a, p, None))
+            graph.add((a, p, Literal('x')))
+            self.assertEqual(store.updates, [])
+        self.assertEqual(len(store.updates), 1)
+        update = store.updates[0]
+        self.assertEqual(update.count('INSERT DATA'), 2)
+        self.assertTrue(update.index('DELETE') < update.index('"x"'))
+
+    def test_threshold(self):
+        store = RecordingStore()
+        store.buffer_size = 2
+        with buffered(store):
+            for i in range(5):
+                store.add((a, p, Literal(i)), Graph(identifier=g))
+            self.assertEqual(len(store.updates), 2)
+        self.assertEqual(len(store.updates), 3)
+
+    def test_discard_on_error(self):
+        store = RecordingStore()
+        try:
+            with buffered(store):
+                store.add((a, p, Literal(1)), Graph(identifier=g))
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(store.updates, [])
+        store.add((a, p, Literal(1)), Graph(identifier=g))
+        self.assertEqual(len(store.updates), 1)
+
+    def test_unsupported_store(self):
+        graph = ConjunctiveGraph()
+        with buffered(graph.store):
+            graph.add((a, p, Literal(1)))
+            self.assertEqual(len(graph), 1)
@@ -0,0 +1,68 @@
+import threading
+import time
+from unittest import TestCase
+
+from rdflib import ConjunctiveGraph, Literal, Namespace
+from rdflib.plugins.stores.sparqlstore import SPARQLStore
+
+from whyis.database import configure_query_pool, query_many
+from whyis.metrics import caller, current_caller
+
+ex = Namespace('http://example.com/')
+
+
+class SlowStore(SPARQLStore):
+
+    delay = 0.2
+
+    def __init__(self):
+        SPARQLStore.__init__(self, 'http://example.com/sparql')
+        self.threads = set()
+        self.callers = set()
+
+    def query(self, query, initNs=None, initBindings=None, queryGraph=None, **kwargs):
+        if query == 'fail':
+            raise ValueError(query)
+        self.threads.add(threading.current_thread().name)
+        self.callers.add(current_caller())
+        time.sleep(self.delay)
+        return [(query, initBindings)]
+
+
+class QueryManyTestCase(TestCase):
+
+    def setUp(self):
+        configure_query_pool({'query_concurrency' : 4})
+        self.store = SlowStore()
+        self.graph = ConjunctiveGraph(self.store)
+
+    def test_results_in_order(self):
+        queries = [dict(query='q%d' % i, initBindings=dict(s=ex['s%d' % i])) for i in range(4)]
+        results = query_many(self.graph, queries)
+        self.assertEqual(results, [[('q%d' % i, dict(s=ex['s%d' % i]))] for i in range(4)])
+
+    def test_concurrent(self):
+        start = time.time()
+        query_many(self.graph, ['q'] * 4)
+        self.assertLess(time.time() - start, 3 * self.store.delay)
+        self.assertEqual(len(self.store.threads), 4)
+
+    def test_serial_without_pool(self):
+        configure_query_pool({'query_concurrency' : 1})
+        query_many(self.graph, ['q'] * 2)
+        self.assertEqual(self.store.threads, set([threading.current_thread().name]))
+
+    def test_serial_in_memory(self):
+        graph = ConjunctiveGraph()
+        graph.add((ex.s, ex.p, Literal(1)))
+        results = query_many(graph, ['select ?o where { ?s ?p ?o }'] * 2)
+        self.assertEqual([[row[0] for row in rows] for rows in results], [[Literal(1)], [Literal(1)]])
+
+    def test_caller_is_kept(self):
+        with caller('view:test'):
+            query_many(self.graph, ['q'] * 2)
+        self.assertEqual(self.store.callers, set(['view:test']))
+
+    def test_error_is_raised(self):
+        with self.assertRaises(ValueError):
+            query_many(self.graph, ['q', 'fail'])
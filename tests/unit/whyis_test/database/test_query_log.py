@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+from whyis.database import QueryLog
+from whyis.database.query_log import fingerprint
+
+
+class FingerprintTestCase(TestCase):
+
+    def test_strips_terms(self):
+        a = fingerprint('''PREFIX dc: <http://purl.org/dc/terms/>
+select ?label where { <http://example.com/a> dc:title ?label . FILTER(?label != "a#b"@en) } limit 10 # comment''')
+        b = fingerprint('''select ?label where {
+    <http://example.com/b> dc:title ?label .
+    FILTER(?label != 'c')
+} limit 5''')
+        self.assertEqual(a, b)
+        self.assertEqual(a, 'select ?label where { ? dc:title ?label . FILTER(?label != ?) } limit ?')
+
+    def test_values(self):
+        a = fingerprint('select * where { ?s ?p ?o } VALUES (?s ?p) { (<a:a> <a:b>) (<a:c> "1"^^<a:int>) }')
+        b = fingerprint('select * where { ?s ?p ?o } VALUES (?s ?p) { (<a:d> 2) }')
+        self.assertEqual(a, b)
+        self.assertEqual(fingerprint('select * { VALUES ?s { <a:a> <a:b> } }'),
+                         fingerprint('select * { VALUES ?s { <a:c> } }'))
+        self.assertEqual(fingerprint('select * { FILTER(?s IN (<a:a>, <a:b>)) }'),
+                         fingerprint('select * { FILTER(?s IN (<a:c>)) }'))
+
+    def test_keeps_variables(self):
+        self.assertNotEqual(fingerprint('select ?x1 where { ?x1 ?p ?o }'),
+                            fingerprint('select ?x2 where { ?x2 ?p ?o }'))
+
+
+class QueryLogTestCase(TestCase):
+
+    def test_aggregate(self):
+        log = QueryLog()
+        for i in range(10):
+            log.record('select * { <a:%d> ?p ?o }' % i, 0.1 * (i + 1), 'view:a.html')
+        log.record('ask { ?s ?p ?o }', 5, 'agent:b')
+        top = log.top()
+        self.assertEqual(len(top), 2)
+        self.assertEqual(top[0]['count'], 10)
+        self.assertAlmostEqual(top[0]['total'], 5.5)
+        self.assertAlmostEqual(top[0]['p50'], 0.6)
+        self.assertEqual(top[0]['sample'], 'select * { <a:9> ?p ?o }')
+        self.assertEqual(log.top(sort='max')[0]['caller'], 'agent:b')
+
+    def test_threshold(self):
+        log = QueryLog(threshold=1)
+        log.record('ask {}', 0.5)
+        self.assertEqual(log.top(), [])
@@ -0,0 +1,44 @@
+from unittest import TestCase
+
+import requests
+
+from whyis.database.replicas import ReplicaPool
+
+
+class ReplicaPoolTestCase(TestCase):
+
+    def test_round_robin(self):
+        pool = ReplicaPool(['a', 'b'])
+        chosen = [pool.choose() for i in range(4)]
+        self.assertEqual(chosen, ['a', 'b', 'a', 'b'])
+
+    def test_least_outstanding(self):
+        pool = ReplicaPool(['a', 'b'], balancing='least_outstanding')
+        self.assertEqual(pool.choose(), 'a')
+        self.assertEqual(pool.choose(), 'b')
+        pool.release('b')
+        self.assertEqual(pool.choose(), 'b')
+
+    def test_eject(self):
+        pool = ReplicaPool(['a', 'b'], max_failures=2, eject_seconds=0)
+        for i in range(2):
+            pool.choose(exclude=['b'])
+            pool.release('a', requests.ConnectionError())
+        self.assertEqual(set(pool.ejected), set(["a"]))
+        # Ejected endpoints come back after eject_seconds, one failure from ejection.
+        self.assertEqual(pool.healthy(), ['a', 'b'])
+        self.assertEqual(pool.failures['a'], 1)
+
+    def test_bad_queries_do_not_eject(self):
+        pool = ReplicaPool(['a'], max_failures=1)
+        response = requests.Response()
+        response.status_code = 400
+        pool.choose()
+        pool.release('a', requests.HTTPError(response=response))
+        self.assertEqual(pool.healthy(), ['a'])
+
+    def test_all_ejected(self):
+        pool = ReplicaPool(['a'], max_failures=1)
+        pool.choose()
+        pool.release('a', requests.Timeout())
+        self.assertEqual(pool.choose(), None)
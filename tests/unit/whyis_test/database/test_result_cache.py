@@ -0,0 +1,42 @@
+from unittest import TestCase
+
+from rdflib import Literal, Variable
+from rdflib.query import Result
+
+from whyis.database import SPARQLResultCache
+
+
+def select_result(value):
+    result = Result('SELECT')
+    result.vars = [Variable('x')]
+    result.bindings = [{Variable('x'): Literal(value)}]
+    return result
+
+
+class SPARQLResultCacheTestCase(TestCase):
+
+    def test_hit(self):
+        cache = SPARQLResultCache('test')
+        cache.set('select ?x {}', select_result(1))
+        result = cache.get('select ?x {}')
+        self.assertEqual(list(result), [(Literal(1),)])
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_copies(self):
+        cache = SPARQLResultCache('test')
+        cache.set('select ?x {}', select_result(1))
+        cache.get('select ?x {}').bindings.append({})
+        self.assertEqual(len(cache.get('select ?x {}').bindings), 1)
+
+    def test_invalidate(self):
+        cache = SPARQLResultCache('test')
+        cache.set('select ?x {}', select_result(1))
+        cache.invalidate()
+        self.assertIsNone(cache.get('select ?x {}'))
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_ttl(self):
+        cache = SPARQLResultCache('test', ttl=0)
+        cache.set('select ?x {}', select_result(1))
+        self.assertIsNone(cache.get('select ?x {}', ttl=-1))
+        self.assertIsNotNone(cache.get('select ?x {}', ttl=60))
@@ -0,0 +1,71 @@
+import threading
+import time
+from unittest import TestCase
+
+from rdflib import Literal, Variable
+from rdflib.query import Result
+
+from whyis.database import SingleFlight
+
+
+def select_result(value):
+    result = Result('SELECT')
+    result.vars = [Variable('x')]
+    result.bindings = [{Variable('x'): Literal(value)}]
+    return result
+
+
+class SingleFlightTestCase(TestCase):
+
+    def setUp(self):
+        self.flight = SingleFlight('test')
+        self.calls = []
+        self.results = []
+
+    def slow_query(self, value=1, delay=0.2):
+        def fn():
+            self.calls.append(value)
+            time.sleep(delay)
+            return select_result(value)
+        return fn
+
+    def run_concurrently(self, queries):
+        errors = []
+
+        def run(query, fn):
+            try:
+                self.results.append(list(self.flight.run(query, None, fn)))
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=run, args=q) for q in queries]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_identical_queries_run_once(self):
+        self.run_concurrently([('select ?x {}', self.slow_query())] * 5)
+        self.assertEqual(self.calls, [1])
+        self.assertEqual(self.results, [[(Literal(1),)]] * 5)
+
+    def test_different_queries_run(self):
+        self.run_concurrently([('select ?x {}', self.slow_query(1)),
+                               ('select ?x { ?x ?p ?o }', self.slow_query(2))])
+        self.assertEqual(sorted(self.calls), [1, 2])
+
+    def test_sequential_queries_run(self):
+        self.flight.run('select ?x {}', None, self.slow_query(delay=0))
+        self.flight.run('select ?x {}', None, self.slow_query(delay=0))
+        self.assertEqual(self.calls, [1, 1])
+
+    def test_errors_are_shared(self):
+        def fail():
+            self.calls.append(None)
+            time.sleep(0.2)
+            raise ValueError()
+        errors = self.run_concurrently([('select ?x {}', fail)] * 3)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(all(isinstance(e, ValueError) for e in errors))
@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import TestCase
+
+from rdflib import BNode, ConjunctiveGraph, Graph, Literal, Namespace, URIRef
+
+from whyis.database import SQLiteStore
+
+ex = Namespace('http://example.com/')
+
+
+class SQLiteStoreTestCase(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'knowledge.sqlite')
+        self.store = SQLiteStore()
+        self.store.open(self.path, create=True)
+        self.graph = ConjunctiveGraph(self.store)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.dir)
+
+    def test_add_and_match(self):
+        g1 = Graph(self.store, ex.g1)
+        g1.add((ex.a, ex.p, Literal('a', lang='en')))
+        g1.add((ex.a, ex.p, Literal(1)))
+        Graph(self.store, ex.g2).add((ex.a, ex.p, Literal(1)))
+        Graph(self.store, ex.g2).add((ex.b, ex.q, BNode('x')))
+        self.assertEqual(len(self.graph), 3)
+        self.assertEqual(len(g1), 2)
+        self.assertEqual(set(self.graph.objects(ex.a, ex.p)), set([Literal('a', lang='en'), Literal(1)]))
+        self.assertEqual(list(self.graph.subjects(ex.q, BNode('x'))), [ex.b])
+        self.assertEqual(set(q[3].identifier for q in self.graph.quads((ex.a, ex.p, Literal(1)))),
+                         set([ex.g1, ex.g2]))
+        self.assertEqual(list(self.graph.triples((ex.c, None, None))), [])
+
+    def test_remove(self):
+        g1 = Graph(self.store, ex.g1)
+        g1.add((ex.a, ex.p, ex.b))
+        Graph(self.store, ex.g2).add((ex.a, ex.p, ex.b))
+        g1.remove((ex.a, None, None))
+        self.assertEqual([c.identifier for c in self.graph.contexts((ex.a, ex.p, ex.b))], [ex.g2])
+        self.graph.remove((None, None, None))
+        self.assertEqual(len(self.graph), 0)
+
+    def test_sparql(self):
+        Graph(self.store, ex.g1).add((ex.a, ex.p, ex.b))
+        self.graph.update('DROP SILENT GRAPH <http://example.com/g2>')
+        rows = list(self.graph.query('select ?g ?s where { graph ?g { ?s <http://example.com/p> ?o } }'))
+        self.assertEqual(rows, [(ex.g1, ex.a)])
+        self.graph.update('DROP GRAPH <http://example.com/g1>')
+        self.assertEqual(len(self.graph), 0)
+
+    def test_load_and_reopen(self):
+        data = b''.join(b'<http://example.com/s%d> <http://example.com/p> "%d" <http://example.com/g> .\n' % (i, i)
+                        for i in range(1000))
+        self.store.load(BytesIO(data))
+        self.store.close()
+        store = SQLiteStore()
+        store.open(self.path)
+        self.assertEqual(len(ConjunctiveGraph(store)), 1000)
+        self.assertEqual(len(Graph(store, ex.g)), 1000)
+        store.close()
+
+    def test_namespaces(self):
+        self.graph.bind('ex', ex)
+        self.assertEqual(self.store.namespace('ex'), URIRef(ex))
+        self.assertEqual(self.store.prefix(ex), 'ex')
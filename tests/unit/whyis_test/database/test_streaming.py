@@ -0,0 +1,40 @@
+from io import BytesIO
+from unittest import TestCase
+
+from rdflib import BNode, ConjunctiveGraph, Literal, URIRef
+
+from whyis.database import stream_query
+from whyis.database.streaming import _iter_json_rows, _iter_ntriples
+
+
+class StreamingTestCase(TestCase):
+
+    def test_json_rows(self):
+        data = b'''{"head": {"vars": ["x", "y"]}, "results": {"bindings": [
+            {"x": {"type": "uri", "value": "http://example.com/a"},
+             "y": {"type": "literal", "value": "a", "xml:lang": "en"}},
+            {"x": {"type": "uri", "value": "http://example.com/b"}}
+        ]}}'''
+        rows = list(_iter_json_rows(BytesIO(data)))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0].asdict(), {'x': URIRef('http://example.com/a'), 'y': Literal('a', lang='en')})
+        self.assertEqual(rows[1].y, None)
+
+    def test_json_ask(self):
+        data = b'{"head": {}, "boolean": true}'
+        self.assertEqual(list(_iter_json_rows(BytesIO(data))), [True])
+
+    def test_ntriples(self):
+        lines = [b'<http://example.com/a> <http://example.com/p> "b" .',
+                 b'',
+                 b'_:b1 <http://example.com/p> _:b1 .']
+        triples = list(_iter_ntriples(lines))
+        self.assertEqual(triples[0], (URIRef('http://example.com/a'), URIRef('http://example.com/p'), Literal('b')))
+        self.assertTrue(isinstance(triples[1][0], BNode))
+        self.assertEqual(triples[1][0], triples[1][2])
+
+    def test_fallback(self):
+        graph = ConjunctiveGraph()
+        graph.add((URIRef('http://example.com/a'), URIRef('http://example.com/p'), Literal('b')))
+        rows = list(stream_query(graph, 'select ?s where { ?s ?p ?o }'))
+        self.assertEqual(rows[0].s, URIRef('http://example.com/a'))
@@ -0,0 +1,74 @@
+import threading
+from unittest import TestCase
+
+from rdflib import ConjunctiveGraph, Literal, Namespace, URIRef
+
+from whyis.database import WhyisSPARQLUpdateStore
+from whyis.database.thread_local import ThreadSafeSPARQLProcessor
+
+ex = Namespace('http://example.com/')
+
+
+def in_threads(fn, count=8):
+    errors = []
+
+    def run(i):
+        try:
+            fn(i)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+class ThreadLocalStateTestCase(TestCase):
+
+    def setUp(self):
+        self.store = WhyisSPARQLUpdateStore(queryEndpoint='http://localhost:1/sparql',
+                                            update_endpoint='http://localhost:1/sparql',
+                                            method='POST', returnFormat='json')
+
+    def test_bindings_per_thread(self):
+        self.store.bind('ex', ex)
+        seen = {}
+
+        def bind(i):
+            self.store.nsBindings = {}
+            self.store.bind('t%d' % i, URIRef('http://example.com/%d/' % i))
+            seen[i] = dict(self.store.nsBindings)
+        self.assertEqual(in_threads(bind), [])
+        for i in range(8):
+            self.assertEqual(seen[i], {'t%d' % i : URIRef('http://example.com/%d/' % i)})
+        self.assertEqual(self.store.namespace('ex'), ex)
+
+    def test_edits_per_thread(self):
+        self.store._transaction().append('INSERT DATA { <a> <b> <c> }')
+        seen = {}
+
+        def edit(i):
+            seen[i] = self.store._edits
+        self.assertEqual(in_threads(edit), [])
+        self.assertEqual(set(seen.values()), set([None]))
+        self.assertEqual(self.store._edits, ['INSERT DATA { <a> <b> <c> }'])
+
+
+class ThreadSafeProcessorTestCase(TestCase):
+
+    def test_concurrent_queries(self):
+        graph = ConjunctiveGraph()
+        for i in range(10):
+            graph.add((ex['s%d' % i], ex.p, Literal(i)))
+        processor = ThreadSafeSPARQLProcessor(graph)
+        results = {}
+
+        def query(i):
+            for j in range(5):
+                q = 'select ?o where { ?s <http://example.com/p> ?o filter(?o > %d) }' % (i * 10 + j)
+                results[(i, j)] = len(list(processor.query(q)['bindings']))
+        self.assertEqual(in_threads(query), [])
+        self.assertEqual(results[(0, 0)], 9)
+        self.assertEqual(results[(0, 4)], 5)
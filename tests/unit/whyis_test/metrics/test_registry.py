@@ -0,0 +1,65 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from whyis.metrics import MetricsRegistry, caller, current_caller, timed
+
+
+class MetricsRegistryTestCase(TestCase):
+
+    def test_exposition(self):
+        registry = MetricsRegistry()
+        seconds = registry.histogram('test_seconds', 'Test timings.', ('caller',), buckets=(0.1, 1))
+        errors = registry.counter('test_errors', 'Test errors.', ('caller',))
+        seconds.observe(0.05, caller='a')
+        seconds.observe(0.5, caller='a')
+        errors.inc(caller='a "b"')
+        text = registry.exposition()
+        self.assertIn('# TYPE test_seconds histogram', text)
+        self.assertIn('test_seconds_bucket{caller="a",le="0.1"} 1', text)
+        self.assertIn('test_seconds_bucket{caller="a",le="+Inf"} 2', text)
+        self.assertIn('test_seconds_count{caller="a"} 2', text)
+        self.assertIn('test_errors_total{caller="a \\"b\\""} 1', text)
+
+    def test_gauges(self):
+        registry = MetricsRegistry()
+        registry.gauge_callback('test_cache', 'Test cache.', lambda: [({'stat': 'hits'}, 3), ({'stat': 'rate'}, None)])
+        text = registry.exposition()
+        self.assertIn('test_cache{stat="hits"} 3', text)
+        self.assertNotIn('rate', text)
+
+    def test_snapshots(self):
+        directory = tempfile.mkdtemp()
+        try:
+            registry = MetricsRegistry()
+            registry.configure(directory)
+            errors = registry.counter('test_errors', 'Test errors.')
+            errors.inc(2)
+            with open(os.path.join(directory, 'worker.json'), 'w') as f:
+                json.dump({'test_errors': [[[], 3]]}, f)
+            self.assertIn('test_errors_total 5', registry.exposition())
+            registry.write_snapshot()
+            self.assertIn('test_errors_total 5', registry.exposition())
+        finally:
+            shutil.rmtree(directory)
+
+    def test_caller(self):
+        self.assertEqual(current_caller(), 'unknown')
+        with caller('view:a.html'):
+            with caller('filter:query'):
+                self.assertEqual(current_caller(), 'view:a.html>filter:query')
+        self.assertEqual(current_caller(), 'unknown')
+
+    def test_timed_errors(self):
+        registry = MetricsRegistry()
+        seconds = registry.histogram('test_seconds', 'Test timings.')
+        errors = registry.counter('test_errors', 'Test errors.')
+        try:
+            with timed(seconds, errors):
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertIn('test_errors_total 1', registry.exposition())
+        self.assertIn('test_seconds_count 1', registry.exposition())
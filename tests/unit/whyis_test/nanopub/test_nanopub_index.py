@@ -0,0 +1,148 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+from rdflib import Namespace, RDF, URIRef
+
+from whyis.database import engine_from_config
+from whyis.namespace import NS
+from whyis.nanopub import NanopublicationManager
+
+ex = Namespace('http://example.com/')
+
+
+class SetRedis(object):
+    '''The Redis commands used by the index of current nanopublications.'''
+
+    def __init__(self):
+        self.data = {}
+
+    def sadd(self, key, *values):
+        self.data.setdefault(key, set()).update(x.encode('utf8') for x in values)
+
+    def srem(self, key, *values):
+        self.data.setdefault(key, set()).difference_update(x.encode('utf8') for x in values)
+
+    def sismember(self, key, value):
+        return value.encode('utf8') in self.data.get(key, set())
+
+    def sdiffstore(self, dest, key, *keys):
+        values = set(self.data.get(key, set()))
+        for other in keys:
+            values.difference_update(self.data.get(other, set()))
+        self.data[dest] = values
+        return len(values)
+
+    def scard(self, key):
+        return len(self.data.get(key, set()))
+
+    def set(self, key, value, **kwargs):
+        self.data[key] = value
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    def pipeline(self):
+        return Pipeline(self)
+
+
+class Pipeline(object):
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def call(*args):
+            self.calls.append((name, args))
+        return call
+
+    def execute(self):
+        return [getattr(self.redis, name)(*args) for name, args in self.calls]
+
+
+class App(object):
+
+    NS = NS
+
+    def __init__(self):
+        self.config = {'nanopub_index_redis': True}
+        self.redis = SetRedis()
+        self.db = engine_from_config(self.config, 'knowledge_')
+        self.nanopub_manager = NanopublicationManager(self.db.store, Namespace('http://example.com/pub/'), self,
+                                                      update_listener=lambda uri: None)
+
+
+class NanopublicationIndexTestCase(TestCase):
+
+    def setUp(self):
+        self.app = App()
+        self.manager = self.app.nanopub_manager
+
+    def publish(self, name):
+        nanopub = self.manager.new()
+        nanopub.assertion.add((ex[name], RDF.type, ex.Thing))
+        self.manager.publish(nanopub)
+        return nanopub.identifier
+
+    def test_add_remove(self):
+        first = self.publish('a')
+        second = self.publish('b')
+        self.assertTrue(self.app.redis.sismember(self.manager._index_key, str(first)))
+        self.manager.retire(first)
+        self.assertFalse(self.app.redis.sismember(self.manager._index_key, str(first)))
+        self.assertTrue(self.app.redis.sismember(self.manager._index_key, str(second)))
+
+    def test_is_current_before_ready(self):
+        nanopub = self.publish('a')
+        self.app.redis.delete(self.manager._index_key)
+        # Until the index is ready, the store is asked.
+        self.assertTrue(self.manager.is_current(nanopub))
+        self.app.redis.set(self.manager._index_ready_key, 1)
+        self.assertFalse(self.manager.is_current(nanopub))
+
+    def test_rebuild(self):
+        first = self.publish('a')
+        second = self.publish('b')
+        self.app.redis.delete(self.manager._index_key)
+        self.assertEqual(self.manager.rebuild_index(), 2)
+        self.assertTrue(self.manager.is_current(first))
+        self.assertTrue(self.manager.is_current(second))
+        self.assertFalse(self.manager.is_current(URIRef('http://example.com/pub/missing')))
+
+    def test_rebuild_during_changes(self):
+        first = self.publish('a')
+        self.publish('b')
+        subjects = self.manager.db.subjects
+
+        def change_after_read(*args):
+            nanopubs = list(subjects(*args))
+            del self.manager.db.subjects
+            self.manager.retire(first)
+            self.changed = self.publish('c')
+            return nanopubs
+        self.manager.db.subjects = change_after_read
+        self.assertEqual(self.manager.rebuild_index(), 2)
+        self.assertFalse(self.manager.is_current(first))
+        self.assertTrue(self.manager.is_current(self.changed))
+        self.assertFalse(self.app.redis.exists(self.manager._index_rebuilding_key))
+        self.assertFalse(self.app.redis.exists(self.manager._index_retired_key))
+
+    def test_restore_archive(self):
+        archive_path = tempfile.mkdtemp()
+        self.app.config['nanopub_archive_path'] = archive_path
+        try:
+            nanopub = self.publish('a')
+            self.manager.rebuild_index()
+            self.app.db.update('DROP ALL')
+            self.app.redis.delete(self.manager._index_key)
+            self.assertFalse(self.manager.is_current(nanopub))
+            self.assertEqual(self.manager.restore_archive(), 1)
+            self.assertTrue(self.manager.is_current(nanopub))
+            self.assertTrue(self.app.redis.exists(self.manager._index_ready_key))
+        finally:
+            shutil.rmtree(archive_path)
@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+
+from rdflib import *
+
+from whyis.namespace import *
+from whyis.test.unit_test_case import UnitTestCase
+from tests.api.api_test_data import PERSON_INSTANCE_TRIG
+
+
+class NanopublicationManagerTestCase(UnitTestCase):
+
+    def publish_person(self):
+        g = ConjunctiveGraph()
+        g.parse(data=PERSON_INSTANCE_TRIG, format="trig")
+        nanopub = list(self.app.nanopub_manager.prepare(g))[0]
+        self.app.nanopub_manager.publish(nanopub)
+        return nanopub
+
+    def publish_derived(self, source):
+        nanopub = self.app.nanopub_manager.new()
+        nanopub.assertion.add((URIRef("http://example.com/janedoe"), RDF.type, URIRef("http://schema.org/Agent")))
+        nanopub.provenance.add((nanopub.assertion.identifier, prov.wasDerivedFrom, source.assertion.identifier))
+        self.app.nanopub_manager.publish(nanopub)
+        return nanopub
+
+    def test_bulk_retire(self):
+        first = self.publish_person()
+        second = self.publish_person()
+        derived = [self.publish_derived(first) for i in range(3)]
+
+        self.app.nanopub_manager.retire(first.identifier, *[x.identifier for x in derived[:1]])
+
+        self.assertFalse(self.app.nanopub_manager.is_current(first.identifier))
+        for nanopub in derived:
+            self.assertFalse(self.app.nanopub_manager.is_current(nanopub.identifier))
+            self.assertEquals(len(self.app.db.get_context(nanopub.assertion.identifier)), 0)
+        self.assertTrue(self.app.nanopub_manager.is_current(second.identifier))
+        self.assertEquals(len(self.app.db.get_context(second.assertion.identifier)), 6)
+
+    def test_retire_nothing(self):
+        nanopub = self.publish_person()
+        self.app.nanopub_manager.retire()
+        self.assertTrue(self.app.nanopub_manager.is_current(nanopub.identifier))
+
+    def test_batched_revisions(self):
+        first = self.publish_person()
+        second = self.publish_person()
+
+        revisions = []
+        for old in [first, second]:
+            nanopub = self.app.nanopub_manager.new()
+            nanopub.assertion.add((URIRef("http://example.com/janedoe"), RDF.type, URIRef("http://schema.org/Agent")))
+            nanopub.pubinfo.add((nanopub.assertion.identifier, prov.wasRevisionOf, old.assertion.identifier))
+            revisions.append(nanopub)
+        unrelated = self.app.nanopub_manager.new()
+        unrelated.assertion.add((URIRef("http://example.com/johndoe"), RDF.type, URIRef("http://schema.org/Person")))
+        self.app.nanopub_manager.publish(*(revisions + [unrelated]))
+
+        self.assertFalse(self.app.nanopub_manager.is_current(first.identifier))
+        self.assertFalse(self.app.nanopub_manager.is_current(second.identifier))
+        for nanopub in revisions:
+            self.assertTrue(self.app.nanopub_manager.is_current(nanopub.identifier))
+            self.assertIsNotNone(nanopub.pubinfo.value(nanopub.assertion.identifier, dc.modified))
+            self.assertIsNone(nanopub.pubinfo.value(nanopub.assertion.identifier, dc.created))
+        self.assertIsNotNone(unrelated.pubinfo.value(unrelated.assertion.identifier, dc.created))
+        self.assertIsNone(unrelated.pubinfo.value(unrelated.assertion.identifier, dc.modified))
+
+    def test_chunked_publish(self):
+        self.app.config['publish_chunk_quads'] = 5
+        try:
+            nanopubs = []
+            for i in range(10):
+                nanopub = self.app.nanopub_manager.new()
+                nanopub.assertion.add((URIRef("http://example.com/person/%s" % i), RDF.type, URIRef("http://schema.org/Person")))
+                nanopubs.append(nanopub)
+            self.app.nanopub_manager.publish(*nanopubs)
+        finally:
+            del self.app.config['publish_chunk_quads']
+
+        for nanopub in nanopubs:
+            self.assertTrue(self.app.nanopub_manager.is_current(nanopub.identifier))
+            self.assertEquals(len(self.app.db.get_context(nanopub.assertion.identifier)), 1)
+
+    def test_get_cached(self):
+        nanopub = self.publish_person()
+        first = self.app.nanopub_manager.get(nanopub.identifier)
+        hits = self.app.nanopub_manager.cache_stats()['hits']
+        second = self.app.nanopub_manager.get(nanopub.identifier)
+        self.assertEquals(self.app.nanopub_manager.cache_stats()['hits'], hits + 1)
+        self.assertEquals(len(first), len(second))
+
+        self.app.nanopub_manager.retire(nanopub.identifier)
+        self.assertEquals(len(self.app.nanopub_manager.get(nanopub.identifier)), 0)
+
+    def test_cache_expires(self):
+        nanopub = self.publish_person()
+        self.app.nanopub_manager.get(nanopub.identifier)
+        # Retired by another process, which cannot clear this cache.
+        self.app.db.update('DROP GRAPH %s' % nanopub.assertion.identifier.n3())
+        self.assertEquals(len(self.app.nanopub_manager.get(nanopub.identifier).assertion), 6)
+        self.app.nanopub_manager.local_ttl = -1
+        try:
+            self.assertEquals(len(self.app.nanopub_manager.get(nanopub.identifier).assertion), 0)
+        finally:
+            self.app.nanopub_manager.local_ttl = 60
+
+    def test_local_archive(self):
+        archive_path = tempfile.mkdtemp()
+        self.app.config['nanopub_archive_path'] = archive_path
+        try:
+            nanopub = self.publish_person()
+            path = self.app.nanopub_manager.get_path(nanopub.identifier)
+            self.assertTrue(os.path.exists(path))
+
+            self.app.db.update('DROP GRAPH %s' % nanopub.assertion.identifier.n3())
+            self.app.nanopub_manager.cache.clear()
+            fetched = self.app.nanopub_manager.get(nanopub.identifier)
+            self.assertEquals(len(fetched.assertion), 6)
+
+            self.app.nanopub_manager.retire(nanopub.identifier)
+            self.assertFalse(os.path.exists(path))
+
+            nanopub = self.publish_person()
+            self.app.db.update('DROP ALL')
+            self.assertEquals(self.app.nanopub_manager.restore_archive(), 1)
+            self.assertTrue(self.app.nanopub_manager.is_current(nanopub.identifier))
+        finally:
+            del self.app.config['nanopub_archive_path']
+            shutil.rmtree(archive_path)
+
+    def test_write_behind(self):
+        spool_dir = tempfile.mkdtemp()
+        self.app.config['nanopub_write_behind'] = True
+        self.app.config['nanopub_spool_dir'] = spool_dir
+        try:
+            nanopubs = []
+            handles = []
+            for i in range(5):
+                nanopub = self.app.nanopub_manager.new()
+                nanopub.assertion.add((URIRef("http://example.com/person/%s" % i), RDF.type, URIRef("http://schema.org/Person")))
+                nanopubs.append(nanopub)
+                handles.append(self.app.nanopub_manager.publish(nanopub))
+            for handle in handles:
+                self.assertTrue(handle.wait(10))
+            for nanopub in nanopubs:
+                self.assertTrue(self.app.nanopub_manager.is_current(nanopub.identifier))
+            self.assertEquals(os.listdir(spool_dir), [])
+        finally:
+            self.app.nanopub_manager.write_behind.close()
+            self.app.nanopub_manager._write_behind = None
+            del self.app.config['nanopub_write_behind']
+            del self.app.config['nanopub_spool_dir']
+            shutil.rmtree(spool_dir)
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from rdflib import ConjunctiveGraph, Namespace, RDF
+
+from whyis.nanopub import Nanopublication
+from whyis.nanopub.write_behind import WriteBehindQueue
+
+ex = Namespace('http://example.com/')
+pub = Namespace('http://example.com/pub/')
+
+
+class WriteBehindQueueTestCase(TestCase):
+
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.published = []
+
+    def tearDown(self):
+        shutil.rmtree(self.spool_dir)
+
+    def publish(self, *nanopubs):
+        if any((None, RDF.type, ex.Poison) in x for x in nanopubs):
+            raise ValueError('poison')
+        self.published.extend(x.identifier for x in nanopubs)
+
+    def nanopub(self, name, type=ex.Thing):
+        nanopub = Nanopublication(store=ConjunctiveGraph().store, identifier=pub[name])
+        nanopub.nanopub_resource
+        nanopub.assertion.add((ex[name], RDF.type, type))
+        return nanopub.store
+
+    def test_poison_batch(self):
+        queue = WriteBehindQueue(self.publish, self.spool_dir, window=1)
+        handles = [queue.submit([self.nanopub('a')]),
+                   queue.submit([self.nanopub('b', ex.Poison)]),
+                   queue.submit([self.nanopub('c')])]
+        queue.close()
+        self.assertTrue(handles[0].wait())
+        self.assertRaises(ValueError, handles[1].wait)
+        self.assertTrue(handles[2].wait())
+        self.assertEqual(sorted(self.published), [pub.a, pub.c])
+        # Only the poisoned nanopub is left to be loaded by hand.
+        self.assertEqual([x.endswith('.nq.failed') for x in os.listdir(self.spool_dir)], [True])
+
+    def test_recover(self):
+        queue = WriteBehindQueue(self.publish, self.spool_dir)
+        queue._start = lambda: None
+        queue.submit([self.nanopub('a')])
+        queue.submit([self.nanopub('b')])
+        # Left behind by a process that died, and recovered by a new one.
+        for item in list(queue._queue.queue):
+            item.file.close()
+        queue = WriteBehindQueue(self.publish, self.spool_dir)
+        queue._start()
+        queue.close()
+        self.assertEqual(sorted(self.published), [pub.a, pub.b])
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_recover_published_by_another_worker(self):
+        queue = WriteBehindQueue(self.publish, self.spool_dir)
+        path = os.path.join(self.spool_dir, 'gone.nq')
+        open(path, 'w').close()
+        claim = queue._claim
+
+        def published_first(path):
+            os.remove(path)
+            return claim(path)
+        queue._claim = published_first
+        queue._recover()
+        self.assertTrue(queue._queue.empty())
+
+    def test_stale_tmp(self):
+        stale = os.path.join(self.spool_dir, 'stale.tmp')
+        fresh = os.path.join(self.spool_dir, 'fresh.tmp')
+        open(stale, 'w').close()
+        open(fresh, 'w').close()
+        old = time.time() - WriteBehindQueue.stale_tmp_age - 1
+        os.utime(stale, (old, old))
+        WriteBehindQueue(self.publish, self.spool_dir)._recover()
+        self.assertEqual(os.listdir(self.spool_dir), ['fresh.tmp'])
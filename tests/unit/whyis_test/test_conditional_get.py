@@ -0,0 +1,104 @@
+from unittest import TestCase
+
+from flask import Flask
+from flask_login import LoginManager
+from rdflib import Namespace, RDF
+
+from whyis.conditional_get import conditional_response, knowledge_version, nanopub_version
+from whyis.database import engine_from_config
+from whyis.namespace import NS
+from whyis.nanopub import NanopublicationManager
+
+ex = Namespace('http://example.com/')
+
+
+class CountingRedis(object):
+
+    def __init__(self):
+        self.data = {}
+
+    def incr(self, key):
+        self.data[key] = self.data.get(key, 0) + 1
+        return self.data[key]
+
+    def get(self, key):
+        if key in self.data:
+            return str(self.data[key]).encode('utf8')
+
+
+class ConditionalGetTestCase(TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        LoginManager(self.app)
+        self.app.NS = NS
+        self.app.redis = CountingRedis()
+        self.app.db = engine_from_config({}, 'knowledge_')
+        self.app.nanopub_manager = self.manager(self.app)
+        self.rendered = 0
+
+    def manager(self, app):
+        return NanopublicationManager(app.db.store, Namespace('http://example.com/pub/'), app,
+                                      update_listener=lambda uri: None)
+
+    def publish(self, name):
+        nanopub = self.app.nanopub_manager.new()
+        nanopub.assertion.add((ex[name], RDF.type, ex.Thing))
+        self.app.nanopub_manager.publish(nanopub)
+        return nanopub.identifier
+
+    def render(self):
+        self.rendered += 1
+        return 'page'
+
+    def get(self, version, path='/about?view=latest', **headers):
+        with self.app.test_request_context(path, headers=headers):
+            return conditional_response(version, self.render)
+
+    def test_knowledge_version(self):
+        first = knowledge_version(self.app)
+        nanopub = self.publish('a')
+        second = knowledge_version(self.app)
+        self.assertNotEqual(first, second)
+        self.app.nanopub_manager.retire(nanopub)
+        self.assertNotIn(knowledge_version(self.app), [first, second])
+        # Other processes count their own changes.
+        self.assertNotEqual(self.manager(self.app).version(), knowledge_version(self.app))
+
+    def test_shared_version(self):
+        self.app.config['conditional_get_redis'] = True
+        other = self.manager(self.app)
+        self.assertEqual(other.version(), knowledge_version(self.app))
+        self.publish('a')
+        self.assertEqual(other.version(), knowledge_version(self.app))
+        self.assertEqual(self.app.redis.data[other._version_key], 1)
+
+    def test_nanopub_version(self):
+        nanopub = self.publish('a')
+        self.assertEqual(nanopub_version(nanopub), str(nanopub))
+
+    def test_validators(self):
+        response = self.get('v1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.last_modified)
+        self.assertTrue(response.cache_control.must_revalidate)
+        etag, weak = response.get_etag()
+        self.assertEqual(self.get('v1', **{'If-None-Match': '"%s"' % etag}).status_code, 304)
+        self.assertEqual(self.get('v2', **{'If-None-Match': '"%s"' % etag}).status_code, 200)
+        self.assertEqual(self.get('v1', '/about?view=labels', **{'If-None-Match': '"%s"' % etag}).status_code, 200)
+        self.assertEqual(self.rendered, 3)
+
+    def test_unrelated_publish(self):
+        etag, weak = self.get(knowledge_version(self.app)).get_etag()
+        # The latest nanopublications are not about the home page.
+        self.publish('a')
+        response = self.get(knowledge_version(self.app), **{'If-None-Match': '"%s"' % etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.rendered, 2)
+
+    def test_if_modified_since(self):
+        self.publish('a')
+        since = 'Fri, 01 Jan 2100 00:00:00 GMT'
+        # Nanopublications may be dated before the client's copy.
+        response = self.get(knowledge_version(self.app), **{'If-Modified-Since': since})
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,88 @@
+from unittest import TestCase
+
+from rdflib import BNode, ConjunctiveGraph, Literal, Namespace
+from rdflib.namespace import RDF, RDFS
+
+from whyis.description_cache import DescriptionCache, _dump_triples, _load_triples, describe
+from whyis.namespace import NS
+
+ex = Namespace('http://example.com/')
+
+
+class DeletingRedis(object):
+
+    def __init__(self):
+        self.deletes = []
+
+    def delete(self, *keys):
+        self.deletes.append(keys)
+
+
+class DescriptionCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.graph = ConjunctiveGraph()
+        assertion = self.graph.get_context(ex.assertion)
+        assertion.add((ex.a, RDF.type, ex.Thing))
+        assertion.add((ex.a, ex.likes, ex.b))
+        self.graph.add((ex.b, RDFS.label, Literal('B', lang='en'), ex.other))
+        self.graph.add((ex.assertion, RDF.type, NS.np.Assertion, ex.pubinfo))
+        self.fetched = []
+        self.descriptions = DescriptionCache(self.fetch, hot_size=1)
+
+    def fetch(self, uri):
+        self.fetched.append(uri)
+        return describe(self.graph, uri)
+
+    def test_describe(self):
+        triples = set(describe(self.graph, ex.a))
+        self.assertEqual(triples, set([
+            (ex.a, RDF.type, ex.Thing),
+            (ex.a, ex.likes, ex.b),
+            (ex.b, RDFS.label, Literal('B', lang='en')),
+        ]))
+
+    def test_cached(self):
+        first = self.descriptions.get(ex.a)
+        self.assertEqual(self.descriptions.get(str(ex.a)), first)
+        self.assertEqual(self.fetched, [ex.a])
+
+    def test_invalidate(self):
+        self.descriptions.get(ex.a)
+        self.graph.add((ex.a, ex.likes, ex.c, ex.assertion))
+        self.assertNotIn((ex.a, ex.likes, ex.c), self.descriptions.get(ex.a))
+        self.descriptions.invalidate(ex.a)
+        self.assertIn((ex.a, ex.likes, ex.c), self.descriptions.get(ex.a))
+
+    def test_invalidate_in_batches(self):
+        redis = DeletingRedis()
+        descriptions = DescriptionCache(self.fetch, redis=redis)
+        descriptions.delete_batch_size = 2
+        descriptions.invalidate(ex.a, ex.b, ex.c)
+        self.assertEqual([len(x) for x in redis.deletes], [2, 1])
+        descriptions.invalidate()
+        self.assertEqual(len(redis.deletes), 2)
+
+    def test_empty(self):
+        self.assertTrue(self.descriptions.empty())
+        self.descriptions.get(ex.a)
+        self.assertFalse(self.descriptions.empty())
+        # Other processes may have kept descriptions in Redis.
+        self.assertFalse(DescriptionCache(self.fetch, redis=DeletingRedis()).empty())
+
+    def test_warm_hot(self):
+        self.descriptions.get(ex.a)
+        self.descriptions.get(ex.a)
+        self.descriptions.get(ex.b)
+        self.descriptions.invalidate(ex.a, ex.b)
+        self.assertEqual(self.descriptions.warm([ex.a, ex.b]), [ex.a])
+        self.assertEqual(self.fetched, [ex.a, ex.b, ex.a])
+
+    def test_serialization(self):
+        node = BNode()
+        triples = [
+            (ex.a, ex.p, node),
+            (node, RDFS.label, Literal('x', lang='en')),
+            (node, ex.value, Literal(1)),
+        ]
+        self.assertEqual(_load_triples(_dump_triples(triples)), triples)
@@ -0,0 +1,62 @@
+import json
+from unittest import TestCase
+
+from flask import Flask
+from rdflib import ConjunctiveGraph, Literal
+
+from whyis import filters
+from whyis.database import SPARQLResultCache, WhyisSPARQLStore
+from whyis.namespace import NS
+
+RESULTS = {
+    'head': {'vars': ['x']},
+    'results': {'bindings': [{'x': {'type': 'literal', 'value': 'a'}}]},
+}
+
+
+class Response(object):
+    status_code = 200
+    headers = {'Content-type': 'application/sparql-results+json'}
+    content = json.dumps(RESULTS).encode('utf8')
+
+    def raise_for_status(self):
+        pass
+
+
+class Session(object):
+
+    def __init__(self):
+        self.requests = 0
+
+    def request(self, method, **kwargs):
+        self.requests += 1
+        return Response()
+
+
+class CountingStore(WhyisSPARQLStore):
+
+    def __init__(self):
+        WhyisSPARQLStore.__init__(self, 'http://localhost/sparql', returnFormat='json')
+        self._session = Session()
+
+    @property
+    def session(self):
+        return self._session
+
+
+class FiltersTestCase(TestCase):
+
+    def setUp(self):
+        self.store = CountingStore()
+        self.store.result_cache = SPARQLResultCache('test')
+        self.app = Flask(__name__)
+        self.app.NS = NS
+        self.app.db = ConjunctiveGraph(self.store)
+        filters.configure(self.app)
+
+    def test_query_is_cached(self):
+        query = self.app.jinja_env.filters['query']
+        self.assertEqual(query('select ?x where { ?x ?p ?o }'), [{'x': Literal('a')}])
+        self.assertEqual(query('select ?x where { ?x ?p ?o }'), [{'x': Literal('a')}])
+        self.assertEqual(self.store.session.requests, 1)
+        self.assertEqual(self.store.result_cache.stats()['hits'], 1)
@@ -0,0 +1,67 @@
+from unittest import TestCase
+
+from rdflib import ConjunctiveGraph, Literal, Namespace, URIRef
+from rdflib.namespace import FOAF, RDFS, SKOS
+
+from whyis.label_service import LabelService
+
+ex = Namespace('http://example.com/')
+
+
+class LabelServiceTestCase(TestCase):
+
+    def setUp(self):
+        self.language = 'en'
+        self.knowledge = ConjunctiveGraph()
+        self.admin = ConjunctiveGraph()
+        self.knowledge.add((ex.a, RDFS.label, Literal('A', lang='en')))
+        self.knowledge.add((ex.a, RDFS.label, Literal('Ah', lang='fr')))
+        self.knowledge.add((ex.b, SKOS.prefLabel, Literal('B')))
+        self.knowledge.add((ex.b, RDFS.label, Literal('Not B')))
+        self.admin.add((ex.user, FOAF.givenName, Literal('Jane')))
+        self.admin.add((ex.user, FOAF.familyName, Literal('Doe')))
+        self.labels = LabelService([self.knowledge, self.admin], [SKOS.prefLabel, RDFS.label],
+                                   [FOAF.givenName, FOAF.familyName],
+                                   lang_filter=self.lang_filter, fallback=lambda uri: 'fallback')
+
+    def lang_filter(self, terms):
+        best = [x for x in terms if x.language == self.language]
+        return best or [x for x in terms if x.language is None]
+
+    def test_labels(self):
+        labels = self.labels.labels([ex.a, ex.b, ex.user, ex.unknown])
+        self.assertEqual(labels, {
+            ex.a : Literal('A', lang='en'),
+            ex.b : Literal('B'),
+            ex.user : 'Jane Doe',
+            ex.unknown : 'fallback',
+        })
+        # One query for all of them in each graph.
+        self.assertEqual(self.labels.queries, 2)
+
+    def test_batches(self):
+        self.labels.batch_size = 2
+        self.labels.labels([ex.a, ex.b, ex.unknown])
+        # The admin graph is only asked about the second batch.
+        self.assertEqual(self.labels.queries, 3)
+
+    def test_languages_are_cached(self):
+        self.assertEqual(self.labels.label(ex.a), Literal('A', lang='en'))
+        self.language = 'fr'
+        self.assertEqual(self.labels.label(ex.a), Literal('Ah', lang='fr'))
+        self.assertEqual(self.labels.queries, 1)
+
+    def test_invalidate(self):
+        self.assertEqual(self.labels.label(ex.unknown), 'fallback')
+        self.knowledge.add((ex.unknown, RDFS.label, Literal('Known')))
+        self.assertEqual(self.labels.label(ex.unknown), 'fallback')
+        self.labels.invalidate(ex.unknown)
+        self.assertEqual(self.labels.label(ex.unknown), Literal('Known'))
+
+    def test_invalid_uri(self):
+        invalid = URIRef('http://example.com/a b>')
+        relative = URIRef('_:b1')
+        labels = self.labels.labels([ex.a, invalid, relative])
+        # The invalid URIs do not spoil the query for the others.
+        self.assertEqual(labels, {ex.a : Literal('A', lang='en'), invalid : 'fallback', relative : 'fallback'})
+        self.assertEqual(self.labels.queries, 1)
@@ -0,0 +1,85 @@
+import os
+from unittest import TestCase
+
+from rdflib import ConjunctiveGraph, Literal, Namespace, URIRef
+from rdflib.namespace import RDFS
+
+from whyis.namespace import NS
+from whyis.view_index import ViewIndex
+
+ex = Namespace('http://example.com/')
+
+DEFAULT_VOCAB = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'default_vocab.ttl')
+
+VIEW_QUERY = '''select ?id ?view (count(?mid)+?priority as ?rank) ?class ?c where {
+    values (?c ?priority ?id) { %s }
+    ?c rdfs:subClassOf* ?mid.
+    ?mid rdfs:subClassOf* ?class.
+    ?class ?viewProperty ?view.
+    ?viewProperty rdfs:subPropertyOf* whyis:hasView.
+    ?viewProperty dc:identifier ?id.
+} group by ?c ?class order by ?rank
+'''
+
+EXAMPLE_VOCAB = '''
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#>.
+@prefix whyis: <http://vocab.rpi.edu/whyis/>.
+@prefix ex: <http://example.com/>.
+
+ex:Dog rdfs:subClassOf ex:Mammal.
+ex:Mammal rdfs:subClassOf ex:Animal.
+ex:Animal whyis:hasView "animal.html".
+ex:Mammal whyis:hasDescribe "mammal.json".
+ex:Cat rdfs:subClassOf ex:Animal.
+ex:Cat whyis:hasView "cat.html".
+'''
+
+
+class ViewIndexTestCase(TestCase):
+
+    def setUp(self):
+        self.vocab = ConjunctiveGraph()
+        self.vocab.parse(DEFAULT_VOCAB, format='turtle', publicID='http://localhost/')
+        self.vocab.parse(data=EXAMPLE_VOCAB, format='turtle')
+        self.index = ViewIndex(self.vocab)
+
+    def query(self, types, view):
+        type_string = ' '.join(["(%s %d '%s')" % (x.n3(), i, view) for x, i in types])
+        return list(self.vocab.query(VIEW_QUERY % type_string, initNs=dict(whyis=NS.whyis, dc=NS.dc)))
+
+    def test_closest_view(self):
+        views = self.index.views([(ex.Dog, 1), (RDFS.Resource, 100)])
+        self.assertEqual(views[0].view, Literal('animal.html'))
+        self.assertEqual(views[0].rank, 4)
+        self.assertEqual(views[-1].view, Literal('resource_view.html'))
+
+    def test_subproperty_views(self):
+        views = self.index.views([(ex.Dog, 1), (RDFS.Resource, 100)], 'describe')
+        self.assertEqual(views[0].view, Literal('mammal.json'))
+
+    def test_as_override(self):
+        views = self.index.views([(ex.Cat, 0), (ex.Dog, 1), (RDFS.Resource, 100)])
+        self.assertEqual(views[0].view, Literal('cat.html'))
+
+    def test_classes(self):
+        self.assertEqual(self.index.classes('label'), set([RDFS.Resource]))
+        self.assertIn(ex.Mammal, self.index.classes('describe'))
+        self.assertEqual(self.index.classes('nothing'), set())
+
+    def test_no_view(self):
+        self.assertEqual(self.index.views([(ex.Dog, 1)], 'nothing'), [])
+
+    def test_matches_view_query(self):
+        cases = [
+            [(ex.Dog, 1), (RDFS.Resource, 100)],
+            [(ex.Cat, 0), (ex.Dog, 1), (RDFS.Resource, 100)],
+            [(URIRef('http://purl.org/ontology/bibo/AcademicArticle'), 1), (RDFS.Resource, 100)],
+            [(NS.np.Nanopublication, 1), (RDFS.Resource, 100)],
+            [(ex.Unknown, 1), (RDFS.Resource, 100)],
+            [(RDFS.Resource, 1), (RDFS.Resource, 100)],
+        ]
+        for types in cases:
+            for view in ['view', 'describe', 'label', 'nanopublications']:
+                expected = sorted((row['class'], row['view'], row['rank'].value) for row in self.query(types, view))
+                actual = sorted((match.cls, match.view, match.rank) for match in self.index.views(types, view))
+                self.assertEqual(actual, expected, (types, view))
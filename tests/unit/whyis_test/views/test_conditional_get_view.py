@@ -0,0 +1,28 @@
+from rdflib import Literal, URIRef
+from rdflib.namespace import RDFS
+
+from whyis.test.api_test_case import ApiTestCase
+
+
+class TestConditionalGetView(ApiTestCase):
+
+    def publish(self, uri, label):
+        nanopub = self.app.nanopub_manager.new()
+        nanopub.assertion.add((URIRef(uri), RDFS.label, Literal(label)))
+        self.app.nanopub_manager.publish(nanopub)
+
+    def test_not_modified(self):
+        self.login_new_user()
+        response = self.client.get('/about?view=latest')
+        self.assertStatus(response, 200)
+        etag, weak = response.get_etag()
+        response = self.client.get('/about?view=latest', headers={'If-None-Match': '"%s"' % etag})
+        self.assertStatus(response, 304)
+
+    def test_unrelated_publish(self):
+        self.login_new_user()
+        etag, weak = self.client.get('/about?view=latest').get_etag()
+        # The nanopublication is not about the home page, but is one of the latest.
+        self.publish('http://example.com/janedoe', 'Jane Doe')
+        response = self.client.get('/about?view=latest', headers={'If-None-Match': '"%s"' % etag})
+        self.assertStatus(response, 200)
@@ -0,0 +1,66 @@
+from rdflib import Literal, URIRef
+from rdflib.namespace import RDF, RDFS
+
+from whyis.namespace import NS
+from whyis.test.api_test_case import ApiTestCase
+from whyis.view_index import ViewIndex
+
+
+class TestLabelsView(ApiTestCase):
+
+    def setUp(self):
+        self.login_new_user()
+        nanopub = self.app.nanopub_manager.new()
+        nanopub.assertion.add((URIRef('http://example.com/janedoe'), RDFS.label, Literal('Jane Doe')))
+        self.app.nanopub_manager.publish(nanopub)
+
+    def test_labels(self):
+        response = self.client.post('/labels', json=['http://example.com/janedoe'])
+        self.assertStatus(response, 200)
+        self.assertEqual(response.json, {'http://example.com/janedoe': 'Jane Doe'})
+
+    def test_form(self):
+        response = self.client.post('/labels', data={'uri': ['http://example.com/janedoe']})
+        self.assertStatus(response, 200)
+        self.assertEqual(response.json, {'http://example.com/janedoe': 'Jane Doe'})
+
+    def test_not_a_list(self):
+        self.assertStatus(self.client.post('/labels', json={'uri': 'http://example.com/janedoe'}), 400)
+        self.assertStatus(self.client.post('/labels', json=['http://example.com/janedoe', 1]), 400)
+
+    def test_too_many(self):
+        self.app.config['labels_max_uris'] = 1
+        try:
+            response = self.client.post('/labels', json=['http://example.com/a', 'http://example.com/b'])
+            self.assertStatus(response, 413)
+        finally:
+            del self.app.config['labels_max_uris']
+
+    def test_bnodes_and_invalid_uris(self):
+        uris = ['bnode:b0', '_:b1', 'http://example.com/a b>', 'http://example.com/janedoe']
+        response = self.client.post('/labels', json=uris)
+        self.assertStatus(response, 200)
+        # Resources without labels still get one, and don't spoil the others.
+        self.assertEqual(sorted(response.json.keys()), sorted(uris))
+        self.assertEqual(response.json['http://example.com/janedoe'], 'Jane Doe')
+
+    def test_label_view(self):
+        person = URIRef('http://example.com/Person')
+        nanopub = self.app.nanopub_manager.new()
+        nanopub.assertion.add((URIRef('http://example.com/janedoe'), RDF.type, person))
+        self.app.nanopub_manager.publish(nanopub)
+        self.app.vocab.add((person, NS.whyis.hasLabel, Literal('person_label.html')))
+        view_index = self.app.view_index
+        render_view = self.app.render_view
+        self.app.view_index = ViewIndex(self.app.vocab)
+        # Templates are not needed to see which view is rendered.
+        self.app.render_view = lambda resource, view=None, args=None: (' Dr. Doe\n', 200, {})
+        try:
+            response = self.client.post('/labels', json=['http://example.com/janedoe', 'http://example.com/a'])
+            self.assertStatus(response, 200)
+            self.assertEqual(response.json['http://example.com/janedoe'], 'Dr. Doe')
+            self.assertNotEqual(response.json['http://example.com/a'], 'Dr. Doe')
+        finally:
+            self.app.vocab.remove((person, NS.whyis.hasLabel, None))
+            self.app.view_index = view_index
+            self.app.render_view = render_view
@@ -21,6 +21,7 @@ import tempfile
 from depot.io.interfaces import StoredFile
 
 from whyis.namespace import *
+from whyis.database import stream_query
 
 setlr_handlers_added = False
 
@@ -78,7 +79,7 @@ class SETLr(UpdateChangeService):
         # retire old copies
         old_np_map = {}
         to_retire = []
-        for new_np, assertion, orig in self.app.db.query('''select distinct ?np ?assertion ?original_uri where {
+        for new_np, assertion, orig in stream_query(self.app.db, '''select distinct ?np ?assertion ?original_uri where {
     ?np np:hasAssertion ?assertion.
     ?assertion a np:Assertion;
         prov:wasGeneratedBy/a ?setl;
@@ -86,9 +87,7 @@ class SETLr(UpdateChangeService):
 }''', initBindings=dict(setl=i.identifier), initNs=dict(prov=prov, np=np)):
             old_np_map[orig] = assertion
             to_retire.append(new_np)
-            if len(to_retire) > 100:
-                self.app.nanopub_manager.retire(*to_retire)
-                to_retire = []
+        # retire() batches internally, so hand it the whole output set at once.
         self.app.nanopub_manager.retire(*to_retire)
         # print resources
         for output_graph in setl_graph.subjects(prov.wasGeneratedBy, i.identifier):
@@ -21,6 +21,7 @@ import tempfile
 from depot.io.interfaces import StoredFile
 
 from whyis.namespace import *
+from whyis.database import stream_query
 
 
 class Deductor(UpdateChangeService):
@@ -56,10 +57,11 @@ class Deductor(UpdateChangeService):
 
     def process(self, i, o):
         npub = Nanopublication(store=o.graph.store)
-        triples = self.app.db.query(
+        # Stream the triples, since a rule can match a large part of the graph.
+        triples = stream_query(self.app.db,
             '''CONSTRUCT {\n%s\n} WHERE {\n%s \nFILTER NOT EXISTS {\n%s\n\t}\nFILTER (regex(str(%s), "^(%s)")) .\n}''' % (
             self.construct, self.where, self.construct, self.resource, i.identifier), initNs=self.prefixes)
-        for s, p, o, c in triples:
+        for s, p, o in triples:
             print("Deductor Adding ", s, p, o)
             npub.assertion.add((s, p, o))
         npub.provenance.add((npub.assertion.identifier, prov.value,
@@ -1,5 +1,6 @@
 from .entity_blueprint import entity_blueprint
 from .delete_entity import delete_entity as __delete_entity
 from .get_entity import view as __get_entity
+from .get_labels import get_labels as __get_labels
 from .post_entity import post_entity as __post_entity
 #from .put_entity import put_entity as __put_entity
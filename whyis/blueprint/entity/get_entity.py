@@ -5,6 +5,7 @@ from depot.middleware import FileServeApp
 
 from .entity_blueprint import entity_blueprint
 from whyis.data_extensions import DATA_EXTENSIONS
+from whyis.conditional_get import conditional_response, knowledge_version
 from whyis.data_formats import DATA_FORMATS
 from whyis.decorator import conditional_login_required
 
@@ -38,6 +39,10 @@ def view(name=None, format=None, view=None):
             fsa = FileServeApp(f, current_app.config["file_archive"].get("cache_max_age",3600*24*7))
             return fsa
             
+    return conditional_response(knowledge_version(current_app), lambda: render_entity(resource, content_type))
+
+
+def render_entity(resource, content_type):
     if content_type is None:
         content_type = request.headers['Accept'] if 'Accept' in request.headers else 'text/turtle'
     #print entity
@@ -0,0 +1,62 @@
+import collections
+import logging
+
+from flask import current_app, request, jsonify
+from werkzeug.exceptions import abort
+import rdflib
+from rdflib.namespace import RDF, RDFS
+
+from .entity_blueprint import entity_blueprint
+from whyis.database.database_utils import node_to_sparql
+from whyis.decorator import conditional_login_required
+from whyis.label_service import _valid
+
+_types_query = '''select ?s ?type where {
+    values ?s { %s }
+    ?s a ?type.
+}'''
+
+
+def _label_views(uris):
+    '''Returns those of ``uris`` with a type that has a ``whyis:hasLabel``
+    view of its own, rather than the one on ``rdfs:Resource``.'''
+    view_index = current_app.view_index
+    classes = view_index.classes('label')
+    classes.discard(RDFS.Resource)
+    if not classes:
+        return set()
+    uris = [uri for uri in uris if _valid(uri)]
+    types = collections.defaultdict(set)
+    for uri in uris:
+        types[uri].update(current_app.vocab.objects(uri, RDF.type))
+    batch_size = current_app.label_service.batch_size
+    for i in range(0, len(uris), batch_size):
+        terms = ' '.join(node_to_sparql(uri) for uri in uris[i:i + batch_size])
+        for s, type in current_app.db.query(_types_query % terms):
+            types[s].add(type)
+    return set(uri for uri in uris
+               if any(cls in classes for type in types[uri] for cls in view_index.ancestors(type)))
+
+
+@entity_blueprint.route('/labels', methods=['POST'])
+@conditional_login_required
+def get_labels():
+    '''Returns the labels of many URIs at once, as a JSON object. The URIs
+    are posted as a JSON list, or as repeated ``uri`` form fields.
+    Resources whose types have their own label view are labeled with it.'''
+    if request.is_json:
+        uris = request.get_json(silent=True)
+    else:
+        uris = request.form.getlist('uri')
+    if not isinstance(uris, list) or not all(isinstance(uri, str) for uri in uris):
+        abort(400)
+    if len(uris) > current_app.config.get('labels_max_uris', 1000):
+        abort(413)
+    uris = [rdflib.URIRef(uri) for uri in uris]
+    labels = dict((uri, str(label)) for uri, label in current_app.label_service.labels(uris).items())
+    for uri in _label_views(uris):
+        try:
+            labels[uri] = current_app.render_view(current_app.get_resource(uri), view='label')[0].strip()
+        except Exception:
+            logging.exception("Could not render the label view of %s", uri)
+    return jsonify(dict((str(uri), label) for uri, label in labels.items()))
@@ -4,6 +4,7 @@ from werkzeug.exceptions import abort
 
 from .nanopub_blueprint import nanopub_blueprint
 from whyis.blueprint.nanopub.nanopub_utils import get_nanopub_uri
+from whyis.conditional_get import conditional_response, knowledge_version, nanopub_version
 from whyis.data_extensions import DATA_EXTENSIONS
 from whyis.data_formats import DATA_FORMATS
 from whyis.decorator import conditional_login_required
@@ -32,6 +33,14 @@ def get_nanopub(ident, format=None):
     #print(request.method, 'get_nanopub()', ident)
     ident = ident.split("_")[0]
     uri = get_nanopub_uri(ident)
+    if not current_app.nanopub_manager.is_current(uri):
+        abort(404)
+    # Views of a nanopublication may show more than the nanopublication.
+    version = knowledge_version(current_app) if 'view' in request.args else nanopub_version(uri)
+    return conditional_response(version, lambda: render_nanopub_formats(uri, format))
+
+
+def render_nanopub_formats(uri, format=None):
     result = current_app.nanopub_manager.get(uri)
     if result is None:
         #print("cannot find", uri)
@@ -19,19 +19,23 @@ graph_aware_formats = set([
     "nquads"
 ])
 
-def load_nanopub_graph(format, location=None, data=None, store=None):
+def load_nanopub_graph(format, location=None, data=None, store=None, prefix=None, publicID=None):
     if store is None:
         store = ConjunctiveGraph().store
+    if prefix is None:
+        prefix = current_app.nanopub_manager.prefix
+    if publicID is None:
+        publicID = current_app.NS.local
     if format in graph_aware_formats:
         inputGraph = ConjunctiveGraph(store=store)
     else:
-        nanopub = Nanopublication(store = store, identifier=current_app.nanopub_manager.prefix[create_id()])
+        nanopub = Nanopublication(store = store, identifier=prefix[create_id()])
         nanopub.nanopub_resource
         nanopub.assertion
         nanopub.provenance
         nanopub.pubinfo
         inputGraph = Graph(store=store, identifier=nanopub.assertion.identifier)
-    inputGraph.parse(data=data, location=location, format=format, publicID=current_app.NS.local)
+    inputGraph.parse(data=data, location=location, format=format, publicID=publicID)
     return ConjunctiveGraph(store=store)
 
 def get_nanopub_graph():
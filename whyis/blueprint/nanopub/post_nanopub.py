@@ -16,9 +16,13 @@ def post_nanopub(ident=None):
     #for nanopub_uri in inputGraph.subjects(rdflib.RDF.type, app.NS.np.Nanopublication):
     #nanopub.pubinfo.add((nanopub.assertion.identifier, app.NS.dc.created, Literal(datetime.utcnow())))
     headers = {}
+    handles = []
     for nanopub in current_app.nanopub_manager.prepare(inputGraph):
         prep_nanopub(nanopub)
         headers['Location'] = nanopub.identifier
-        current_app.nanopub_manager.publish(nanopub)
+        handles.append(current_app.nanopub_manager.publish(nanopub))
+    # Clients expect to be able to read what they just posted.
+    for handle in handles:
+        handle.wait()
 
     return '', 201, headers
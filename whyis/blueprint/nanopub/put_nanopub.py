@@ -16,4 +16,4 @@ def put_nanopub(ident):
     for nanopub in current_app.nanopub_manager.prepare(inputGraph):
         nanopub.pubinfo.set((nanopub.assertion.identifier, NS.prov.wasRevisionOf, old_nanopub.assertion.identifier))
         current_app.nanopub_manager.retire(nanopub_uri)
-        current_app.nanopub_manager.publish(nanopub)
+        current_app.nanopub_manager.publish(nanopub).wait()
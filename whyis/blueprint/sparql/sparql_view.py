@@ -1,4 +1,4 @@
-import requests
+from whyis.http_session import get_session
 from flask import request, redirect, url_for, current_app, Response
 
 from whyis.blueprint.sparql import sparql_blueprint
@@ -22,14 +22,16 @@ def sparql_view():
         headers.update(request.headers)
         if 'Content-Length' in headers:
             del headers['Content-Length']
-        req = requests.get(current_app.db.store.query_endpoint,
-                           headers = headers, params=request.args)
+        with current_app.db.store.read_endpoint() as endpoint:
+            req = get_session().get(endpoint,
+                               headers = headers, params=request.args)
     elif request.method == 'POST':
         if 'application/sparql-update' in request.headers['content-type']:
             return "Update not allowed.", 403
         #print(request.get_data())
-        req = requests.post(current_app.db.store.query_endpoint, data=request.get_data(),
-                            headers = request.headers, params=request.args)
+        with current_app.db.store.read_endpoint() as endpoint:
+            req = get_session().post(endpoint, data=request.get_data(),
+                                     headers = request.headers, params=request.args)
     #print self.db.store.query_endpoint
     #print req.status_code
     response = Response(req.content, content_type = req.headers['content-type'])
@@ -0,0 +1,71 @@
+# -*- coding:utf-8 -*-
+
+import collections
+import threading
+
+
+class LRUCache(object):
+    '''A thread-safe, size-bounded least-recently-used cache.
+
+    The size of each entry is given by ``getsizeof`` (1 per entry by
+    default), and the least recently used entries are evicted once the
+    total size exceeds ``maxsize``. Entries larger than ``maxsize`` are
+    not cached. Hits and misses are counted in ``hits`` and ``misses``.'''
+
+    def __init__(self, maxsize, getsizeof=None):
+        self.maxsize = maxsize
+        self.getsizeof = getsizeof if getsizeof is not None else (lambda value: 1)
+        self.currsize = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = self.getsizeof(value)
+        with self._lock:
+            self.delete(key)
+            if size > self.maxsize:
+                return
+            self._data[key] = (value, size)
+            self.currsize += size
+            while self.currsize > self.maxsize:
+                k, (v, s) = self._data.popitem(last=False)
+                self.currsize -= s
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                value, size = self._data.pop(key)
+                self.currsize -= size
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.currsize = 0
+
+    def stats(self):
+        return {
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'entries' : len(self._data),
+            'size' : self.currsize,
+            'maxsize' : self.maxsize,
+        }
@@ -2,9 +2,12 @@ from .configure import Configure
 from .create_user import CreateUser
 from .list_routes import ListRoutes
 from .load_nanopub import LoadNanopub
+from .rebuild_index import RebuildIndex
+from .restore_archive import RestoreArchive
 from .retire_nanopub import RetireNanopub
 from .run_interpreter import RunInterpreter
 from .runserver import WhyisServer
+from .slow_queries import SlowQueries
 from .test import Test
 from .test_agent import TestAgent
 from .update_user import UpdateUser
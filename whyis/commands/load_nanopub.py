@@ -1,5 +1,10 @@
 # -*- coding:utf-8 -*-
+import glob
+import hashlib
+import os
+import random
 import shutil
+from concurrent.futures import ProcessPoolExecutor
 
 from flask_script import Command, Option, Server
 
@@ -10,8 +15,60 @@ from nanopub import Nanopublication
 import tempfile
 
 from whyis.namespace import np
+from whyis.nanopub import prepare_nanopubs
 from whyis.blueprint.nanopub.nanopub_utils import load_nanopub_graph
 
+
+def _prepare_file(input_file, file_format, prefix, public_id):
+    '''Parses and prepares one file in a worker process, and returns the
+    prepared nanopublications as N-Quads.'''
+    g = rdflib.ConjunctiveGraph()
+    load_nanopub_graph(location=input_file, format=file_format, store=g.store,
+                       prefix=rdflib.Namespace(prefix), publicID=public_id)
+    list(prepare_nanopubs(g, rdflib.Namespace(prefix)))
+    return g.serialize(format='nquads')
+
+
+def _init_worker():
+    # Forked workers inherit the parent's random state, and create_id()
+    # is based on it.
+    random.seed()
+
+
+def find_input_files(input_spec):
+    '''Expands a file, directory or glob into a sorted list of files.'''
+    if os.path.isdir(input_spec):
+        paths = []
+        for dirpath, dirnames, filenames in os.walk(input_spec):
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            paths.extend([os.path.join(dirpath, f) for f in filenames if not f.startswith('.')])
+        return sorted(paths)
+    if os.path.exists(input_spec):
+        return [input_spec]
+    return sorted([p for p in glob.glob(input_spec, recursive=True) if os.path.isfile(p)])
+
+
+def default_checkpoint(input_spec, input_files, load_dir=None):
+    '''Returns the checkpoint file for loading ``input_spec``, in
+    ``load_dir`` if given, or else next to the input files.'''
+    if load_dir is not None:
+        directory = load_dir
+    elif os.path.isdir(input_spec):
+        directory = input_spec
+    else:
+        directory = os.path.commonpath([os.path.dirname(os.path.abspath(x)) for x in input_files])
+    ident = hashlib.sha1(os.path.abspath(input_spec).encode('utf8')).hexdigest()[:12]
+    return os.path.join(directory, '.whyis-load-%s.checkpoint' % ident)
+
+
+def read_checkpoint(checkpoint):
+    '''Returns the files recorded as loaded in ``checkpoint``.'''
+    if not os.path.exists(checkpoint):
+        return set()
+    with open(checkpoint) as f:
+        return set([line.rstrip('\n') for line in f])
+
+
 class LoadNanopub(Command):
     '''Add a nanopublication to the knowledge graph.'''
 
@@ -19,13 +76,17 @@ class LoadNanopub(Command):
 
     def get_options(self):
         return [
-            Option('-i', '--input', dest='input_file', required=True, help='Path to file containing nanopub', type=str),
+            Option('-i', '--input', dest='input_file', required=True, help='Path to file containing nanopub, or a directory or glob of files', type=str),
             Option('-f', '--format', dest='file_format', default='trig', help='File format (default: trig; also turtle, json-ld, xml, nquads, nt, rdfa)', type=str),
             Option('-r', '--revises', dest='was_revision_of', help="URI of nanopublication that this is a revision of", type=str),
-            Option("--temp-store", dest="temp_store", type=str, default=self._TEMP_STORE_DEFAULT, help="backing store type to use for temporary graphs; deprecated")
+            Option("--temp-store", dest="temp_store", type=str, default=self._TEMP_STORE_DEFAULT, help="backing store type to use for temporary graphs; deprecated"),
+            Option('-j', '--jobs', dest='jobs', type=int, default=None, help='Number of processes used to parse files (default: number of CPUs)'),
+            Option('-b', '--batch-size', dest='batch_size', type=int, default=100, help='Number of files published together (default: 100)'),
+            Option('-c', '--checkpoint', dest='checkpoint', type=str, default=None, help='File recording loaded files, so an interrupted load can resume'),
         ]
 
-    def run(self, input_file, file_format, temp_store=_TEMP_STORE_DEFAULT, was_revision_of=None):
+    def run(self, input_file, file_format, temp_store=_TEMP_STORE_DEFAULT, was_revision_of=None,
+            jobs=None, batch_size=100, checkpoint=None):
         flask.current_app.managed = True
         if was_revision_of is not None:
             wasRevisionOf = set(flask.current_app.db.objects(predicate=np.hasAssertion,
@@ -34,6 +95,23 @@ class LoadNanopub(Command):
                 print("Could not find active nanopublication to revise:", was_revision_of)
                 return
             was_revision_of = wasRevisionOf
+
+        input_files = find_input_files(input_file)
+        if len(input_files) == 0:
+            print("No files found:", input_file)
+            return
+        if len(input_files) == 1 and input_files[0] == input_file:
+            self.load_file(input_file, file_format, temp_store, was_revision_of)
+        else:
+            self.load_files(input_file, input_files, file_format, was_revision_of, jobs, batch_size, checkpoint)
+
+    def mark_revisions(self, nanopub, was_revision_of):
+        if was_revision_of is not None:
+            for r in was_revision_of:
+                print("Marking as revision of", r)
+                nanopub.pubinfo.add((nanopub.assertion.identifier, flask.current_app.NS.prov.wasRevisionOf, r))
+
+    def load_file(self, input_file, file_format, temp_store, was_revision_of):
         g = rdflib.ConjunctiveGraph(identifier=rdflib.BNode().skolemize(), store=temp_store)
         if temp_store == "Sleepycat":
             g_store_tempdir = tempfile.mkdtemp()
@@ -44,17 +122,75 @@ class LoadNanopub(Command):
 
         try:
             g1 = load_nanopub_graph(location=input_file, format=file_format, store=g.store)
-            
+
             nanopubs = []
             for npub in flask.current_app.nanopub_manager.prepare(g):
-                if was_revision_of is not None:
-                    for r in was_revision_of:
-                        print("Marking as revision of", r)
-                        npub.pubinfo.add((npub.assertion.identifier, flask.current_app.NS.prov.wasRevisionOf, r))
+                self.mark_revisions(npub, was_revision_of)
                 print('Prepared', npub.identifier)
                 nanopubs.append(npub)
-            flask.current_app.nanopub_manager.publish(*nanopubs)
+            flask.current_app.nanopub_manager.publish(*nanopubs).wait()
             print("Published", npub.identifier)
         finally:
             if g_store_tempdir is not None:
                 shutil.rmtree(g_store_tempdir)
+
+    def load_files(self, input_spec, input_files, file_format, was_revision_of, jobs, batch_size, checkpoint):
+        '''Parses and prepares files in a process pool and publishes them
+        in batches of ``batch_size`` files. Each published file is
+        recorded in the checkpoint file, and files already recorded there
+        are skipped.'''
+        if checkpoint is None:
+            checkpoint = default_checkpoint(input_spec, input_files, flask.current_app.config.get('load_dir'))
+        done = read_checkpoint(checkpoint)
+        if len(done) > 0:
+            print("Resuming from", checkpoint, "with", len(done), "files already loaded")
+        todo = [x for x in input_files if x not in done]
+
+        manager = flask.current_app.nanopub_manager
+        prefix = str(manager.prefix)
+        public_id = str(flask.current_app.NS.local)
+        if jobs is None:
+            jobs = os.cpu_count()
+
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as executor, \
+             open(checkpoint, 'a') as checkpoint_file:
+            # Keep a bounded number of files in flight, and collect them
+            # in input order so the checkpoint is a prefix of the work.
+            pending = []
+            batch = []
+            batch_files = []
+            loaded = len(done)
+
+            def publish_batch():
+                manager.publish(*batch).wait()
+                checkpoint_file.write(''.join([x + '\n' for x in batch_files]))
+                checkpoint_file.flush()
+                os.fsync(checkpoint_file.fileno())
+                del batch[:]
+                del batch_files[:]
+
+            files = iter(todo)
+            while True:
+                while len(pending) < 2 * jobs:
+                    path = next(files, None)
+                    if path is None:
+                        break
+                    pending.append((path, executor.submit(_prepare_file, path, file_format, prefix, public_id)))
+                if len(pending) == 0:
+                    break
+                path, future = pending.pop(0)
+                g = rdflib.ConjunctiveGraph()
+                g.parse(data=future.result(), format='nquads')
+                for npuri in g.subjects(rdflib.RDF.type, np.Nanopublication):
+                    self.mark_revisions(Nanopublication(store=g.store, identifier=npuri), was_revision_of)
+                batch.append(g)
+                batch_files.append(path)
+                if len(batch) >= batch_size:
+                    loaded += len(batch)
+                    publish_batch()
+                    print("Loaded", loaded, "of", len(input_files), "files")
+            if len(batch) > 0:
+                loaded += len(batch)
+                publish_batch()
+                print("Loaded", loaded, "of", len(input_files), "files")
+        os.remove(checkpoint)
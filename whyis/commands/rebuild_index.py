@@ -0,0 +1,17 @@
+# -*- coding:utf-8 -*-
+
+from flask_script import Command
+
+import flask
+
+
+class RebuildIndex(Command):
+    '''Rebuild the Redis index of current nanopublications from the knowledge graph.'''
+
+    def run(self):
+        flask.current_app.managed = True
+        count = flask.current_app.nanopub_manager.rebuild_index()
+        if count is None:
+            print("nanopub_index_redis is not enabled.")
+            return
+        print("Indexed", count, "nanopublications")
@@ -0,0 +1,17 @@
+# -*- coding:utf-8 -*-
+
+from flask_script import Command
+
+import flask
+
+
+class RestoreArchive(Command):
+    '''Load every nanopublication in the local nanopublication archive into the knowledge graph.'''
+
+    def run(self):
+        flask.current_app.managed = True
+        if flask.current_app.nanopub_manager.archive_path is None:
+            print("No nanopub_archive_path is configured.")
+            return
+        count = flask.current_app.nanopub_manager.restore_archive()
+        print("Restored", count, "nanopublications")
@@ -0,0 +1,41 @@
+# -*- coding:utf-8 -*-
+
+from flask_script import Command, Option
+
+import flask
+
+
+class SlowQueries(Command):
+    '''Print the queries that took the most time, grouped by fingerprint.'''
+
+    def get_options(self):
+        return [
+            Option('-n', '--limit', dest='limit', default=20, type=int,
+                   help='Number of fingerprints to print (default 20)'),
+            Option('-s', '--sort', dest='sort', default='total', choices=['total', 'count', 'max', 'p50', 'p99'],
+                   help='What to rank fingerprints by (default total)'),
+            Option('-v', '--verbose', dest='verbose', action='store_true', default=False,
+                   help='Also print the slowest sample of each query'),
+            Option('--reset', dest='reset', action='store_true', default=False,
+                   help='Clear the slow query log'),
+        ]
+
+    def run(self, limit=20, sort='total', verbose=False, reset=False):
+        query_log = flask.current_app.query_log
+        if query_log is None:
+            print("slow_query_log is not enabled.")
+            return
+        if reset:
+            query_log.reset()
+            print("Cleared the slow query log.")
+            return
+        for i, entry in enumerate(query_log.top(limit, sort)):
+            print("%d. total %.3fs, count %d, p50 %.3fs, p99 %.3fs, max %.3fs" % (
+                i + 1, entry['total'], entry['count'], entry['p50'] or 0, entry['p99'] or 0, entry['max']))
+            print("   caller:", entry['caller'] or 'unknown')
+            print("   fingerprint:", entry['fingerprint'])
+            if verbose:
+                print("   slowest sample:")
+                for line in (entry['sample'] or '').strip().split('\n'):
+                    print("      " + line)
+            print()
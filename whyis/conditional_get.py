@@ -0,0 +1,57 @@
+# -*- coding:utf-8 -*-
+
+import hashlib
+
+from flask import current_app, make_response, request
+from flask_login import current_user
+
+__all__ = ["conditional_response", "knowledge_version", "nanopub_version"]
+
+
+def nanopub_version(nanopub_uri):
+    '''Returns the version of a nanopublication, which is its URI, since
+    nanopublications are not changed once published.'''
+    return str(nanopub_uri)
+
+
+def knowledge_version(app):
+    '''Returns a version of the knowledge graph that changes whenever a
+    nanopublication is published or retired. Pages may show any part of
+    it, such as the latest nanopublications or search results, so they
+    all use it.'''
+    return app.nanopub_manager.version()
+
+
+def _etag(version):
+    # Pages also depend on how they were asked for, and by whom.
+    user = current_user.get_id() if getattr(current_user, 'is_authenticated', False) else None
+    parts = [version, request.full_path, request.headers.get('Accept', ''),
+             request.headers.get('Accept-Language', ''), user,
+             current_app.config.get('conditional_get_version', '')]
+    return hashlib.sha1('\n'.join(str(x) for x in parts).encode('utf8')).hexdigest()
+
+
+def conditional_response(version, render):
+    '''Returns the response from ``render()`` with an ETag for
+    ``version``, or 304 Not Modified without calling ``render`` if the
+    client already has that version.
+
+    No Last-Modified is sent, since nanopublication dates may be older
+    than when they were published, and clients would be told that pages
+    changed by those nanopublications were not modified.'''
+    etag = _etag(version)
+    if request.if_none_match and request.if_none_match.contains_weak(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(render())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    response.cache_control.max_age = current_app.config.get('conditional_get_max_age', 0)
+    response.cache_control.must_revalidate = True
+    if getattr(current_user, 'is_authenticated', False):
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    response.vary.update(['Accept', 'Accept-Language', 'Cookie'])
+    return response
@@ -1,3 +1,13 @@
 from .database_utils import *
+from .chunked_publisher import ChunkedPublisher
+from .blazegraph_bulk_loader import BlazeGraphBulkLoader, BulkLoadError
+from .buffered_updates import buffered
+from .concurrent_queries import configure_query_pool, query_many
+from .query_log import QueryLog
+from .result_cache import SPARQLResultCache, uncached
+from .single_flight import SingleFlight
+from .sqlite_store import SQLiteStore
+from .streaming import stream_query
+from .thread_local import ThreadLocalStateMixin
 from .whyis_sparql_store import WhyisSPARQLStore
 from .whyis_sparql_update_store import WhyisSPARQLUpdateStore
@@ -0,0 +1,118 @@
+# -*- coding:utf-8 -*-
+
+import os
+import shutil
+import threading
+import time
+from xml.etree import ElementTree
+
+import requests
+
+from whyis.datastore import create_id
+from whyis.http_session import get_session
+
+
+class BulkLoadError(Exception):
+    pass
+
+
+class BlazeGraphBulkLoader(object):
+    '''Publishes N-Quads files through the Blazegraph DataLoader servlet.
+
+    The DataLoader loads and commits before it responds, so once a call
+    returns the data is visible to queries. Files have to be readable by
+    Blazegraph, so anything outside ``load_dir`` is copied there first.
+    With durable queues, Blazegraph renames loaded files to ``.good``
+    and failed ones to ``.fail``. Loaded files are deleted, and failed
+    ones are left in place and reported in a ``BulkLoadError``.
+
+    Calls are independent, so several files can be loaded in parallel,
+    for instance by a ``ChunkedPublisher`` with ``max_pending`` > 1.'''
+
+    prop_file = \
+'''
+quiet=false
+verbose=1
+closure=false
+durableQueues=true
+#Needed for quads
+defaultGraph=%s
+format=text/x-nquads
+com.bigdata.rdf.store.DataLoader.flush=false
+com.bigdata.rdf.store.DataLoader.bufferCapacity=100000
+com.bigdata.rdf.store.DataLoader.queueCapacity=10
+#Namespace to load
+namespace=%s
+propertyFile=%s
+#Files to load
+fileOrDirs=%s'''
+
+    def __init__(self, config, prefix):
+        self.config = config
+        self.prefix = prefix
+        self.endpoint = config[prefix+"bulkLoadEndpoint"]
+        self.load_dir = config['load_dir']
+        self.statements = 0
+        self.files = 0
+        self._lock = threading.Lock()
+
+    def _stage(self, data):
+        '''Returns the path of ``data`` in ``load_dir``, copying it there
+        if needed.'''
+        name = getattr(data, 'name', None)
+        if isinstance(name, str) and os.path.dirname(os.path.abspath(name)) == os.path.abspath(self.load_dir):
+            return name
+        path = os.path.join(self.load_dir, create_id().replace('/', '_') + '.nq')
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(data, f)
+        return path
+
+    def _remove(self, path):
+        for p in [path, path + '.good']:
+            if os.path.exists(p):
+                os.remove(p)
+
+    def __call__(self, data):
+        return self.load(data)
+
+    def load(self, data):
+        '''Loads a file object of N-Quads and returns the number of
+        statements loaded and the time it took, as reported by
+        Blazegraph.'''
+        path = self._stage(data)
+        prop_file = self.prop_file % (self.config['lod_prefix']+'/pub/'+create_id()+"_assertion",
+                                      self.config[self.prefix+"bulkLoadNamespace"],
+                                      self.config[self.prefix+"BlazeGraphProperties"],
+                                      path)
+        start = time.time()
+        try:
+            r = get_session().post(self.endpoint, data=prop_file.encode('utf8'),
+                       headers={'Content-Type':'text/plain'})
+        except requests.RequestException as e:
+            raise BulkLoadError("Bulk load of %s failed: %s" % (path, e))
+        if r.status_code >= 300 or os.path.exists(path + '.fail'):
+            raise BulkLoadError("Bulk load of %s failed (HTTP %s): %s" % (path, r.status_code, r.text[:1000]))
+        stats = self._parse_response(r.text)
+        stats['file'] = path
+        if stats['milliseconds'] is None:
+            stats['milliseconds'] = int((time.time() - start) * 1000)
+        self._remove(path)
+        with self._lock:
+            self.files += 1
+            self.statements += stats['statements'] or 0
+        print("Bulk loaded", stats['statements'], "statements from", path, "in", stats['milliseconds'], "ms")
+        return stats
+
+    def _parse_response(self, text):
+        # Blazegraph answers mutations with <data modified="..." milliseconds="..."/>
+        stats = {'statements': None, 'milliseconds': None}
+        try:
+            root = ElementTree.fromstring(text.strip())
+        except ElementTree.ParseError:
+            return stats
+        for element in [root] + list(root.iter('data')):
+            if 'modified' in element.attrib:
+                stats['statements'] = int(element.attrib['modified'])
+            if 'milliseconds' in element.attrib:
+                stats['milliseconds'] = int(element.attrib['milliseconds'])
+        return stats
@@ -0,0 +1,187 @@
+# -*- coding:utf-8 -*-
+
+import threading
+from contextlib import contextmanager
+
+from rdflib import Variable
+
+__all__ = ["BufferedUpdateMixin", "buffered"]
+
+
+class _UpdateBuffer(object):
+    '''Pending edits for one thread, in the order they were made. Runs of
+    inserts or deletes of concrete triples into the same graph are kept
+    together, so they can be sent as one ``INSERT DATA`` or ``DELETE DATA``
+    operation.'''
+
+    def __init__(self):
+        self.depth = 0
+        self.operations = []
+        self.statements = 0
+
+    def append(self, kind, graph, statement):
+        if self.operations:
+            last = self.operations[-1]
+            if last[0] == kind and last[1] == graph and kind != 'update':
+                last[2].append(statement)
+                self.statements += 1
+                return
+        self.operations.append((kind, graph, [statement]))
+        self.statements += 1
+
+    def clear(self):
+        self.operations = []
+        self.statements = 0
+
+    def serialize(self):
+        '''Returns the pending edits as a single SPARQL Update request.'''
+        updates = []
+        for kind, graph, statements in self.operations:
+            if kind == 'update':
+                updates.extend(statements)
+                continue
+            keyword = kind == 'insert' and 'INSERT DATA' or 'DELETE DATA'
+            body = '\n'.join(statements)
+            if graph is not None:
+                updates.append("%s { GRAPH %s {\n%s\n} }" % (keyword, graph, body))
+            else:
+                updates.append("%s {\n%s\n}" % (keyword, body))
+        return '\n;\n'.join(updates)
+
+
+class BufferedUpdateMixin(object):
+    '''Adds a buffered mode to SPARQL update stores. Inside ``buffered()``,
+    ``add()``, ``addN()`` and ``remove()`` are collected for the current
+    thread and sent in as few requests as possible, either when the
+    outermost ``buffered()`` block ends or every ``buffer_size``
+    statements. Edits are sent before any read or update, so the thread
+    always sees its own writes. If the block raises, the edits that have
+    not been sent are discarded.'''
+
+    buffer_size = 10000
+
+    @property
+    def _buffer_local(self):
+        return self.__dict__.setdefault('_buffer_local_', threading.local())
+
+    def _buffer(self):
+        buffer = getattr(self._buffer_local, 'buffer', None)
+        if buffer is not None and buffer.depth > 0:
+            return buffer
+        return None
+
+    @contextmanager
+    def buffered(self):
+        '''Buffers edits made in this thread until the block ends.'''
+        buffer = getattr(self._buffer_local, 'buffer', None)
+        if buffer is None:
+            buffer = self._buffer_local.buffer = _UpdateBuffer()
+        buffer.depth += 1
+        try:
+            yield
+        except BaseException:
+            buffer.depth -= 1
+            if buffer.depth == 0:
+                buffer.clear()
+            raise
+        buffer.depth -= 1
+        if buffer.depth == 0:
+            self._flush(buffer)
+
+    def flush_updates(self):
+        '''Sends the edits buffered in this thread now.'''
+        buffer = getattr(self._buffer_local, 'buffer', None)
+        if buffer is not None:
+            self._flush(buffer)
+
+    def discard_updates(self):
+        '''Drops the edits buffered in this thread without sending them.'''
+        buffer = getattr(self._buffer_local, 'buffer', None)
+        if buffer is not None:
+            buffer.clear()
+
+    def _flush(self, buffer):
+        if not buffer.operations:
+            return
+        update = buffer.serialize()
+        buffer.clear()
+        self._update(update)
+
+    def _buffered(self, buffer, kind, graph, statement):
+        buffer.append(kind, graph, statement)
+        if buffer.statements >= self.buffer_size:
+            self._flush(buffer)
+
+    def _graph_key(self, context):
+        if self._is_contextual(context):
+            return self.node_to_sparql(context.identifier)
+        return None
+
+    def add(self, spo, context=None, quoted=False):
+        buffer = self._buffer()
+        if buffer is None:
+            return super(BufferedUpdateMixin, self).add(spo, context=context, quoted=quoted)
+        assert not quoted
+        nts = self.node_to_sparql
+        self._buffered(buffer, 'insert', self._graph_key(context), "%s %s %s ." % tuple(nts(x) for x in spo))
+
+    def addN(self, quads):
+        buffer = self._buffer()
+        if buffer is None:
+            return super(BufferedUpdateMixin, self).addN(quads)
+        nts = self.node_to_sparql
+        for s, p, o, context in quads:
+            self._buffered(buffer, 'insert', self._graph_key(context), "%s %s %s ." % (nts(s), nts(p), nts(o)))
+
+    def remove(self, spo, context):
+        buffer = self._buffer()
+        if buffer is None:
+            return super(BufferedUpdateMixin, self).remove(spo, context)
+        nts = self.node_to_sparql
+        graph = self._graph_key(context)
+        if None not in spo:
+            self._buffered(buffer, 'delete', graph, "%s %s %s ." % tuple(nts(x) for x in spo))
+            return
+        # Patterns need a WHERE clause, so they are sent as they are.
+        s, p, o = [x if x is not None else Variable(v) for x, v in zip(spo, 'SPO')]
+        triple = "%s %s %s ." % (nts(s), nts(p), nts(o))
+        if graph is not None:
+            q = "WITH %s DELETE { %s } WHERE { %s }" % (graph, triple, triple)
+        else:
+            q = "DELETE { %s } WHERE { %s }" % (triple, triple)
+        self._buffered(buffer, 'update', None, q)
+
+    def query(self, *args, **kwargs):
+        self.flush_updates()
+        return super(BufferedUpdateMixin, self).query(*args, **kwargs)
+
+    def query_stream(self, *args, **kwargs):
+        self.flush_updates()
+        return super(BufferedUpdateMixin, self).query_stream(*args, **kwargs)
+
+    def triples(self, *args, **kwargs):
+        self.flush_updates()
+        return super(BufferedUpdateMixin, self).triples(*args, **kwargs)
+
+    def contexts(self, *args, **kwargs):
+        self.flush_updates()
+        return super(BufferedUpdateMixin, self).contexts(*args, **kwargs)
+
+    def __len__(self, *args, **kwargs):
+        self.flush_updates()
+        return super(BufferedUpdateMixin, self).__len__(*args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        self.flush_updates()
+        return super(BufferedUpdateMixin, self).update(*args, **kwargs)
+
+
+@contextmanager
+def buffered(store):
+    '''Buffers edits made to ``store`` in this thread until the block
+    ends, if the store supports it.'''
+    if hasattr(store, 'buffered'):
+        with store.buffered():
+            yield
+    else:
+        yield
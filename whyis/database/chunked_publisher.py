@@ -0,0 +1,107 @@
+# -*- coding:utf-8 -*-
+
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ChunkedPublisher(object):
+    '''Collects serialized N-Quads rows into bounded chunks and hands each
+    chunk to ``publish`` as a file object.
+
+    Chunks are uploaded on a background thread while the next one is
+    serialized. At most ``max_pending`` chunks are in flight at once, so
+    memory and request size stay bounded by the chunk limits. With
+    ``max_pending=0`` chunks are published synchronously.
+
+    Rows are only split off into a new chunk at a call to ``boundary()``,
+    unless ``split_anywhere`` is set. Blank nodes cannot be shared between
+    requests, so callers should only split anywhere when rows contain no
+    blank nodes.'''
+
+    def __init__(self, publish, max_quads=100000, max_bytes=64*1024*1024,
+                 max_pending=1, open_chunk=None, split_anywhere=False):
+        self.publish = publish
+        self.max_quads = max_quads
+        self.max_bytes = max_bytes
+        self.max_pending = max_pending
+        self.split_anywhere = split_anywhere
+        if open_chunk is None:
+            open_chunk = lambda: tempfile.NamedTemporaryFile(delete=True)
+        self.open_chunk = open_chunk
+        self.chunks = 0
+        self.quads = 0
+        self._chunk = None
+        self._chunk_quads = 0
+        self._chunk_bytes = 0
+        self._pending = []
+        self._executor = None
+        if max_pending > 0:
+            self._executor = ThreadPoolExecutor(max_workers=max_pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _full(self):
+        return self._chunk_quads >= self.max_quads or self._chunk_bytes >= self.max_bytes
+
+    def write(self, row):
+        if self._chunk is None:
+            self._chunk = self.open_chunk()
+        self._chunk.write(row)
+        self._chunk_quads += 1
+        self._chunk_bytes += len(row)
+        self.quads += 1
+        if self.split_anywhere and self._full():
+            self.flush()
+
+    def boundary(self):
+        '''Marks a point where the output may be split into a new chunk.'''
+        if self._full():
+            self.flush()
+
+    def flush(self):
+        if self._chunk is None:
+            return
+        chunk = self._chunk
+        self._chunk = None
+        self._chunk_quads = 0
+        self._chunk_bytes = 0
+        chunk.flush()
+        chunk.seek(0)
+        self.chunks += 1
+        if self._executor is None:
+            self._publish(chunk)
+            return
+        while len(self._pending) >= self.max_pending:
+            self._pending.pop(0).result()
+        self._pending.append(self._executor.submit(self._publish, chunk))
+
+    def _publish(self, chunk):
+        try:
+            self.publish(chunk)
+        finally:
+            chunk.close()
+
+    def close(self):
+        '''Publishes the last chunk and waits for all uploads to finish.
+        Errors from any upload are raised here.'''
+        try:
+            self.flush()
+            while self._pending:
+                self._pending.pop(0).result()
+        finally:
+            self.abort()
+
+    def abort(self):
+        if self._chunk is not None:
+            self._chunk.close()
+            self._chunk = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self._pending = []
@@ -0,0 +1,109 @@
+# -*- coding:utf-8 -*-
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from rdflib.plugins.stores.sparqlstore import SPARQLStore
+
+from whyis.metrics import caller, current_caller
+
+__all__ = ["query_many", "configure_query_pool"]
+
+_options = {
+    'query_concurrency' : 8,
+}
+
+_pool = None
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def configure_query_pool(config):
+    '''Sets how many queries ``query_many`` runs at once, from the app
+    config. A pool that already exists is replaced.'''
+    global _pool
+    with _lock:
+        if 'query_concurrency' in config:
+            _options['query_concurrency'] = config['query_concurrency']
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+
+def _reset_pool():
+    # The threads of the pool do not survive a fork.
+    global _pool
+    _pool = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pool)
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None and _options['query_concurrency'] > 1:
+            _pool = ThreadPoolExecutor(max_workers=_options['query_concurrency'],
+                                       thread_name_prefix='whyis-query')
+        return _pool
+
+
+def _run(graph, args):
+    args = dict(args)
+    query = args.pop('query')
+    return list(graph.query(query, **args))
+
+
+def _run_in_worker(graph, args, tag, pinned):
+    _local.worker = True
+    store = graph.store
+    if pinned:
+        store.pin()
+    try:
+        with caller(tag):
+            return _run(graph, args)
+    finally:
+        if pinned:
+            store.unpin()
+
+
+def query_many(graph, queries, **kwargs):
+    '''Runs independent ``queries`` on ``graph`` at the same time, and
+    returns the rows of each, in the same order. Each query is either a
+    query string or a dict with a ``query`` and other keyword arguments
+    to ``graph.query()``, such as ``initBindings``. ``kwargs`` apply to
+    every query.
+
+    Only queries sent to a SPARQL endpoint run concurrently, since
+    threads do not speed up queries that rdflib evaluates itself. At most
+    ``query_concurrency`` queries from the whole process run at once.
+    Queries run from inside another ``query_many`` run one after
+    another, so that the pool can't be exhausted by its own callers. If
+    any query fails, the first failure is raised once they have all
+    finished.'''
+    entries = []
+    for query in queries:
+        args = dict(kwargs)
+        if isinstance(query, dict):
+            args.update(query)
+        else:
+            args['query'] = query
+        entries.append(args)
+
+    store = graph.store
+    # Updates buffered by this thread would not be seen by the others.
+    if hasattr(store, 'flush_updates'):
+        store.flush_updates()
+
+    pool = _get_pool()
+    if pool is None or len(entries) < 2 or getattr(_local, 'worker', False) \
+       or not isinstance(store, SPARQLStore):
+        return [_run(graph, args) for args in entries]
+
+    tag = current_caller()
+    pinned = getattr(store, 'pinned', False)
+    futures = [pool.submit(_run_in_worker, graph, args, tag, pinned) for args in entries]
+    wait(futures)
+    return [future.result() for future in futures]
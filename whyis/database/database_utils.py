@@ -1,18 +1,29 @@
 # -*- coding:utf-8 -*-
 
-import requests
+import gzip
+import shutil
+import tempfile
+from functools import partial
 from rdflib import BNode, URIRef
 from rdflib.graph import ConjunctiveGraph
 from rdflib.plugins.stores.sparqlstore import _node_to_sparql
 
 from uuid import uuid4
 from whyis.datastore import create_id
+from whyis.http_session import get_session
 
 # SPARQL_NS = Namespace('http://www.w3.org/2005/sparql-results#')
 
 
 from .whyis_sparql_store import WhyisSPARQLStore
 from .whyis_sparql_update_store import WhyisSPARQLUpdateStore
+from .blazegraph_bulk_loader import BlazeGraphBulkLoader
+from .result_cache import SPARQLResultCache
+from .single_flight import SingleFlight
+from .instrumented import sparql_timed
+from .replicas import ReplicaPool
+from .sqlite_store import SQLiteStore
+from .concurrent_queries import query_many
 
 def node_to_sparql(node):
     if isinstance(node, BNode):
@@ -33,6 +44,13 @@ def create_query_store(store):
                             node_to_sparql=node_to_sparql)
     return new_store
 
+def gzip_file(data):
+    compressed = tempfile.TemporaryFile()
+    with gzip.GzipFile(fileobj=compressed, mode='wb') as f:
+        shutil.copyfileobj(data, f)
+    compressed.seek(0)
+    return compressed
+
 # memory_graphs = collections.defaultdict(ConjunctiveGraph)
         
 def engine_from_config(config, prefix):
@@ -47,45 +65,55 @@ def engine_from_config(config, prefix):
                                   node_to_sparql=node_to_sparql)
         
         def publish(data):
-            s = requests.session()
-            s.keep_alive = False
-
-            if config.get(prefix+"useBlazeGraphBulkLoad",False):
-                prop_file = '''
-quiet=false
-verbose=1
-closure=false
-durableQueues=true
-#Needed for quads
-defaultGraph=%s
-format=text/x-nquads
-com.bigdata.rdf.store.DataLoader.flush=false
-com.bigdata.rdf.store.DataLoader.bufferCapacity=100000
-com.bigdata.rdf.store.DataLoader.queueCapacity=10
-#Namespace to load
-namespace=%s
-propertyFile=%s
-#Files to load
-fileOrDirs=%s''' % (config['lod_prefix']+'/pub/'+create_id()+"_assertion",
-                    config[prefix+"bulkLoadNamespace"],
-                    config[prefix+"BlazeGraphProperties"],
-                    data.name)
-                r = s.post(config[prefix+"bulkLoadEndpoint"],
-                           data=prop_file.encode('utf8'),
-                           headers={'Content-Type':'text/plain'})
+            s = get_session()
+            headers = {'Content-Type':'text/x-nquads'}
+            if config.get(prefix+"gzipPublish", False):
+                data = gzip_file(data)
+                headers['Content-Encoding'] = 'gzip'
+            r = s.post(store.primary_query_endpoint,
+                       data=data,
+                       # params={"context-uri":graph.identifier},
+                       headers=headers)
+            r.raise_for_status()
 
-                
-            else:
-                # result unused
-                r = s.post(store.query_endpoint,
-                           data=data,
-                           # params={"context-uri":graph.identifier},
-                           headers={'Content-Type':'text/x-nquads'})
-            #print(r.content)
+        if config.get(prefix+"useBlazeGraphBulkLoad",False):
+            publish = BlazeGraphBulkLoader(config, prefix)
+
+        def publish_and_invalidate(data):
+            # Buffered edits were made first, so they have to land first.
+            store.flush_updates()
+            with sparql_timed(store, 'publish'):
+                publish(data)
+            store.pin()
+            store.invalidate_results()
+        store.publish = publish_and_invalidate
+        store.metrics_name = prefix.rstrip('_')
 
-        store.publish = publish
+        if config.get(prefix+"queryEndpoints", None):
+            store.replicas = ReplicaPool(config[prefix+"queryEndpoints"],
+                                         balancing=config.get(prefix+"replicaBalancing", 'round_robin'),
+                                         max_failures=config.get(prefix+"replicaMaxFailures", 3),
+                                         eject_seconds=config.get(prefix+"replicaEjectSeconds", 30))
+            store.read_your_writes = config.get(prefix+"readYourWrites", False)
+        store.buffer_size = config.get(prefix+"updateBufferSize", store.buffer_size)
+
+        if config.get('sparql_cache', False):
+            store.result_cache = SPARQLResultCache(prefix.rstrip('_'),
+                                                   maxsize=config.get('sparql_cache_rows', 100000),
+                                                   ttl=config.get('sparql_cache_ttl', 300),
+                                                   shared=config.get('sparql_cache_redis', False))
+
+        if config.get('sparql_single_flight', False):
+            store.single_flight = SingleFlight(prefix.rstrip('_'),
+                                               shared=config.get('sparql_single_flight_redis', False),
+                                               timeout=config.get('sparql_single_flight_timeout', 30))
 
         graph = ConjunctiveGraph(store,defaultgraph)
+    elif prefix+"sqliteStore" in config:
+        store = SQLiteStore()
+        store.open(config[prefix+"sqliteStore"], create=True)
+        graph = ConjunctiveGraph(store, defaultgraph)
+        store.publish = store.load
     elif prefix+'store' in config:
         graph = ConjunctiveGraph(store='Sleepycat',identifier=defaultgraph)
         graph.store.batch_unification = False
@@ -98,5 +126,5 @@ fileOrDirs=%s''' % (config['lod_prefix']+'/pub/'+create_id()+"_assertion",
                 
         graph.store.publish = publish
 
-        
+    graph.query_many = partial(query_many, graph)
     return graph
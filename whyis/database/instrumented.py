@@ -0,0 +1,68 @@
+# -*- coding:utf-8 -*-
+
+import time
+
+from whyis.metrics import SIZE_BUCKETS, counter, current_caller, histogram, timed, REGISTRY
+
+__all__ = ["InstrumentedMixin"]
+
+_seconds = histogram('whyis_sparql_seconds', 'Time taken by requests to the triplestore.',
+                     ('store', 'operation', 'caller'))
+_rows = histogram('whyis_sparql_result_rows', 'Rows or triples returned by SPARQL queries.',
+                  ('store', 'caller'), buckets=SIZE_BUCKETS)
+_errors = counter('whyis_sparql_errors', 'Failed requests to the triplestore.',
+                  ('store', 'operation', 'caller'))
+
+
+def sparql_timed(store, operation):
+    '''Times a request to the triplestore behind ``store``.'''
+    return timed(_seconds, _errors, store=getattr(store, 'metrics_name', 'sparql'),
+                 operation=operation, caller=current_caller())
+
+
+def _result_size(result):
+    if result.type in ('CONSTRUCT', 'DESCRIBE'):
+        return len(result.graph)
+    if result.type == 'SELECT':
+        return len(result.bindings)
+    return 1
+
+
+class InstrumentedMixin(object):
+    '''Records the time taken, size and failures of the queries a SPARQL
+    store sends, tagged with the current caller, and adds queries to
+    ``query_log`` if it is set. Updates and publishes
+    are timed with ``sparql_timed()`` where they are sent.'''
+
+    metrics_name = 'sparql'
+    query_log = None
+
+    def _query(self, query, default_graph=None):
+        start = time.time()
+        try:
+            with sparql_timed(self, 'query'):
+                result = super(InstrumentedMixin, self)._query(query, default_graph=default_graph)
+        finally:
+            if self.query_log is not None:
+                self.query_log.record(query, time.time() - start, current_caller())
+        _rows.observe(_result_size(result), store=self.metrics_name, caller=current_caller())
+        return result
+
+    def query_stream(self, query, *args, **kwargs):
+        caller = current_caller()
+        rows = 0
+        start = time.time()
+        try:
+            for row in super(InstrumentedMixin, self).query_stream(query, *args, **kwargs):
+                rows += 1
+                yield row
+        except Exception:
+            _errors.inc(store=self.metrics_name, operation='stream', caller=caller)
+            raise
+        finally:
+            # Includes the time the caller takes between rows.
+            _seconds.observe(time.time() - start, store=self.metrics_name, operation='stream', caller=caller)
+            _rows.observe(rows, store=self.metrics_name, caller=caller)
+            REGISTRY.changed()
+            if self.query_log is not None:
+                self.query_log.record(query, time.time() - start, caller)
@@ -0,0 +1,184 @@
+# -*- coding:utf-8 -*-
+
+import collections
+import hashlib
+import re
+import threading
+import time
+
+__all__ = ["QueryLog", "fingerprint"]
+
+_prologue = re.compile(r'^\s*(PREFIX\s+[^\s:]*:\s*<[^>]*>|BASE\s*<[^>]*>)', re.IGNORECASE | re.MULTILINE)
+_tokens = re.compile(r'''
+    (?P<iri><[^<>"{}|^`\\\s]*>)
+  | (?P<literal>(?:"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^'\\]|\\.|'(?!''))*\'\'\'
+                 |"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+                (?:@[a-zA-Z][a-zA-Z0-9\-]*|\^\^(?:<[^>]*>|[\w\-.]*:[\w\-.]*))?)
+  | (?P<comment>\#[^\n]*)
+  | (?P<number>(?<![\w?$:.\-])[+\-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+\-]?\d+)?(?![\w:]))
+''', re.VERBOSE)
+_rows = re.compile(r'\(\s*(?:\?\s*)+\)(?:\s*\(\s*(?:\?\s*)+\))+')
+_list = re.compile(r'\?(?:\s*,\s*\?)+')
+_block = re.compile(r'\{\s*\?(?:\s+\?)+\s*\}')
+_space = re.compile(r'\s+')
+
+
+def _token(match):
+    if match.group('comment') is not None:
+        return ' '
+    return '?'
+
+
+def fingerprint(query):
+    '''Normalizes ``query`` so that queries that differ only in the IRIs
+    and literals they are given, or in how many of them, are the same.
+    Prefix declarations and comments are dropped, IRIs, literals and
+    numbers are replaced with ``?``, and lists of them are collapsed.'''
+    query = _prologue.sub('', query)
+    query = _tokens.sub(_token, query)
+    query = _rows.sub(lambda m: m.group(0)[:m.group(0).index(')') + 1], query)
+    query = _list.sub('?', query)
+    query = _block.sub('{ ? }', query)
+    return _space.sub(' ', query).strip()
+
+
+def _percentile(times, p):
+    if not times:
+        return None
+    times = sorted(times)
+    return times[min(len(times) - 1, int(p * len(times)))]
+
+
+class QueryLog(object):
+    '''Aggregates the time taken by queries slower than ``threshold``
+    seconds by their fingerprint: how often they ran, their total time,
+    their most recent ``samples`` timings, and the text and caller of the
+    slowest one.
+
+    With ``redis``, aggregates are added to Redis every ``interval``
+    seconds, so that all processes share one log. Otherwise they are only
+    kept in this process.'''
+
+    key = "slowqueries"
+
+    def __init__(self, redis=None, threshold=0, interval=10, samples=1000):
+        self.redis = redis
+        self.threshold = threshold
+        self.interval = interval
+        self.samples = samples
+        self._entries = {}
+        self._pending = {}
+        self._flushed = time.time()
+        self._lock = threading.Lock()
+
+    def _new_entry(self, fingerprint):
+        return {
+            'fingerprint' : fingerprint,
+            'count' : 0,
+            'total' : 0.0,
+            'max' : 0.0,
+            'sample' : None,
+            'caller' : None,
+            'times' : collections.deque(maxlen=self.samples),
+        }
+
+    def record(self, query, seconds, caller=None):
+        if seconds < self.threshold:
+            return
+        text = fingerprint(query)
+        id = hashlib.sha1(text.encode('utf8')).hexdigest()
+        entries = self._pending if self.redis is not None else self._entries
+        with self._lock:
+            entry = entries.get(id)
+            if entry is None:
+                entry = entries[id] = self._new_entry(text)
+            entry['count'] += 1
+            entry['total'] += seconds
+            entry['times'].append(seconds)
+            if seconds >= entry['max']:
+                entry['max'] = seconds
+                entry['sample'] = query
+                entry['caller'] = caller
+        if self.redis is not None and time.time() - self._flushed >= self.interval:
+            self.flush()
+
+    def _entry_key(self, id):
+        return "slowquery__" + id
+
+    def flush(self):
+        '''Adds the aggregates collected since the last flush to Redis.'''
+        if self.redis is None:
+            return
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+            self._flushed = time.time()
+        if not pending:
+            return
+        ids = list(pending)
+        maxima = self.redis.pipeline()
+        for id in ids:
+            maxima.hget(self._entry_key(id), 'max')
+        maxima = maxima.execute()
+        pipe = self.redis.pipeline()
+        for id, current in zip(ids, maxima):
+            entry = pending[id]
+            key = self._entry_key(id)
+            pipe.hset(key, 'fingerprint', entry['fingerprint'])
+            pipe.hincrby(key, 'count', entry['count'])
+            pipe.hincrbyfloat(key, 'total', entry['total'])
+            if current is None or entry['max'] >= float(current):
+                pipe.hset(key, 'max', entry['max'])
+                pipe.hset(key, 'sample', entry['sample'])
+                pipe.hset(key, 'caller', entry['caller'] or '')
+            pipe.rpush(key + '__times', *entry['times'])
+            pipe.ltrim(key + '__times', -self.samples, -1)
+            pipe.zincrby(self.key, entry['total'], id)
+        pipe.execute()
+
+    def _load(self):
+        if self.redis is None:
+            with self._lock:
+                return [dict(entry, times=list(entry['times'])) for entry in self._entries.values()]
+        ids = [x.decode('utf8') if isinstance(x, bytes) else x for x in self.redis.zrange(self.key, 0, -1)]
+        pipe = self.redis.pipeline()
+        for id in ids:
+            pipe.hgetall(self._entry_key(id))
+            pipe.lrange(self._entry_key(id) + '__times', 0, -1)
+        results = pipe.execute()
+        entries = []
+        for i in range(0, len(results), 2):
+            fields = dict((k.decode('utf8'), v.decode('utf8')) for k, v in results[i].items())
+            if not fields:
+                continue
+            entries.append({
+                'fingerprint' : fields.get('fingerprint'),
+                'count' : int(fields.get('count', 0)),
+                'total' : float(fields.get('total', 0)),
+                'max' : float(fields.get('max', 0)),
+                'sample' : fields.get('sample'),
+                'caller' : fields.get('caller') or None,
+                'times' : [float(x) for x in results[i + 1]],
+            })
+        return entries
+
+    def top(self, limit=20, sort='total'):
+        '''Returns the ``limit`` fingerprints with the highest ``sort``,
+        which is one of total, count, max, p50 or p99.'''
+        self.flush()
+        entries = self._load()
+        for entry in entries:
+            entry['p50'] = _percentile(entry['times'], 0.5)
+            entry['p99'] = _percentile(entry['times'], 0.99)
+            del entry['times']
+        entries.sort(key=lambda entry: entry[sort] or 0, reverse=True)
+        return entries[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._entries = {}
+            self._pending = {}
+        if self.redis is not None:
+            ids = [x.decode('utf8') if isinstance(x, bytes) else x for x in self.redis.zrange(self.key, 0, -1)]
+            keys = [self._entry_key(id) for id in ids] + [self._entry_key(id) + '__times' for id in ids]
+            self.redis.delete(self.key, *keys)
@@ -0,0 +1,207 @@
+# -*- coding:utf-8 -*-
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+from whyis.metrics import counter
+
+__all__ = ["ReplicaPool", "ReplicaMixin"]
+
+_ejections = counter('whyis_sparql_replica_ejections', 'Times a query replica was taken out of rotation.',
+                     ('endpoint',))
+
+_end = object()
+
+
+def _is_failure(error):
+    '''Only errors that say something about the replica count against
+    it, not bad queries.'''
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, requests.HTTPError):
+        response = error.response
+        return response is None or response.status_code >= 500
+    return False
+
+
+class ReplicaPool(object):
+    '''Spreads reads across several query endpoints.
+
+    ``balancing`` is either ``round_robin`` or ``least_outstanding``. An
+    endpoint that fails ``max_failures`` times in a row is left out for
+    ``eject_seconds``, and then tried again. If every endpoint is left
+    out, ``choose()`` returns None.'''
+
+    def __init__(self, endpoints, balancing='round_robin', max_failures=3, eject_seconds=30):
+        if balancing not in ('round_robin', 'least_outstanding'):
+            raise ValueError("Unknown replica balancing: %s" % balancing)
+        self.endpoints = list(endpoints)
+        self.balancing = balancing
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.outstanding = dict((e, 0) for e in self.endpoints)
+        self.failures = dict((e, 0) for e in self.endpoints)
+        self.ejected = {}
+        self._next = itertools.cycle(range(len(self.endpoints)))
+        self._lock = threading.Lock()
+
+    def healthy(self):
+        now = time.time()
+        with self._lock:
+            for endpoint, until in list(self.ejected.items()):
+                if until <= now:
+                    # Give it another chance. One more failure ejects it again.
+                    del self.ejected[endpoint]
+                    self.failures[endpoint] = self.max_failures - 1
+            return [e for e in self.endpoints if e not in self.ejected]
+
+    def choose(self, exclude=()):
+        candidates = [e for e in self.healthy() if e not in exclude]
+        if not candidates:
+            return None
+        with self._lock:
+            if self.balancing == 'least_outstanding':
+                endpoint = min(candidates, key=lambda e: self.outstanding[e])
+            else:
+                for i in range(len(self.endpoints)):
+                    endpoint = self.endpoints[next(self._next)]
+                    if endpoint in candidates:
+                        break
+            self.outstanding[endpoint] += 1
+        return endpoint
+
+    def release(self, endpoint, error=None):
+        with self._lock:
+            self.outstanding[endpoint] -= 1
+            if error is None or not _is_failure(error):
+                self.failures[endpoint] = 0
+                return
+            self.failures[endpoint] += 1
+            if self.failures[endpoint] < self.max_failures or endpoint in self.ejected:
+                return
+            self.ejected[endpoint] = time.time() + self.eject_seconds
+        _ejections.inc(endpoint=endpoint)
+
+    def stats(self):
+        healthy = self.healthy()
+        with self._lock:
+            return dict((e, {
+                'healthy' : e in healthy,
+                'outstanding' : self.outstanding[e],
+                'failures' : self.failures[e],
+            }) for e in self.endpoints)
+
+
+class ReplicaMixin(object):
+    '''Sends reads to the endpoints of ``replicas``, a ``ReplicaPool``,
+    if it is set. Updates and publishes still go to the primary, and so
+    do reads when every replica is out of rotation. Reads that fail to
+    connect are retried on another replica.
+
+    With ``read_your_writes``, a thread that has written reads from the
+    primary until ``unpin()`` is called, which happens at the start of
+    every request and task.'''
+
+    replicas = None
+    read_your_writes = False
+
+    @property
+    def _replica_local(self):
+        return self.__dict__.setdefault('_replica_local_', threading.local())
+
+    @property
+    def query_endpoint(self):
+        return getattr(self._replica_local, 'endpoint', None) or self.__dict__.get('_query_endpoint')
+
+    @query_endpoint.setter
+    def query_endpoint(self, endpoint):
+        self.__dict__['_query_endpoint'] = endpoint
+
+    @property
+    def primary_query_endpoint(self):
+        return self.__dict__.get('_query_endpoint')
+
+    def pin(self):
+        if self.read_your_writes:
+            self._replica_local.pinned = True
+
+    def unpin(self):
+        self._replica_local.pinned = False
+
+    @property
+    def pinned(self):
+        return getattr(self._replica_local, 'pinned', False)
+
+    def _use_replicas(self):
+        return self.replicas is not None and not self.pinned
+
+    @contextmanager
+    def read_endpoint(self):
+        '''Chooses the endpoint for a read sent by other means than the
+        store, such as the SPARQL proxy, and records how it went.'''
+        endpoint = self._use_replicas() and self.replicas.choose() or None
+        if endpoint is None:
+            yield self.primary_query_endpoint
+            return
+        try:
+            yield endpoint
+        except Exception as e:
+            self.replicas.release(endpoint, e)
+            raise
+        self.replicas.release(endpoint)
+
+    def _query(self, query, default_graph=None):
+        if not self._use_replicas():
+            return super(ReplicaMixin, self)._query(query, default_graph=default_graph)
+        tried = []
+        while True:
+            endpoint = self.replicas.choose(exclude=tried)
+            if endpoint is None:
+                return super(ReplicaMixin, self)._query(query, default_graph=default_graph)
+            tried.append(endpoint)
+            self._replica_local.endpoint = endpoint
+            try:
+                result = super(ReplicaMixin, self)._query(query, default_graph=default_graph)
+            except Exception as e:
+                self.replicas.release(endpoint, e)
+                if isinstance(e, requests.ConnectionError):
+                    continue
+                raise
+            finally:
+                self._replica_local.endpoint = None
+            self.replicas.release(endpoint)
+            return result
+
+    def query_stream(self, *args, **kwargs):
+        if not self._use_replicas():
+            for row in super(ReplicaMixin, self).query_stream(*args, **kwargs):
+                yield row
+            return
+        endpoint = self.replicas.choose()
+        if endpoint is None:
+            for row in super(ReplicaMixin, self).query_stream(*args, **kwargs):
+                yield row
+            return
+        try:
+            # The request is sent when the first row is asked for.
+            self._replica_local.endpoint = endpoint
+            try:
+                rows = super(ReplicaMixin, self).query_stream(*args, **kwargs)
+                first = next(rows, _end)
+            finally:
+                self._replica_local.endpoint = None
+            if first is not _end:
+                yield first
+                for row in rows:
+                    yield row
+        except Exception as e:
+            self.replicas.release(endpoint, e)
+            raise
+        except GeneratorExit:
+            self.replicas.release(endpoint)
+            raise
+        self.replicas.release(endpoint)
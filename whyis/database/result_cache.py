@@ -0,0 +1,230 @@
+# -*- coding:utf-8 -*-
+
+import hashlib
+import re
+import threading
+import time
+from contextlib import contextmanager
+from io import BytesIO
+
+import rdflib
+from rdflib.query import Result
+
+from whyis.cache import LRUCache
+
+__all__ = ["SPARQLResultCache", "ResultCacheMixin", "uncached"]
+
+# Per-query settings, given as a comment in the query text:
+#   # whyis:cache off
+#   # whyis:cache ttl=60
+_pragma = re.compile(r'#\s*whyis:cache\s+(off|ttl\s*=\s*(\d+))', re.IGNORECASE)
+
+
+def _result_size(result):
+    if result.type in ('CONSTRUCT', 'DESCRIBE'):
+        return len(result.graph) + 1
+    if result.type == 'SELECT':
+        return len(result.bindings) + 1
+    return 1
+
+
+def _copy_result(result):
+    '''Results are handed out as copies, so callers can't change what is
+    cached.'''
+    copy = Result(result.type)
+    copy.vars = result.vars
+    copy.askAnswer = result.askAnswer
+    if result.type in ('CONSTRUCT', 'DESCRIBE'):
+        copy.graph = rdflib.Graph()
+        for triple in result.graph:
+            copy.graph.add(triple)
+    elif result.type == 'SELECT':
+        copy.bindings = [dict(b) for b in result.bindings]
+    return copy
+
+
+def _dump_result(result):
+    if result.type in ('CONSTRUCT', 'DESCRIBE'):
+        payload = result.graph.serialize(format='nt')
+    else:
+        payload = result.serialize(format='json')
+    return result.type.encode('utf8') + b'\n' + payload
+
+
+def _load_result(data):
+    type_, payload = data.split(b'\n', 1)
+    type_ = type_.decode('utf8')
+    if type_ in ('CONSTRUCT', 'DESCRIBE'):
+        result = Result(type_)
+        result.graph = rdflib.Graph()
+        result.graph.parse(data=payload.decode('utf8'), format='nt')
+        return result
+    return Result.parse(BytesIO(payload), format='json')
+
+
+class SPARQLResultCache(object):
+    '''Caches query results by query text, under a generation number that
+    every write to the store increments.
+
+    Entries live in an in-process LRU cache bounded by the number of
+    result rows, and expire after ``ttl`` seconds. If ``redis`` is set,
+    the generation number is kept there, so writes from any process
+    invalidate every process's cache, and with ``shared`` the results
+    themselves are stored there too.'''
+
+    def __init__(self, name, maxsize=100000, ttl=300, redis=None, shared=False):
+        self.name = name
+        self.ttl = ttl
+        self.redis = redis
+        self.shared = shared
+        self.cache = LRUCache(maxsize, getsizeof=lambda entry: _result_size(entry[0]))
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.redis_hits = 0
+
+    @property
+    def redis(self):
+        return self._redis
+
+    @redis.setter
+    def redis(self, redis):
+        # Generations are numbered separately in Redis.
+        self._redis = redis
+        if hasattr(self, 'cache'):
+            self.cache.clear()
+
+    @property
+    def _generation_key(self):
+        return "sparql__generation__" + self.name
+
+    def generation(self):
+        if self.redis is not None:
+            return int(self.redis.get(self._generation_key) or 0)
+        return self._generation
+
+    def invalidate(self):
+        self._generation += 1
+        if self.redis is not None:
+            self.redis.incr(self._generation_key)
+
+    def _key(self, generation, query, default_graph):
+        text = '%s\n%s' % (default_graph, query.strip())
+        return "sparql__%s__%s__%s" % (self.name, generation, hashlib.sha1(text.encode('utf8')).hexdigest())
+
+    def get(self, query, default_graph=None, ttl=None, generation=None):
+        '''Returns a copy of the cached result of ``query``, or None.'''
+        if ttl is None:
+            ttl = self.ttl
+        if generation is None:
+            generation = self.generation()
+        key = self._key(generation, query, default_graph)
+        entry = self.cache.get(key)
+        if entry is not None and time.time() - entry[1] <= ttl:
+            self.hits += 1
+            return _copy_result(entry[0])
+        if self.shared and self.redis is not None:
+            data = self.redis.get(key)
+            if data is not None:
+                self.hits += 1
+                self.redis_hits += 1
+                result = _load_result(data)
+                self.cache.set(key, (result, time.time()))
+                return _copy_result(result)
+        self.misses += 1
+        return None
+
+    def set(self, query, result, default_graph=None, ttl=None, generation=None):
+        if ttl is None:
+            ttl = self.ttl
+        if generation is None:
+            generation = self.generation()
+        if result.type == 'SELECT':
+            # Results can be backed by a generator, so read them all now.
+            result.bindings
+        key = self._key(generation, query, default_graph)
+        self.cache.set(key, (result, time.time()))
+        if self.shared and self.redis is not None:
+            self.redis.set(key, _dump_result(result), ex=ttl)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'redis_hits' : self.redis_hits,
+            'hit_rate' : float(self.hits) / total if total > 0 else None,
+            'entries' : len(self.cache),
+            'rows' : self.cache.currsize,
+            'generation' : self.generation(),
+        }
+
+
+class ResultCacheMixin(object):
+    '''Adds a result cache to SPARQL stores. Only calls to ``query()``
+    are cached, and writes through the store invalidate the cache.'''
+
+    result_cache = None
+
+    @property
+    def _cache_local(self):
+        return self.__dict__.setdefault('_cache_local_', threading.local())
+
+    @contextmanager
+    def uncached(self):
+        '''Runs queries in this thread without the result cache.'''
+        previous = getattr(self._cache_local, 'bypass', False)
+        self._cache_local.bypass = True
+        try:
+            yield
+        finally:
+            self._cache_local.bypass = previous
+
+    def invalidate_results(self):
+        if self.result_cache is not None:
+            self.result_cache.invalidate()
+
+    def query(self, query, initNs={}, initBindings={}, queryGraph=None, DEBUG=False):
+        options = None
+        if self.result_cache is not None and not getattr(self._cache_local, 'bypass', False):
+            options = {'ttl' : None}
+            pragma = _pragma.search(query) if isinstance(query, str) else None
+            if pragma is not None:
+                if pragma.group(1).lower() == 'off':
+                    options = None
+                else:
+                    options['ttl'] = int(pragma.group(2))
+        self._cache_local.options = options
+        try:
+            return super(ResultCacheMixin, self).query(query, initNs=initNs, initBindings=initBindings,
+                                                       queryGraph=queryGraph, DEBUG=DEBUG)
+        finally:
+            self._cache_local.options = None
+
+    def _query(self, query, default_graph=None):
+        options = getattr(self._cache_local, 'options', None)
+        # Only queries that come through query() are cached.
+        self._cache_local.options = None
+        if options is None:
+            return super(ResultCacheMixin, self)._query(query, default_graph=default_graph)
+        cache = self.result_cache
+        # The generation is read before querying, so a result that races
+        # with a write is stored under the generation the write retires.
+        generation = cache.generation()
+        result = cache.get(query, default_graph, ttl=options['ttl'], generation=generation)
+        if result is not None:
+            return result
+        result = super(ResultCacheMixin, self)._query(query, default_graph=default_graph)
+        cache.set(query, result, default_graph, ttl=options['ttl'], generation=generation)
+        return _copy_result(result)
+
+
+@contextmanager
+def uncached(store):
+    '''Runs queries against ``store`` in this thread without its result
+    cache, if it has one.'''
+    if hasattr(store, 'uncached'):
+        with store.uncached():
+            yield
+    else:
+        yield
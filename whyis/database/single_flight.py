@@ -0,0 +1,128 @@
+# -*- coding:utf-8 -*-
+
+import hashlib
+import threading
+import time
+from uuid import uuid4
+
+from whyis.metrics import counter
+
+from .result_cache import _copy_result, _dump_result, _load_result
+
+__all__ = ["SingleFlight", "SingleFlightMixin"]
+
+_deduplicated = counter('whyis_sparql_deduplicated', 'Queries answered by an identical query already in flight.',
+                        ('store', 'scope'))
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.followers = 0
+
+
+class SingleFlight(object):
+    '''Runs identical queries once at a time. A query sent while the same
+    query, with the same bindings and default graph, is already running
+    waits for that query's result instead of being sent again.
+
+    If ``redis`` is set and ``shared`` is true, the running query is also
+    claimed with a lock in Redis, and other processes wait up to
+    ``timeout`` seconds for its result, checking every ``poll`` seconds.'''
+
+    def __init__(self, name, redis=None, shared=False, timeout=30, poll=0.05):
+        self.name = name
+        self.redis = redis
+        self.shared = shared
+        self.timeout = timeout
+        self.poll = poll
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _key(self, query, default_graph):
+        text = '%s\n%s' % (default_graph, query.strip())
+        return "sparql__flight__%s__%s" % (self.name, hashlib.sha1(text.encode('utf8')).hexdigest())
+
+    def run(self, query, default_graph, fn):
+        '''Returns the result of ``fn()``, which sends ``query``, or of the
+        identical query that is already running.'''
+        key = self._key(query, default_graph)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                flight.followers += 1
+        if not leader:
+            _deduplicated.inc(store=self.name, scope='process')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return _copy_result(flight.result)
+
+        try:
+            if self.shared and self.redis is not None:
+                result = self._run_shared(key, fn)
+            else:
+                result = fn()
+            if result.type == 'SELECT':
+                # Results can be backed by a generator, so read them all now.
+                result.bindings
+            flight.result = result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        # Nobody can join the flight once it is removed.
+        if flight.followers > 0:
+            return _copy_result(result)
+        return result
+
+    def _run_shared(self, key, fn):
+        token = uuid4().hex
+        if self.redis.set(key, token, nx=True, ex=self.timeout):
+            try:
+                result = fn()
+                # Waiters look for the result of this run only, and fetch
+                # it within a poll or two.
+                self.redis.set(key + '__' + token, _dump_result(result), ex=max(5, int(self.poll * 100)))
+                return result
+            finally:
+                current = self.redis.get(key)
+                if current is not None and current.decode('utf8') == token:
+                    self.redis.delete(key)
+
+        running = self.redis.get(key)
+        deadline = time.time() + self.timeout
+        while running is not None and time.time() < deadline:
+            data = self.redis.get(key + '__' + running.decode('utf8'))
+            if data is not None:
+                _deduplicated.inc(store=self.name, scope='redis')
+                return _load_result(data)
+            if self.redis.get(key) != running:
+                # The other process failed, or gave up.
+                break
+            time.sleep(self.poll)
+        return fn()
+
+
+class SingleFlightMixin(object):
+    '''Sends identical concurrent queries to the triplestore once, through
+    ``single_flight``, a ``SingleFlight``, if it is set. Threads that have
+    written, and so read from the primary, always send their own
+    queries, since a query in flight may not see their writes.'''
+
+    single_flight = None
+
+    def _query(self, query, default_graph=None):
+        if self.single_flight is None or getattr(self, 'pinned', False):
+            return super(SingleFlightMixin, self)._query(query, default_graph=default_graph)
+        return self.single_flight.run(query, default_graph,
+                                      lambda: super(SingleFlightMixin, self)._query(query, default_graph=default_graph))
@@ -0,0 +1,363 @@
+# -*- coding:utf-8 -*-
+
+import os
+import sqlite3
+import threading
+from uuid import uuid4
+
+from rdflib import BNode, ConjunctiveGraph, Literal, URIRef
+from rdflib.graph import Graph
+from rdflib.store import NO_STORE, VALID_STORE, Store
+
+from whyis.cache import LRUCache
+
+__all__ = ["SQLiteStore"]
+
+DEFAULT_GRAPH = URIRef('urn:x-rdflib:default')
+
+_schema = [
+    "CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, key TEXT NOT NULL UNIQUE)",
+    # The primary key is the SPOG index, and the other three cover every
+    # other combination of bound positions.
+    "CREATE TABLE IF NOT EXISTS quads (s INTEGER NOT NULL, p INTEGER NOT NULL, o INTEGER NOT NULL,"
+    " g INTEGER NOT NULL, PRIMARY KEY (s, p, o, g)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS quads_posg ON quads (p, o, s, g)",
+    "CREATE INDEX IF NOT EXISTS quads_ospg ON quads (o, s, p, g)",
+    "CREATE INDEX IF NOT EXISTS quads_gspo ON quads (g, s, p, o)",
+    "CREATE TABLE IF NOT EXISTS graphs (id INTEGER PRIMARY KEY)",
+    "CREATE TABLE IF NOT EXISTS namespaces (prefix TEXT PRIMARY KEY, uri TEXT NOT NULL)",
+]
+
+# SQLite limits the number of parameters in a statement.
+_batch = 500
+
+
+def _encode(term):
+    if isinstance(term, Literal):
+        return 'L%s\x1f%s\x1f%s' % (term.language or '', term.datatype or '', term)
+    if isinstance(term, BNode):
+        return 'B' + str(term)
+    if isinstance(term, URIRef):
+        return 'U' + str(term)
+    raise TypeError("Cannot store %r" % (term,))
+
+
+def _decode(key):
+    kind, value = key[0], key[1:]
+    if kind == 'U':
+        return URIRef(value)
+    if kind == 'B':
+        return BNode(value)
+    lang, datatype, value = value.split('\x1f', 2)
+    return Literal(value, lang=lang or None, datatype=datatype and URIRef(datatype) or None)
+
+
+class SQLiteStore(Store):
+    '''A persistent, context-aware rdflib store in an SQLite database.
+
+    Terms are stored once in a term table, and quads as four term ids,
+    with an index for each of the SPOG, POSG, OSPG and GSPO orderings so
+    that any triple pattern can be answered from an index. Every write
+    is committed when it returns. ``load()`` adds a file of N-Quads in a
+    single transaction, and is used to publish.
+
+    Each thread gets its own connection. The database is opened in WAL
+    mode, so reads go on while another thread writes.'''
+
+    context_aware = True
+    formula_aware = False
+    graph_aware = True
+    transaction_aware = False
+
+    def __init__(self, configuration=None, identifier=None, cache_size=100000):
+        self.identifier = identifier
+        self._ids = LRUCache(cache_size)
+        self._terms = LRUCache(cache_size)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._path = None
+        self._keeper = None
+        Store.__init__(self, configuration)
+
+    def open(self, configuration, create=False):
+        if configuration == ':memory:':
+            # Connections from several threads only share an in-memory
+            # database through a named shared cache, which lasts as long
+            # as one connection to it is open.
+            self._path = 'file:whyis-%s?mode=memory&cache=shared' % uuid4().hex
+            self._keeper = self._connect()
+        else:
+            if not create and not os.path.exists(configuration):
+                return NO_STORE
+            self._path = configuration
+        connection = self._connection()
+        for statement in _schema:
+            connection.execute(statement)
+        connection.commit()
+        return VALID_STORE
+
+    def _connect(self):
+        connection = sqlite3.connect(self._path, timeout=30, uri=self._path.startswith('file:'),
+                                     check_same_thread=False)
+        if not self._path.startswith('file:'):
+            connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        with self._lock:
+            self._connections.append(connection)
+        return connection
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            if self._path is None:
+                raise ValueError("The store is not open.")
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def close(self, commit_pending_transaction=False):
+        with self._lock:
+            connections = self._connections
+            self._connections = []
+        for connection in connections:
+            if commit_pending_transaction:
+                connection.commit()
+            connection.close()
+        self._local = threading.local()
+        self._keeper = None
+
+    def destroy(self, configuration):
+        self.close()
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(configuration + suffix):
+                os.remove(configuration + suffix)
+
+    def commit(self):
+        self._connection().commit()
+
+    def rollback(self):
+        self._connection().rollback()
+        # Ids of terms added in the transaction are gone too.
+        self._ids.clear()
+
+    # Terms
+
+    def _term_id(self, term):
+        '''Returns the id of ``term``, or None if it is not stored.'''
+        key = _encode(term)
+        id = self._ids.get(key)
+        if id is None:
+            row = self._connection().execute("SELECT id FROM terms WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            id = row[0]
+            self._ids.set(key, id)
+        return id
+
+    def _term_ids(self, terms):
+        '''Returns a dict of the ids of ``terms``, adding any that are
+        not stored yet.'''
+        connection = self._connection()
+        ids = {}
+        missing = set()
+        for term in terms:
+            key = _encode(term)
+            id = self._ids.get(key)
+            if id is None:
+                missing.add(key)
+            ids[term] = key if id is None else id
+        missing = list(missing)
+        found = {}
+        for i in range(0, len(missing), _batch):
+            batch = missing[i:i + _batch]
+            connection.executemany("INSERT OR IGNORE INTO terms (key) VALUES (?)", [(key,) for key in batch])
+            rows = connection.execute("SELECT key, id FROM terms WHERE key IN (%s)" % ','.join('?' * len(batch)),
+                                      batch)
+            for key, id in rows:
+                found[key] = id
+                self._ids.set(key, id)
+        for term, id in list(ids.items()):
+            if not isinstance(id, int):
+                ids[term] = found[id]
+        return ids
+
+    def _decode_ids(self, ids):
+        terms = {}
+        missing = []
+        for id in set(ids):
+            term = self._terms.get(id)
+            if term is None:
+                missing.append(id)
+            else:
+                terms[id] = term
+        connection = self._connection()
+        for i in range(0, len(missing), _batch):
+            batch = missing[i:i + _batch]
+            for id, key in connection.execute("SELECT id, key FROM terms WHERE id IN (%s)" % ','.join('?' * len(batch)),
+                                              batch):
+                term = _decode(key)
+                terms[id] = term
+                self._terms.set(id, term)
+        return terms
+
+    def _graph_term(self, context):
+        if context is None:
+            return None
+        identifier = getattr(context, 'identifier', context)
+        if isinstance(context, ConjunctiveGraph) and context.store is self:
+            # The whole dataset.
+            return None
+        return identifier
+
+    def _pattern(self, triple, context):
+        '''Returns the SQL conditions and parameters that match a triple
+        pattern in a context, or None if nothing can match.'''
+        conditions = []
+        params = []
+        graph = self._graph_term(context)
+        for column, term in zip('spog', list(triple) + [graph]):
+            if term is None:
+                continue
+            id = self._term_id(term)
+            if id is None:
+                return None
+            conditions.append('%s = ?' % column)
+            params.append(id)
+        where = conditions and ' WHERE ' + ' AND '.join(conditions) or ''
+        return where, params
+
+    # RDF APIs
+
+    def add(self, triple, context, quoted=False):
+        assert not quoted, "SQLiteStore is not formula aware."
+        self.addN([tuple(triple) + (context,)])
+
+    def addN(self, quads):
+        connection = self._connection()
+        batch = []
+        try:
+            for quad in quads:
+                batch.append(quad)
+                if len(batch) >= 10000:
+                    self._insert(connection, batch)
+                    batch = []
+            self._insert(connection, batch)
+        except:
+            self.rollback()
+            raise
+        connection.commit()
+
+    def _insert(self, connection, quads):
+        if not quads:
+            return
+        graphs = [self._graph_term(c) or DEFAULT_GRAPH for s, p, o, c in quads]
+        terms = set(graphs)
+        for s, p, o, c in quads:
+            terms.update((s, p, o))
+        ids = self._term_ids(terms)
+        rows = [(ids[s], ids[p], ids[o], ids[g]) for (s, p, o, c), g in zip(quads, graphs)]
+        connection.executemany("INSERT OR IGNORE INTO quads (s, p, o, g) VALUES (?, ?, ?, ?)", rows)
+
+    def load(self, data, format='nquads'):
+        '''Adds the quads in the file object ``data`` in one transaction.'''
+        graph = ConjunctiveGraph()
+        graph.parse(data, format=format)
+        self.addN(graph.quads())
+
+    def remove(self, triple, context=None):
+        pattern = self._pattern(triple, context)
+        if pattern is None:
+            return
+        where, params = pattern
+        connection = self._connection()
+        connection.execute("DELETE FROM quads" + where, params)
+        connection.commit()
+
+    def triples(self, triple, context=None):
+        pattern = self._pattern(triple, context)
+        if pattern is None:
+            return
+        where, params = pattern
+        graph = self._graph_term(context)
+        if graph is not None:
+            cursor = self._connection().execute("SELECT s, p, o FROM quads" + where, params)
+        else:
+            cursor = self._connection().execute(
+                "SELECT s, p, o, group_concat(g) FROM quads%s GROUP BY s, p, o" % where, params)
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            ids = []
+            for row in rows:
+                ids.extend(row[:3])
+                if graph is None:
+                    row_graphs = [int(g) for g in row[3].split(',')]
+                    ids.extend(row_graphs)
+            terms = self._decode_ids(ids)
+            for row in rows:
+                spo = (terms[row[0]], terms[row[1]], terms[row[2]])
+                if graph is not None:
+                    yield spo, iter([context])
+                else:
+                    yield spo, iter([Graph(store=self, identifier=terms[int(g)]) for g in row[3].split(',')])
+
+    def __len__(self, context=None):
+        graph = self._graph_term(context)
+        connection = self._connection()
+        if graph is None:
+            return connection.execute("SELECT count(*) FROM (SELECT DISTINCT s, p, o FROM quads)").fetchone()[0]
+        id = self._term_id(graph)
+        if id is None:
+            return 0
+        return connection.execute("SELECT count(*) FROM quads WHERE g = ?", (id,)).fetchone()[0]
+
+    def contexts(self, triple=None):
+        connection = self._connection()
+        if triple is None or triple == (None, None, None):
+            cursor = connection.execute("SELECT id FROM graphs UNION SELECT DISTINCT g FROM quads")
+        else:
+            pattern = self._pattern(triple, None)
+            if pattern is None:
+                return
+            where, params = pattern
+            cursor = connection.execute("SELECT DISTINCT g FROM quads" + where, params)
+        ids = [row[0] for row in cursor]
+        terms = self._decode_ids(ids)
+        for id in ids:
+            yield Graph(store=self, identifier=terms[id])
+
+    def add_graph(self, graph):
+        connection = self._connection()
+        id = self._term_ids([self._graph_term(graph) or DEFAULT_GRAPH])
+        connection.executemany("INSERT OR IGNORE INTO graphs (id) VALUES (?)", [(x,) for x in id.values()])
+        connection.commit()
+
+    def remove_graph(self, graph):
+        id = self._term_id(self._graph_term(graph) or DEFAULT_GRAPH)
+        if id is None:
+            return
+        connection = self._connection()
+        connection.execute("DELETE FROM quads WHERE g = ?", (id,))
+        connection.execute("DELETE FROM graphs WHERE id = ?", (id,))
+        connection.commit()
+
+    # Namespaces
+
+    def bind(self, prefix, namespace):
+        connection = self._connection()
+        connection.execute("DELETE FROM namespaces WHERE uri = ?", (str(namespace),))
+        connection.execute("INSERT OR REPLACE INTO namespaces (prefix, uri) VALUES (?, ?)", (prefix, str(namespace)))
+        connection.commit()
+
+    def namespace(self, prefix):
+        row = self._connection().execute("SELECT uri FROM namespaces WHERE prefix = ?", (prefix,)).fetchone()
+        return URIRef(row[0]) if row is not None else None
+
+    def prefix(self, namespace):
+        row = self._connection().execute("SELECT prefix FROM namespaces WHERE uri = ?", (str(namespace),)).fetchone()
+        return row[0] if row is not None else None
+
+    def namespaces(self):
+        for prefix, uri in self._connection().execute("SELECT prefix, uri FROM namespaces").fetchall():
+            yield prefix, URIRef(uri)
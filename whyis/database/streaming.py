@@ -0,0 +1,130 @@
+# -*- coding:utf-8 -*-
+
+import re
+
+import ijson
+from ijson.common import ObjectBuilder
+from rdflib import Variable
+from rdflib.plugins.parsers.ntriples import NTriplesParser
+from rdflib.plugins.sparql.results.jsonresults import parseJsonTerm
+from rdflib.query import ResultRow
+from rdflib.plugins.stores.sparqlconnector import SPARQLConnectorException
+
+__all__ = ["StreamingQueryMixin", "stream_query"]
+
+_graph_query = re.compile(r'^\s*(PREFIX\s+\S*\s*<[^>]*>\s*|BASE\s*<[^>]*>\s*|#[^\n]*\n\s*)*(CONSTRUCT|DESCRIBE)\b',
+                          re.IGNORECASE)
+
+
+class _TripleSink(object):
+    def __init__(self):
+        self.triples = []
+
+    def triple(self, s, p, o):
+        self.triples.append((s, p, o))
+
+
+def _iter_ntriples(lines):
+    sink = _TripleSink()
+    parser = NTriplesParser(sink)
+    parser._bnode_ids = {}
+    for line in lines:
+        parser.line = line.decode('utf8') if isinstance(line, bytes) else line
+        parser.parseline()
+        for triple in sink.triples:
+            yield triple
+        del sink.triples[:]
+
+
+def _iter_json_rows(stream):
+    '''Yields ResultRows from a SPARQL JSON results document as they are
+    parsed. The variables are taken from the head, which comes first.'''
+    variables = []
+    events = ijson.parse(stream)
+    for prefix, event, value in events:
+        if prefix == 'head.vars.item':
+            variables.append(Variable(value))
+        elif prefix == 'boolean':
+            yield value
+        elif prefix == 'results.bindings.item' and event == 'start_map':
+            builder = ObjectBuilder()
+            builder.event(event, value)
+            depth = 1
+            for prefix, event, value in events:
+                if event in ('start_map', 'start_array'):
+                    depth += 1
+                elif event in ('end_map', 'end_array'):
+                    depth -= 1
+                if depth == 0:
+                    break
+                builder.event(event, value)
+            values = dict([(Variable(k), parseJsonTerm(v)) for k, v in builder.value.items()])
+            yield ResultRow(values, variables)
+
+
+class StreamingQueryMixin(object):
+    '''Adds ``query_stream()`` to SPARQL stores. Results are parsed as they
+    arrive from the endpoint and never held in memory all at once, and
+    they bypass the result cache.'''
+
+    def query_stream(self, query, initNs={}, initBindings={}, queryGraph=None):
+        '''Yields result rows of a SELECT query, triples of a CONSTRUCT or
+        DESCRIBE query, or the answer of an ASK query.'''
+        if not self.query_endpoint:
+            raise SPARQLConnectorException("Query endpoint not set!")
+        if getattr(self, '_edits', None):
+            # Like query(), make pending edits visible first.
+            self.commit()
+        query = self._inject_prefixes(query, initNs)
+        if initBindings:
+            v = list(initBindings)
+            query += "\nVALUES ( %s )\n{ ( %s ) }\n"\
+                % (" ".join("?" + str(x) for x in v),
+                   " ".join(self.node_to_sparql(initBindings[x]) for x in v))
+
+        is_graph = _graph_query.match(query) is not None
+        if is_graph:
+            accept = 'application/n-triples, text/plain;q=0.9'
+        else:
+            accept = 'application/sparql-results+json'
+
+        args = dict(self.kwargs)
+        args.update(url=self.query_endpoint, stream=True)
+        args.setdefault('params', {})
+        args.setdefault('headers', {})
+        args['headers'].update({'Accept': accept})
+        params = {'query': query}
+        if queryGraph is not None and self._is_contextual(queryGraph):
+            params["default-graph-uri"] = queryGraph
+        if self.method == 'GET':
+            args['params'].update(params)
+        else:
+            args['data'] = params
+
+        res = self.session.request(self.method, **args)
+        try:
+            res.raise_for_status()
+            if is_graph:
+                for triple in _iter_ntriples(res.iter_lines()):
+                    yield triple
+            else:
+                res.raw.decode_content = True
+                for row in _iter_json_rows(res.raw):
+                    yield row
+        finally:
+            res.close()
+
+
+def stream_query(graph, query, initNs=None, initBindings=None):
+    '''Iterates over the results of ``query`` on ``graph``, streaming them
+    if the graph's store supports it. Streamed results are not cached or
+    shared with identical queries, so this is only worth it for results
+    that are too large to keep and are used one row at a time.'''
+    if initNs is None:
+        initNs = dict(graph.namespaces())
+    if initBindings is None:
+        initBindings = {}
+    if hasattr(graph.store, 'query_stream'):
+        identifier = getattr(graph, 'default_union', False) and '__UNION__' or graph.identifier
+        return graph.store.query_stream(query, initNs, initBindings, identifier)
+    return iter(graph.query(query, initNs=initNs, initBindings=initBindings))
@@ -0,0 +1,76 @@
+# -*- coding:utf-8 -*-
+
+import threading
+
+from rdflib.plugins.sparql.algebra import translateQuery, translateUpdate
+from rdflib.plugins.sparql.parser import parseQuery, parseUpdate
+from rdflib.plugins.sparql.processor import SPARQLProcessor, SPARQLUpdateProcessor
+
+from whyis.cache import LRUCache
+
+__all__ = ["ThreadLocalStateMixin", "ThreadSafeSPARQLProcessor", "ThreadSafeSPARQLUpdateProcessor"]
+
+
+class ThreadLocalStateMixin(object):
+    '''Keeps the namespace bindings and pending edits of a SPARQL store
+    per thread, so that one store can be shared by the threads of a
+    threaded web server. The connection pool and result cache are still
+    shared.'''
+
+    @property
+    def _thread_state(self):
+        return self.__dict__.setdefault('_thread_state_', threading.local())
+
+    @property
+    def nsBindings(self):
+        state = self._thread_state
+        if not hasattr(state, 'nsBindings'):
+            state.nsBindings = {}
+        return state.nsBindings
+
+    @nsBindings.setter
+    def nsBindings(self, bindings):
+        self._thread_state.nsBindings = bindings
+
+    @property
+    def _edits(self):
+        return getattr(self._thread_state, 'edits', None)
+
+    @_edits.setter
+    def _edits(self, edits):
+        self._thread_state.edits = edits
+
+
+# pyparsing is not thread safe, so queries are parsed one at a time.
+# Parsed queries are kept, since the same ones are run over and over.
+_parse_lock = threading.Lock()
+_parsed = LRUCache(1000)
+
+
+def _namespaces_key(initNs):
+    return tuple(sorted((str(k), str(v)) for k, v in (initNs or {}).items()))
+
+
+class ThreadSafeSPARQLProcessor(SPARQLProcessor):
+    '''rdflib's SPARQL engine, for in-memory and local graphs, made safe
+    to call from several threads.'''
+
+    def query(self, strOrQuery, initBindings={}, initNs={}, base=None, DEBUG=False):
+        if isinstance(strOrQuery, str):
+            key = (strOrQuery, _namespaces_key(initNs), base)
+            query = _parsed.get(key)
+            if query is None:
+                with _parse_lock:
+                    query = translateQuery(parseQuery(strOrQuery), base, initNs)
+                _parsed.set(key, query)
+            strOrQuery = query
+        return SPARQLProcessor.query(self, strOrQuery, initBindings, initNs, base, DEBUG)
+
+
+class ThreadSafeSPARQLUpdateProcessor(SPARQLUpdateProcessor):
+
+    def update(self, strOrQuery, initBindings={}, initNs={}):
+        if isinstance(strOrQuery, str):
+            with _parse_lock:
+                strOrQuery = translateUpdate(parseUpdate(strOrQuery), initNs=initNs)
+        return SPARQLUpdateProcessor.update(self, strOrQuery, initBindings, initNs)
@@ -1,10 +1,22 @@
 # -*- coding:utf-8 -*-
 
+from whyis.http_session import get_session
+from .instrumented import InstrumentedMixin
+from .replicas import ReplicaMixin
+from .result_cache import ResultCacheMixin
+from .single_flight import SingleFlightMixin
+from .streaming import StreamingQueryMixin
+from .thread_local import ThreadLocalStateMixin
 from rdflib.plugins.stores.sparqlstore import SPARQLStore
 
 
-class WhyisSPARQLStore(SPARQLStore):
-    
+class WhyisSPARQLStore(ThreadLocalStateMixin, ResultCacheMixin, SingleFlightMixin, InstrumentedMixin, ReplicaMixin,
+                       StreamingQueryMixin, SPARQLStore):
+
+    @property
+    def session(self):
+        return get_session()
+
     def _inject_prefixes(self, query, extra_bindings):
         bindings = list(extra_bindings.items())
         if not bindings:
@@ -1,16 +1,29 @@
 # -*- coding:utf-8 -*-
 
+from whyis.http_session import get_session
+from .buffered_updates import BufferedUpdateMixin
+from .instrumented import InstrumentedMixin, sparql_timed
+from .replicas import ReplicaMixin
+from .result_cache import ResultCacheMixin
+from .single_flight import SingleFlightMixin
+from .streaming import StreamingQueryMixin
+from .thread_local import ThreadLocalStateMixin
 from rdflib.plugins.stores.sparqlstore import SPARQLUpdateStore
 from rdflib.plugins.stores.sparqlconnector import SPARQLConnectorException, _response_mime_types
 
 
-class WhyisSPARQLUpdateStore(SPARQLUpdateStore):
+class WhyisSPARQLUpdateStore(ThreadLocalStateMixin, BufferedUpdateMixin, ResultCacheMixin, SingleFlightMixin,
+                             InstrumentedMixin, ReplicaMixin, StreamingQueryMixin, SPARQLUpdateStore):
     # To resolve linter warning
     # "attribute defined outside  __init__"
     def __init__(self, *args, **kwargs):
         self.publish = None
         SPARQLUpdateStore.__init__(self, *args, **kwargs)
 
+    @property
+    def session(self):
+        return get_session()
+
     def _inject_prefixes(self, query, extra_bindings):
         bindings = list(extra_bindings.items())
         if not bindings:
@@ -45,6 +58,8 @@ class WhyisSPARQLUpdateStore(SPARQLUpdateStore):
         args.setdefault('headers', {})
         args['headers'].update(headers)
 
-        res = self.session.post(**args)
-
-        res.raise_for_status()
+        with sparql_timed(self, 'update'):
+            res = self.session.post(**args)
+            res.raise_for_status()
+        self.pin()
+        self.invalidate_results()
@@ -0,0 +1,182 @@
+# -*- coding:utf-8 -*-
+
+import collections
+import json
+import time
+
+from rdflib import BNode, Literal, URIRef
+
+from whyis.cache import LRUCache
+from whyis.namespace import NS
+
+__all__ = ["DescriptionCache", "describe"]
+
+_description_query = '''
+construct {
+    ?e ?p ?o.
+    ?o rdfs:label ?label.
+    ?o skos:prefLabel ?prefLabel.
+    ?o dc:title ?title.
+    ?o foaf:name ?name.
+    ?o ?pattr ?oattr.
+    ?oattr rdfs:label ?oattrlabel
+} where {
+    graph ?g {
+      ?e ?p ?o.
+    }
+    ?g a np:Assertion.
+    optional {
+      ?e sio:hasAttribute|sio:hasPart ?o.
+      ?o ?pattr ?oattr.
+      optional {
+        ?oattr rdfs:label ?oattrlabel.
+      }
+    }
+    optional {
+      ?o rdfs:label ?label.
+    }
+    optional {
+      ?o skos:prefLabel ?prefLabel.
+    }
+    optional {
+      ?o dc:title ?title.
+    }
+    optional {
+      ?o foaf:name ?name.
+    }
+}'''
+
+
+def describe(graph, uri):
+    '''Returns the triples that describe ``uri`` in the assertions of
+    ``graph``, with the labels of what it links to and the properties
+    of its attributes and parts.'''
+    triples = []
+    for quad in graph.query(_description_query, initNs=NS.prefixes, initBindings={'e': uri}):
+        # Last term is never used
+        triples.append(tuple(quad[:3]))
+    return triples
+
+
+def _dump_term(term):
+    if isinstance(term, Literal):
+        return ['L', str(term), term.language, term.datatype]
+    return ['B' if isinstance(term, BNode) else 'U', str(term)]
+
+
+def _load_term(data):
+    if data[0] == 'L':
+        return Literal(data[1], lang=data[2], datatype=URIRef(data[3]) if data[3] else None)
+    if data[0] == 'B':
+        return BNode(data[1])
+    return URIRef(data[1])
+
+
+def _dump_triples(triples):
+    return json.dumps([[_dump_term(x) for x in triple] for triple in triples])
+
+
+def _load_triples(data):
+    return [tuple(_load_term(x) for x in triple) for triple in json.loads(data)]
+
+
+class DescriptionCache(object):
+    '''Keeps the triples returned by ``fetch(uri)`` that describe each
+    resource for ``ttl`` seconds, until ``invalidate()`` is called for it.
+
+    With ``redis``, descriptions are shared by all processes, and each
+    process only keeps them for ``local_ttl`` seconds. The ``hot_size``
+    resources that are described most often are also counted in Redis,
+    so that ``warm()`` can describe them again before they are asked for.'''
+
+    def __init__(self, fetch, redis=None, ttl=3600, local_ttl=10, maxsize=10000, hot_size=1000):
+        self.fetch = fetch
+        self.redis = redis
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.hot_size = hot_size
+        self.cache = LRUCache(maxsize)
+        self.requests = collections.Counter()
+        self.fetches = 0
+
+    _hot_key = "description__hot"
+    delete_batch_size = 1000
+
+    def _redis_key(self, uri):
+        return "description__" + str(uri)
+
+    def _count(self, uri):
+        if self.redis is not None:
+            pipe = self.redis.pipeline()
+            pipe.zincrby(self._hot_key, 1, str(uri))
+            # Only the top of the ranking is kept.
+            pipe.zremrangebyrank(self._hot_key, 0, -(self.hot_size * 2) - 1)
+            pipe.execute()
+            return
+        self.requests[uri] += 1
+        if len(self.requests) > self.hot_size * 2:
+            self.requests = collections.Counter(dict(self.requests.most_common(self.hot_size)))
+
+    def hot(self):
+        '''Returns the resources that are described most often.'''
+        if self.redis is not None:
+            return set(URIRef(x.decode('utf8')) for x in self.redis.zrevrange(self._hot_key, 0, self.hot_size - 1))
+        return set(uri for uri, count in self.requests.most_common(self.hot_size))
+
+    def _store(self, uri, triples):
+        self.cache.set(uri, (triples, time.time()))
+        if self.redis is not None:
+            self.redis.set(self._redis_key(uri), _dump_triples(triples), ex=self.ttl)
+
+    def refresh(self, uri):
+        '''Describes ``uri`` again, and keeps the new description.'''
+        uri = URIRef(uri)
+        self.fetches += 1
+        triples = self.fetch(uri)
+        self._store(uri, triples)
+        return triples
+
+    def get(self, uri):
+        '''Returns the triples that describe ``uri``.'''
+        uri = URIRef(uri)
+        self._count(uri)
+        ttl = self.local_ttl if self.redis is not None else self.ttl
+        entry = self.cache.get(uri)
+        if entry is not None and time.time() - entry[1] <= ttl:
+            return entry[0]
+        if self.redis is not None:
+            data = self.redis.get(self._redis_key(uri))
+            if data is not None:
+                triples = _load_triples(data)
+                self.cache.set(uri, (triples, time.time()))
+                return triples
+        return self.refresh(uri)
+
+    def invalidate(self, *uris):
+        '''Forgets the descriptions of ``uris``, for instance after
+        they were changed.'''
+        for uri in uris:
+            self.cache.delete(URIRef(uri))
+        if self.redis is not None:
+            keys = [self._redis_key(uri) for uri in uris]
+            for i in range(0, len(keys), self.delete_batch_size):
+                self.redis.delete(*keys[i:i + self.delete_batch_size])
+
+    def empty(self):
+        '''Returns True if no descriptions are kept, so there are none to
+        invalidate.'''
+        return self.redis is None and len(self.cache) == 0
+
+    def warm(self, uris):
+        '''Describes those of ``uris`` that are hot again, and returns
+        them.'''
+        hot = self.hot()
+        warmed = [uri for uri in (URIRef(x) for x in uris) if uri in hot]
+        for uri in warmed:
+            self.refresh(uri)
+        return warmed
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['fetches'] = self.fetches
+        return stats
@@ -9,6 +9,9 @@ from markupsafe import Markup
 from slugify import slugify
 from urllib import parse
 
+from whyis.database import query_many
+from whyis.metrics import caller
+
 
 # def geomean(nums):
 #    return float(reduce(lambda x, y: x*y, nums))**(1.0/len(nums))
@@ -30,18 +33,23 @@ def configure(app):
     def labelize(entry, key='about', label_key='label', fetch=False):
         if key not in entry:
             return None
-        resource = None
         if fetch:
-            resource = app.get_resource(rdflib.URIRef(entry[key]))
-        else:
-            resource = app.Entity(app.db, rdflib.URIRef(entry[key]))
-        entry[label_key] = g.get_label(resource.description())
+            app.get_resource(rdflib.URIRef(entry[key]))
+        entry[label_key] = app.label_service.label(rdflib.URIRef(entry[key]))
         return entry
 
     @app.template_filter('iter_labelize')
-    def iter_labelize(entries, *args, **kw):
+    def iter_labelize(entries, key='about', label_key='label', fetch=False):
+        # Labels for all the entries are looked up together.
+        entries = list(entries)
+        uris = [rdflib.URIRef(entry[key]) for entry in entries if key in entry]
+        if fetch:
+            for uri in uris:
+                app.get_resource(uri)
+        labels = app.label_service.labels(uris)
         for entry in entries:
-            labelize(entry, *args, **kw)
+            if key in entry:
+                entry[label_key] = labels[rdflib.URIRef(entry[key])]
         return entries
 
     app.labelize = labelize
@@ -79,7 +87,29 @@ def configure(app):
         params = { 'initNs': namespaces}
         if values is not None:
             params['initBindings'] = values
-        return [x.asdict() for x in graph.query(query, **params)]
+        with caller('filter:query'):
+            return [x.asdict() for x in graph.query(query, **params)]
+
+    @app.template_filter('query_many')
+    def query_many_filter(queries, graph=app.db, prefixes=None):
+        '''Runs independent queries at the same time. Each is a query, or
+        a dict with a ``query`` and optional ``values`` and ``prefixes``.'''
+        if prefixes is None:
+            prefixes = {}
+        namespaces = dict(app.NS.prefixes)
+        namespaces.update({ key: rdflib.URIRef(value) for key, value in list(prefixes.items())})
+        entries = []
+        for query in queries:
+            if not isinstance(query, dict):
+                query = dict(query=query)
+            params = dict(query=query['query'], initNs=dict(namespaces))
+            params['initNs'].update({ key: rdflib.URIRef(value)
+                                      for key, value in list(query.get('prefixes', {}).items())})
+            if query.get('values', None) is not None:
+                params['initBindings'] = query['values']
+            entries.append(params)
+        with caller('filter:query_many'):
+            return [[x.asdict() for x in rows] for rows in query_many(graph, entries)]
 
 
     @app.template_filter("fromjson")
@@ -101,8 +131,9 @@ def configure(app):
         if values is not None:
             params['initBindings'] = values
         conjunctive_graph = rdflib.graph.ConjunctiveGraph()
-        for stmt in graph.query(query, **params):
-            conjunctive_graph.add(tuple([remap_bnode(x) for x in stmt]))
+        with caller('filter:construct'):
+            for stmt in graph.query(query, **params):
+                conjunctive_graph.add(tuple([remap_bnode(x) for x in stmt]))
         return conjunctive_graph
 
     @app.template_filter('serialize')
@@ -284,14 +315,16 @@ where {
             #r['descriptions'] = [v for k,v in app.get_summary(resource)]
         if 'target' not in values:
             results = iter_labelize(results,'target','target_label')
-            for r in results:
-                r['target_types'] = [x for x in app.db.query('select ?t where {?x a ?t}',
-                                                             initBindings=dict(x=r['target']))]
+            types = query_many(app.db, [dict(query='select ?t where {?x a ?t}', initBindings=dict(x=r['target']))
+                                        for r in results])
+            for r, target_types in zip(results, types):
+                r['target_types'] = target_types
         if 'source' not in values:
             results = iter_labelize(results,'source','source_label')
-            for r in results:
-                r['source_types'] = [x for x in app.db.query('select ?t where {?x a ?t}',
-                                                             initBindings=dict(x=r['source']))]
+            types = query_many(app.db, [dict(query='select ?t where {?x a ?t}', initBindings=dict(x=r['source']))
+                                        for r in results])
+            for r, source_types in zip(results, types):
+                r['source_types'] = source_types
         return results
 
     env = Environment()
@@ -341,12 +374,13 @@ WHERE {
             var_map = { v['field']: v for v in variables}
             variables = list(var_map.values())
         results = []
+        queries = [facet_value_template.render(facet=facet, variables=variables, constraints=constraints)
+                   for facet in facets if 'valuePredicate' in facet]
+        value_rows = iter(query_many_filter(queries))
         for facet in facets:
             facet['type'] = 'nominal'
             if 'valuePredicate' in facet:
-                query = facet_value_template.render(facet=facet, variables=variables, constraints=constraints)
-                print(query)
-                values = query_filter(query)
+                values = next(value_rows)
                 for value in values:
                     value.update(facet)
                     fieldName = [value['facetId'],
@@ -0,0 +1,79 @@
+# -*- coding:utf-8 -*-
+
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+__all__ = ["configure_http", "get_session"]
+
+_options = {
+    'http_pool_connections' : 10,
+    'http_pool_maxsize' : 20,
+    'http_keep_alive' : True,
+    'http_timeout' : None,
+    'http_retries' : 3,
+}
+
+_sessions = {}
+_lock = threading.Lock()
+
+
+def configure_http(config):
+    '''Sets the connection pool options from the app config. Sessions that
+    already exist are replaced the next time they are requested.'''
+    with _lock:
+        for key in _options:
+            if key in config:
+                _options[key] = config[key]
+        _sessions.clear()
+
+
+class PooledSession(requests.Session):
+    '''A session that applies the configured timeout to every request
+    that does not set its own.'''
+
+    def __init__(self, timeout=None):
+        requests.Session.__init__(self)
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout', None) is None:
+            kwargs['timeout'] = self.timeout
+        return requests.Session.request(self, method, url, **kwargs)
+
+
+def _new_session(mounts):
+    session = PooledSession(timeout=_options['http_timeout'])
+    # Only connection failures are retried, since the request has not
+    # been sent yet and retrying is safe even for updates.
+    retries = Retry(total=_options['http_retries'], connect=_options['http_retries'],
+                    read=0, status=0, redirect=None, backoff_factor=0.1)
+    adapter = HTTPAdapter(pool_connections=_options['http_pool_connections'],
+                          pool_maxsize=_options['http_pool_maxsize'],
+                          max_retries=retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if not _options['http_keep_alive']:
+        session.headers['Connection'] = 'close'
+    for prefix, adapter in (mounts or {}).items():
+        session.mount(prefix, adapter)
+    return session
+
+
+def get_session(name='default', mounts=None):
+    '''Returns the process-wide session called ``name``, creating it with
+    ``mounts`` (a dict of URL prefixes to adapters) if needed. Sessions
+    are shared by all threads in a process, and their pooled connections
+    are kept alive between requests.'''
+    key = (os.getpid(), name)
+    session = _sessions.get(key, None)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key, None)
+            if session is None:
+                session = _new_session(mounts)
+                _sessions[key] = session
+    return session
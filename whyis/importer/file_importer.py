@@ -18,7 +18,7 @@ import sys
 
 from whyis.namespace import np, prov, dc, sio
 
-from .linked_data import LinkedData
+from .linked_data import LinkedData, importer_session
 from .local_file_adapter import LocalFileAdapter
 
 
@@ -29,10 +29,7 @@ class FileImporter(LinkedData):
 
     def fetch(self, entity_name):
         u = self._get_access_url(entity_name)
-        requests_session = requests.session()
-        requests_session.mount('file://', LocalFileAdapter())
-        requests_session.mount('file:///', LocalFileAdapter())
-        r = requests_session.get(u, headers=self.headers, allow_redirects=True, stream=True)
+        r = importer_session().get(u, headers=self.headers, allow_redirects=True, stream=True)
         npub = nanopub.Nanopublication()
         if 'content-disposition' in r.headers:
             d = r.headers['content-disposition']
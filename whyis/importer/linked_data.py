@@ -17,11 +17,19 @@ import traceback
 import sys
 
 from whyis.namespace import np, prov, dc, sio
+from whyis.http_session import get_session
 
 from .importer import Importer
 from .local_file_adapter import LocalFileAdapter
 
 
+def importer_session():
+    '''Returns the pooled session used by importers, which can also
+    read file:// URLs.'''
+    return get_session('importer', mounts={'file://': LocalFileAdapter(),
+                                           'file:///': LocalFileAdapter()})
+
+
 class LinkedData(Importer):
     def __init__(self, prefix, url, headers=None, access_url=None,
                  format=None, modified_headers=None, postprocess_update=None,
@@ -63,10 +71,7 @@ class LinkedData(Importer):
     def modified(self, entity_name):
         u = self._get_access_url(entity_name)
         print("accessing at", u)
-        requests_session = requests.session()
-        requests_session.mount('file://', LocalFileAdapter())
-        requests_session.mount('file:///', LocalFileAdapter())
-        r = requests_session.head(u, headers=self.modified_headers, allow_redirects=True)
+        r = importer_session().head(u, headers=self.modified_headers, allow_redirects=True)
         # print "Modified Headers", r.headers
         if 'Last-Modified' in r.headers:
             result = dateutil.parser.parse(r.headers['Last-Modified'])
@@ -78,7 +83,7 @@ class LinkedData(Importer):
     def fetch(self, entity_name):
         u = self._get_access_url(entity_name)
         print(u)
-        r = requests.get(u, headers=self.headers, allow_redirects=True)
+        r = importer_session().get(u, headers=self.headers, allow_redirects=True)
         g = rdflib.Dataset()
         local = g.graph(rdflib.URIRef("urn:default_assertion"))
         local.parse(data=r.text, format=self.format)
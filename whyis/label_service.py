@@ -0,0 +1,196 @@
+# -*- coding:utf-8 -*-
+
+import collections
+import json
+import logging
+import time
+from urllib.parse import urlsplit
+
+from rdflib import BNode, Literal, URIRef
+
+from whyis.cache import LRUCache
+from whyis.database.database_utils import node_to_sparql
+
+__all__ = ["LabelService"]
+
+
+def _valid(uri):
+    # Relative IRIs, such as blank node labels sent by clients, would be
+    # resolved by the endpoint.
+    if not urlsplit(str(uri)).scheme:
+        return False
+    try:
+        node_to_sparql(uri)
+    except Exception:
+        return False
+    return True
+
+
+def _dump_terms(terms):
+    return json.dumps([[str(p), 'L' if isinstance(o, Literal) else 'U', str(o),
+                        getattr(o, 'language', None), getattr(o, 'datatype', None)]
+                       for p, o in terms])
+
+
+def _load_terms(data):
+    terms = []
+    for p, kind, value, lang, datatype in json.loads(data):
+        if kind == 'L':
+            o = Literal(value, lang=lang, datatype=URIRef(datatype) if datatype else None)
+        else:
+            o = URIRef(value)
+        terms.append((URIRef(p), o))
+    return terms
+
+
+class LabelService(object):
+    '''Finds labels for many resources at once.
+
+    The values of ``properties``, and of ``name_properties`` (given and
+    family names, used when there is no label) are read for up to
+    ``batch_size`` resources in a query, from the first of ``graphs``
+    that has any. They are kept for ``ttl`` seconds in every language,
+    and the label for the current request is chosen from them with
+    ``lang_filter``. Resources without any get ``fallback(uri)``.
+
+    With ``redis``, what was read is shared by all processes, and each
+    process only keeps it for ``local_ttl`` seconds, so that
+    ``invalidate()`` is seen everywhere soon after.'''
+
+    def __init__(self, graphs, properties, name_properties, lang_filter, fallback,
+                 redis=None, ttl=3600, local_ttl=60, maxsize=100000, batch_size=200):
+        self.graphs = graphs
+        self.properties = list(properties)
+        self.name_properties = list(name_properties)
+        self.lang_filter = lang_filter
+        self.fallback = fallback
+        self.redis = redis
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.batch_size = batch_size
+        self.cache = LRUCache(maxsize)
+        self.queries = 0
+
+    delete_batch_size = 1000
+
+    def _redis_key(self, uri):
+        return "label__" + str(uri)
+
+    def _cached(self, uris):
+        found = {}
+        ttl = self.local_ttl if self.redis is not None else self.ttl
+        now = time.time()
+        for uri in uris:
+            entry = self.cache.get(uri)
+            if entry is not None and now - entry[1] <= ttl:
+                found[uri] = entry[0]
+        missing = [uri for uri in uris if uri not in found]
+        if self.redis is not None and missing:
+            for uri, data in zip(missing, self.redis.mget([self._redis_key(uri) for uri in missing])):
+                if data is not None:
+                    terms = _load_terms(data)
+                    found[uri] = terms
+                    self.cache.set(uri, (terms, now))
+        return found
+
+    def _store(self, terms):
+        now = time.time()
+        for uri, values in terms.items():
+            self.cache.set(uri, (values, now))
+        if self.redis is not None and terms:
+            pipe = self.redis.pipeline()
+            for uri, values in terms.items():
+                pipe.set(self._redis_key(uri), _dump_terms(values), ex=self.ttl)
+            pipe.execute()
+
+    def _query(self, graph, uris):
+        query = '''select ?s ?p ?o where {
+    values ?s { %s }
+    values ?p { %s }
+    ?s ?p ?o.
+}''' % (' '.join(node_to_sparql(uri) for uri in uris),
+        ' '.join(node_to_sparql(p) for p in self.properties + self.name_properties))
+        self.queries += 1
+        terms = {}
+        for s, p, o in graph.query(query):
+            terms.setdefault(s, []).append((p, o))
+        return terms
+
+    def _fetch(self, uris):
+        '''Reads the label terms of ``uris``, and caches them unless a
+        graph could not be read.'''
+        # Resources that cannot be written in a query have no labels.
+        terms = dict((uri, []) for uri in uris if not _valid(uri))
+        uris = [uri for uri in uris if uri not in terms]
+        complete = True
+        for i in range(0, len(uris), self.batch_size):
+            remaining = uris[i:i + self.batch_size]
+            for graph in self.graphs:
+                if not remaining:
+                    break
+                try:
+                    found = self._query(graph, remaining)
+                except Exception:
+                    logging.exception("Error reading the labels of %s resources from %s", len(remaining), graph)
+                    complete = False
+                    continue
+                terms.update(found)
+                remaining = [uri for uri in remaining if uri not in found]
+            for uri in remaining:
+                terms[uri] = []
+        if complete:
+            self._store(terms)
+        return terms
+
+    def terms(self, uris):
+        '''Returns a dict of the label and name values of each of ``uris``,
+        as lists of (property, value) pairs.'''
+        uris = list(collections.OrderedDict.fromkeys(URIRef(uri) for uri in uris if not isinstance(uri, BNode)))
+        found = self._cached(uris)
+        missing = [uri for uri in uris if uri not in found]
+        if missing:
+            found.update(self._fetch(missing))
+        return found
+
+    def _choose(self, uri, terms):
+        for property in self.properties:
+            labels = self.lang_filter([o for p, o in terms if p == property])
+            if len(labels) > 0:
+                return labels[0]
+        names = []
+        for property in self.name_properties:
+            values = [o for p, o in terms if p == property]
+            if values:
+                names.append(str(values[0]))
+        if names:
+            return ' '.join(names)
+        return self.fallback(uri)
+
+    def labels(self, uris):
+        '''Returns a dict of the label of each of ``uris``.'''
+        uris = list(uris)
+        terms = self.terms(uris)
+        return dict((uri, self._choose(uri, terms.get(URIRef(uri), []))) for uri in uris)
+
+    def label(self, uri):
+        return self.labels([uri])[uri]
+
+    def invalidate(self, *uris):
+        '''Forgets the labels of ``uris``, for instance after they were
+        changed.'''
+        for uri in uris:
+            self.cache.delete(URIRef(uri))
+        if self.redis is not None:
+            keys = [self._redis_key(uri) for uri in uris]
+            for i in range(0, len(keys), self.delete_batch_size):
+                self.redis.delete(*keys[i:i + self.delete_batch_size])
+
+    def empty(self):
+        '''Returns True if no labels are kept, so there are none to
+        invalidate.'''
+        return self.redis is None and len(self.cache) == 0
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats['queries'] = self.queries
+        return stats
@@ -22,7 +22,10 @@ class Manager(script.Manager):
         self.add_command("interpret", commands.RunInterpreter())
         self.add_command("load", commands.LoadNanopub())
         self.add_command("retire", commands.RetireNanopub())
+        self.add_command("restorearchive", commands.RestoreArchive())
+        self.add_command("rebuildindex", commands.RebuildIndex())
         self.add_command("runserver", commands.WhyisServer())
+        self.add_command("slowqueries", commands.SlowQueries())
         self.add_command("test", commands.Test())
         self.add_command("testagent", commands.TestAgent())
         self.add_command("updateuser", commands.UpdateUser())
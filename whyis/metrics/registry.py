@@ -0,0 +1,332 @@
+# -*- coding:utf-8 -*-
+
+import atexit
+import glob
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+__all__ = ["Counter", "Histogram", "MetricsRegistry", "REGISTRY",
+           "counter", "histogram", "gauge_callback", "caller", "current_caller",
+           "timed", "configure_metrics", "DEFAULT_BUCKETS", "SIZE_BUCKETS"]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (n, _escape(v)) for n, v in zip(names, values))
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+class Counter(object):
+    '''A monotonically increasing count, per combination of labels.'''
+
+    type = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dump(self):
+        with self._lock:
+            return [[list(k), v] for k, v in self.values.items()]
+
+    def load(self, values):
+        with self._lock:
+            for k, v in values:
+                k = tuple(k)
+                self.values[k] = self.values.get(k, 0) + v
+
+    def copy(self):
+        copy = Counter(self.name, self.help, self.labelnames)
+        copy.load(self.dump())
+        return copy
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self.values.items())
+        for k, v in items:
+            yield self.name + '_total', self.labelnames, k, v
+
+
+class Histogram(object):
+    '''Observations counted into cumulative buckets, per combination of
+    labels, with their sum and count.'''
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self.values.get(key)
+            if entry is None:
+                # One count per bucket, then +Inf, then the sum.
+                entry = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[i] += 1
+            entry[-1] += value
+
+    def dump(self):
+        with self._lock:
+            return [[list(k), list(v)] for k, v in self.values.items()]
+
+    def load(self, values):
+        with self._lock:
+            for k, v in values:
+                k = tuple(k)
+                entry = self.values.get(k)
+                if entry is None:
+                    self.values[k] = list(v)
+                else:
+                    self.values[k] = [a + b for a, b in zip(entry, v)]
+
+    def copy(self):
+        copy = Histogram(self.name, self.help, self.labelnames, self.buckets)
+        copy.load(self.dump())
+        return copy
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self.values.items())
+        names = self.labelnames + ('le',)
+        for k, v in items:
+            total = 0
+            for bound, count in zip(self.buckets + (float('inf'),), v[:-1]):
+                total += count
+                yield self.name + '_bucket', names, k + (_format_value(float(bound)),), total
+            yield self.name + '_sum', self.labelnames, k, v[-1]
+            yield self.name + '_count', self.labelnames, k, total
+
+
+class MetricsRegistry(object):
+    '''Holds the metrics of this process.
+
+    If ``directory`` is set, every process writes a snapshot of its
+    counters and histograms there at most every ``interval`` seconds,
+    and ``exposition()`` adds up the snapshots of all processes, so that
+    the web server can report the metrics of Celery workers too.'''
+
+    def __init__(self):
+        self.metrics = {}
+        self.gauges = {}
+        self.directory = None
+        self.interval = 5
+        self._written = 0
+        self._lock = threading.Lock()
+        self._name = None
+        self._pid = None
+        self._hooked = False
+
+    def _get(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get(Counter, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def gauge_callback(self, name, help, callback):
+        '''Reports a gauge whose samples are read from ``callback()`` at
+        scrape time, as a list of (labels, value) pairs. Gauges describe
+        the process that is scraped, and are not shared.'''
+        self.gauges[name] = (help, callback)
+
+    @property
+    def snapshot_path(self):
+        if self._pid != os.getpid():
+            # Each process, including forked ones, gets its own file.
+            self._pid = os.getpid()
+            self._name = '%s-%s-%d.json' % (socket.gethostname(), self._pid, int(time.time() * 1000))
+        return os.path.join(self.directory, self._name)
+
+    def configure(self, directory=None, interval=5):
+        self.directory = directory
+        self.interval = interval
+        if directory is not None:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            if not self._hooked:
+                self._hooked = True
+                atexit.register(self.changed, True)
+                if hasattr(os, 'register_at_fork'):
+                    os.register_at_fork(after_in_child=self.reset)
+
+    def reset(self):
+        '''Clears all counts. Forked processes start from zero, since
+        what they inherit is already in their parent's snapshot.'''
+        for metric in list(self.metrics.values()):
+            with metric._lock:
+                metric.values.clear()
+        self._written = 0
+
+    def snapshot(self):
+        return dict([(name, metric.dump()) for name, metric in list(self.metrics.items())])
+
+    def write_snapshot(self):
+        if self.directory is None:
+            return
+        self._written = time.time()
+        path = self.snapshot_path
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def changed(self, force=False):
+        '''Writes a snapshot if the last one is older than ``interval``.'''
+        if self.directory is None:
+            return
+        if force or time.time() - self._written >= self.interval:
+            try:
+                self.write_snapshot()
+            except OSError:
+                pass
+
+    def _merged(self):
+        if self.directory is None:
+            return self.metrics
+        merged = dict([(name, metric.copy()) for name, metric in list(self.metrics.items())])
+        own = self.snapshot_path
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            if path == own:
+                continue
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, values in snapshot.items():
+                if name in merged:
+                    merged[name].load(values)
+        return merged
+
+    def exposition(self):
+        '''Returns all metrics in the Prometheus text format.'''
+        lines = []
+        for name, metric in sorted(self._merged().items()):
+            lines.append('# HELP %s %s' % (name, metric.help))
+            lines.append('# TYPE %s %s' % (name, metric.type))
+            for sample, names, values, value in metric.samples():
+                lines.append('%s%s %s' % (sample, _format_labels(names, values), _format_value(value)))
+        for name, (help, callback) in sorted(self.gauges.items()):
+            try:
+                samples = list(callback())
+            except Exception:
+                continue
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s gauge' % name)
+            for labels, value in samples:
+                if value is None:
+                    continue
+                names = sorted(labels)
+                lines.append('%s%s %s' % (name, _format_labels(names, [labels[n] for n in names]),
+                                          _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def counter(name, help, labelnames=()):
+    return REGISTRY.counter(name, help, labelnames)
+
+
+def histogram(name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.histogram(name, help, labelnames, buckets=buckets)
+
+
+def gauge_callback(name, help, callback):
+    REGISTRY.gauge_callback(name, help, callback)
+
+
+def configure_metrics(config):
+    '''Sets where processes share their metrics, from the app config.'''
+    REGISTRY.configure(config.get('metrics_dir', None), config.get('metrics_interval', 5))
+
+
+_callers = threading.local()
+
+
+@contextmanager
+def caller(tag):
+    '''Tags the metrics recorded in this thread inside the block with
+    ``tag``. Tags nest, so a filter called from a view is tagged with
+    both.'''
+    stack = getattr(_callers, 'stack', None)
+    if stack is None:
+        stack = _callers.stack = []
+    stack.append(tag)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+def current_caller():
+    stack = getattr(_callers, 'stack', None)
+    if not stack:
+        return 'unknown'
+    return '>'.join(stack)
+
+
+@contextmanager
+def timed(metric, errors=None, **labels):
+    '''Observes how long the block takes in the histogram ``metric``,
+    and counts it in ``errors`` if it raises. Can also decorate a
+    function.'''
+    start = time.time()
+    try:
+        yield
+    except BaseException:
+        if errors is not None:
+            errors.inc(**labels)
+        raise
+    finally:
+        metric.observe(time.time() - start, **labels)
+        REGISTRY.changed()
@@ -1,2 +1,2 @@
 from .nanopublication import Nanopublication
-from .nanopublication_manager import NanopublicationManager
+from .nanopublication_manager import NanopublicationManager, prepare_nanopubs
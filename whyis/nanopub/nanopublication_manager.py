@@ -8,6 +8,8 @@ from dataurl import DataURLStorage
 from werkzeug.utils import secure_filename
 
 import tempfile
+import hashlib
+import time
 
 from depot.io.utils import FileIntent
 from depot.manager import DepotManager
@@ -15,14 +17,105 @@ from depot.manager import DepotManager
 from datetime import datetime
 import pytz
 
-from whyis.namespace import np, prov, dc, frbr, whyis
+from whyis.namespace import np, prov, dc, frbr, whyis, sio
 from uuid import uuid4
 
 from datastore import create_id
+from whyis.database import ChunkedPublisher, uncached
+from whyis.cache import LRUCache
+from whyis.metrics import counter, histogram, timed
 from .nanopublication import Nanopublication
+from .write_behind import PublishHandle, WriteBehindQueue
 
 from rdflib.plugins.serializers import nquads
 
+
+_nanopub_seconds = histogram('whyis_nanopub_seconds', 'Time taken to publish or retire nanopublications.',
+                             ('operation',))
+_nanopub_errors = counter('whyis_nanopub_errors', 'Failed nanopublication publishes and retires.', ('operation',))
+_nanopubs = counter('whyis_nanopubs', 'Nanopublications published or retired.', ('operation',))
+
+
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def prepare_nanopubs(source_graph, prefix):
+    '''Turns the graphs in ``source_graph`` into nanopublications under
+    ``prefix``, in place. Graphs that are not already part of a
+    nanopublication become assertions of new ones, and blank node
+    nanopublications and graphs are given URIs. This does not need an
+    application, so it can run in worker processes.'''
+    graph = rdflib.ConjunctiveGraph(store=source_graph.store)
+    new_nps = [Nanopublication(store=graph.store, identifier=npuri)
+               for npuri in graph.subjects(rdflib.RDF.type, np.Nanopublication)]
+    assertion_graphs = set([nanopub.assertion.identifier for nanopub in new_nps])
+    provenance_graphs = set([nanopub.provenance.identifier for nanopub in new_nps])
+    pubinfo_graphs = set([nanopub.pubinfo.identifier for nanopub in new_nps])
+    all_np_graphs = set([x.identifier for x in new_nps])
+    all_np_graphs = all_np_graphs.union(assertion_graphs)
+    all_np_graphs = all_np_graphs.union(provenance_graphs)
+    all_np_graphs = all_np_graphs.union(pubinfo_graphs)
+
+    loose_graphs = list([c for c in graph.contexts() if c.identifier not in all_np_graphs and len(c) > 0])
+    for context in loose_graphs:
+        new_np = Nanopublication(store=context.store, identifier=prefix[create_id()])
+        if isinstance(context.identifier, rdflib.BNode):
+            g = rdflib.Graph(store=context.store, identifier=new_np.assertion.identifier)
+            g += context
+            context.remove((None, None, None))
+        else:
+            new_np.add((new_np.identifier, np.hasAssertion, context.identifier))
+            new_np.add((new_np.identifier, rdflib.RDF.type, np.Nanopublication))
+            new_np.add((graph.identifier, rdflib.RDF.type, np.Assertion))
+        new_np.assertion
+        new_np.provenance
+        new_np.pubinfo
+        new_nps.append(new_np)
+
+    i = 0
+    remap_graphs = {}
+    for nanopub in new_nps:
+        i += 1
+        new_np = nanopub
+        if isinstance(nanopub.identifier, rdflib.BNode):
+            new_np = Nanopublication(store=graph.store, identifier=prefix[create_id()])
+            remap_graphs[nanopub.identifier] = new_np.identifier
+        for identifier, suffix in [(nanopub.assertion.identifier, '_assertion'),
+                                   (nanopub.provenance.identifier, '_provenance'),
+                                   (nanopub.pubinfo.identifier, '_pubinfo')]:
+            if isinstance(identifier, rdflib.BNode):
+                old_id = identifier
+                new_id = new_np.identifier+suffix
+                remap_graphs[old_id] = new_id
+    for old, new in remap_graphs.items():
+        old_g = rdflib.Graph(store=graph.store, identifier=old)
+        new_g = rdflib.Graph(store=graph.store, identifier=new)
+        new_g += old_g
+        graph.remove_context(old_g)
+
+        for s, p, o, g in graph.quads((old, None, None, None)):
+            graph.add((new,p,o,g))
+            graph.remove((s,p,o,g))
+        # Predicates can't be bnodes.
+        for s, p, o, g in graph.quads((None, None, old, None)):
+            graph.add((s,p,new,g))
+            graph.remove((s,p,o,g))
+            
+        #if nanopub.pubinfo.value(nanopub.identifier, frbr.realizationOf) is None:
+        #    work = prefix[create_id()]
+        #    nanopub.pubinfo.add((nanopub.identifier, frbr.realizationOf, work))
+        #    nanopub.pubinfo.add((work, rdflib.RDF.type, frbr.Work))
+        #    nanopub.pubinfo.add((nanopub.identifier, rdflib.RDF.type, frbr.Expression))
+        # print "Total", len(output_graph)
+        # print "Contexts", [g.identifier for g in output_graph.contexts()]
+
+    for npuri in graph.subjects(rdflib.RDF.type, np.Nanopublication):
+        yield Nanopublication(store=graph.store, identifier=npuri)
+
+
 class NanopublicationManager(object):
     def __init__(self, store, prefix, app, update_listener=None):
         self.db = rdflib.ConjunctiveGraph(store)
@@ -31,6 +124,19 @@ class NanopublicationManager(object):
         #self.depot = DepotManager.get('nanopublications')
         self.prefix = rdflib.Namespace(prefix)
         self.update_listener = update_listener
+        self._write_behind = None
+        # Nanopublications are immutable until they are retired, so their
+        # quads can be cached until retire() invalidates them. Other
+        # processes are not told, so they only keep them for a while.
+        self.cache = LRUCache(app.config.get('nanopub_cache_quads', 100000), getsizeof=lambda entry: len(entry[0]))
+        self.local_ttl = app.config.get('nanopub_cache_local_ttl', 60)
+        self._cache_generation = 0
+        # Changes made by this process only, for when they are not
+        # counted in Redis.
+        self._changes = 0
+        self._process_id = uuid4().hex
+        self.redis_hits = 0
+        self.redis_misses = 0
 
     def new(self):
         fileid = self._reserve_id()
@@ -51,205 +157,574 @@ class NanopublicationManager(object):
         return create_id()
 
     def prepare(self, source_graph):
-        graph = rdflib.ConjunctiveGraph(store=source_graph.store)
-        new_nps = [Nanopublication(store=graph.store, identifier=npuri)
-                   for npuri in graph.subjects(rdflib.RDF.type, np.Nanopublication)]
-        assertion_graphs = set([nanopub.assertion.identifier for nanopub in new_nps])
-        provenance_graphs = set([nanopub.provenance.identifier for nanopub in new_nps])
-        pubinfo_graphs = set([nanopub.pubinfo.identifier for nanopub in new_nps])
-        all_np_graphs = set([x.identifier for x in new_nps])
-        all_np_graphs = all_np_graphs.union(assertion_graphs)
-        all_np_graphs = all_np_graphs.union(provenance_graphs)
-        all_np_graphs = all_np_graphs.union(pubinfo_graphs)
-
-        loose_graphs = list([c for c in graph.contexts() if c.identifier not in all_np_graphs and len(c) > 0])
-        for context in loose_graphs:
-            new_np = Nanopublication(store=context.store, identifier=self.prefix[create_id()])
-            if isinstance(context.identifier, rdflib.BNode):
-                g = rdflib.Graph(store=context.store, identifier=new_np.assertion.identifier)
-                g += context
-                context.remove((None, None, None))
-            else:
-                new_np.add((new_np.identifier, np.hasAssertion, context.identifier))
-                new_np.add((new_np.identifier, rdflib.RDF.type, np.Nanopublication))
-                new_np.add((graph.identifier, rdflib.RDF.type, np.Assertion))
-            new_np.assertion
-            new_np.provenance
-            new_np.pubinfo
-            new_nps.append(new_np)
-
-        i = 0
-        remap_graphs = {}
-        for nanopub in new_nps:
-            i += 1
-            new_np = nanopub
-            if isinstance(nanopub.identifier, rdflib.BNode):
-                new_np = Nanopublication(store=graph.store, identifier=self.prefix[create_id()])
-                remap_graphs[nanopub.identifier] = new_np.identifier
-            for identifier, suffix in [(nanopub.assertion.identifier, '_assertion'),
-                                       (nanopub.provenance.identifier, '_provenance'),
-                                       (nanopub.pubinfo.identifier, '_pubinfo')]:
-                if isinstance(identifier, rdflib.BNode):
-                    old_id = identifier
-                    new_id = new_np.identifier+suffix
-                    remap_graphs[old_id] = new_id
-        for old, new in remap_graphs.items():
-            old_g = rdflib.Graph(store=graph.store, identifier=old)
-            new_g = rdflib.Graph(store=graph.store, identifier=new)
-            new_g += old_g
-            graph.remove_context(old_g)
-
-            for s, p, o, g in graph.quads((old, None, None, None)):
-                graph.add((new,p,o,g))
-                graph.remove((s,p,o,g))
-            # Predicates can't be bnodes.
-            for s, p, o, g in graph.quads((None, None, old, None)):
-                graph.add((s,p,new,g))
-                graph.remove((s,p,o,g))
-                
-            #if nanopub.pubinfo.value(nanopub.identifier, frbr.realizationOf) is None:
-            #    work = self.prefix[create_id()]
-            #    nanopub.pubinfo.add((nanopub.identifier, frbr.realizationOf, work))
-            #    nanopub.pubinfo.add((work, rdflib.RDF.type, frbr.Work))
-            #    nanopub.pubinfo.add((nanopub.identifier, rdflib.RDF.type, frbr.Expression))
-            # print "Total", len(output_graph)
-            # print "Contexts", [g.identifier for g in output_graph.contexts()]
-
-        for npuri in graph.subjects(rdflib.RDF.type, np.Nanopublication):
-            yield Nanopublication(store=graph.store, identifier=npuri)
+        return prepare_nanopubs(source_graph, self.prefix)
 
-    def retire(self, *nanopub_uris):
-        self.db.store.nsBindings = {}
-        #graphs = []
-        derived_query = '''select ?np where {
+    def _query(self, query, **kwargs):
+        # Lookups that decide what to retire or publish must see the
+        # current state of the store, so they bypass the result cache.
+        with uncached(self.db.store):
+            return self.db.query(query, **kwargs)
+
+    def _sparql_terms(self, nodes):
+        node_to_sparql = getattr(self.db.store, 'node_to_sparql', None)
+        if node_to_sparql is not None:
+            return [node_to_sparql(x) for x in nodes]
+        # VALUES blocks can't contain blank nodes.
+        return [x.n3() for x in nodes if not isinstance(x, rdflib.BNode)]
+
+    def _derived_nanopubs(self, nanopub_uris):
+        derived_query = '''select distinct ?np ?graph ?archived where {
+  values ?r { %s }
   ?np (np:hasAssertion/prov:wasDerivedFrom+/^np:hasAssertion)? ?r.
   ?np a np:Nanopublication.
-''' + ('' if self.app.config.get('delete_archive_nanopubs',True) else 'minus { ?np a whyis:FRIRNanopublication }') + '''
+  ?np np:hasAssertion?|np:hasProvenance?|np:hasPublicationInfo? ?graph.
+  optional {
+    ?np a ?archived.
+    filter(?archived = whyis:FRIRNanopublication)
+  }
 }'''
-        for nanopub_uri in nanopub_uris:
-            for np_uri, in self.db.query(derived_query,
-                                         initNs={"prov": prov, "np": np, "whyis" : whyis},
-                                         initBindings={"r": nanopub_uri}):
-                #graphs.extend([np_uri, assertion, provenance, pubinfo])
-                nanopub = Nanopublication(store=self.db.store, identifier=np_uri)
-                
-                for fileid in nanopub.objects(predicate=whyis.hasFileID):
-                    if self.app.file_depot.exists(fileid):
-                        self.app.file_depot.delete(fileid)
-                    elif self.app.nanopub_depot.exists(fileid):
-                        f = self.app.nanopub_depot.delete(fileid)                    
-                self.db.remove((None, None, None, nanopub.assertion.identifier))
-                self.db.remove((None, None, None, nanopub.provenance.identifier))
-                self.db.remove((None, None, None, nanopub.pubinfo.identifier))
-                self.db.remove((None, None, None, nanopub.identifier))
+        graphs = collections.defaultdict(set)
+        archived = set()
+        terms = self._sparql_terms([rdflib.URIRef(x) for x in nanopub_uris])
+        for batch in _chunks(terms, self.app.config.get('retire_batch_size', 1000)):
+            for np_uri, graph, is_archive in self._query(derived_query % ' '.join(batch),
+                                                           initNs={"prov": prov, "np": np, "whyis" : whyis}):
+                graphs[np_uri].add(graph)
+                if is_archive is not None:
+                    archived.add(np_uri)
+        return graphs, archived
+
+    def _file_ids(self, graphs):
+        file_query = '''select distinct ?fileid where {
+  values ?graph { %s }
+  graph ?graph { ?entity whyis:hasFileID ?fileid. }
+}'''
+        fileids = set()
+        for batch in _chunks(self._sparql_terms(graphs), self.app.config.get('retire_batch_size', 1000)):
+            fileids.update([x for x, in self._query(file_query % ' '.join(batch), initNs={"whyis" : whyis})])
+        return fileids
+
+    def _subjects(self, graphs, properties=None):
+        '''Returns the subjects in ``graphs``, or only those of
+        ``properties`` if given.'''
+        subjects_query = '''select distinct ?s where {
+    values ?g { %s }
+    %s
+    graph ?g { ?s ?p ?o }
+}'''
+        values = ''
+        if properties is not None:
+            values = 'values ?p { %s }' % ' '.join(self._sparql_terms(properties))
+        subjects = set()
+        for batch in _chunks(self._sparql_terms(graphs), self.app.config.get('retire_batch_size', 1000)):
+            subjects.update([x for x, in self._query(subjects_query % (' '.join(batch), values))])
+        return subjects
+
+    def _labeled_subjects(self, graphs):
+        '''Returns the subjects given labels in ``graphs``.'''
+        labels = getattr(self.app, 'label_service', None)
+        if labels is None or labels.empty():
+            return set()
+        return self._subjects(graphs, labels.properties + labels.name_properties)
+
+    def _described_subjects(self, graphs):
+        '''Returns the subjects described in ``graphs``.'''
+        descriptions = getattr(self.app, 'description_cache', None)
+        if descriptions is None or descriptions.empty():
+            return set()
+        return self._subjects(graphs)
+
+    def described_subjects(self, nanopub):
+        '''Returns the resources whose descriptions ``nanopub`` changes:
+        the subjects of its assertion, and what it is about.'''
+        subjects = set(nanopub.assertion.subjects())
+        subjects.update(nanopub.objects(nanopub.identifier, sio.isAbout))
+        return set([x for x in subjects if isinstance(x, rdflib.URIRef)])
+
+    def _invalidate_labels(self, subjects):
+        labels = getattr(self.app, 'label_service', None)
+        if labels is not None and subjects:
+            labels.invalidate(*subjects)
+
+    def _invalidate_descriptions(self, subjects):
+        descriptions = getattr(self.app, 'description_cache', None)
+        if descriptions is not None and subjects:
+            descriptions.invalidate(*subjects)
+
+    @timed(_nanopub_seconds, _nanopub_errors, operation='retire')
+    def retire(self, *nanopub_uris):
+        '''Retires the given nanopublications and everything derived from
+        them. The derivation closure is computed for all URIs at once and
+        the affected graphs are dropped in batches of
+        ``retire_batch_size`` operations per update.'''
+        self.db.store.nsBindings = {}
+        if len(nanopub_uris) == 0:
+            return
+        derived, archived = self._derived_nanopubs(set(nanopub_uris))
+        if not self.app.config.get('delete_archive_nanopubs',True):
+            retired = [x for x in derived if x not in archived]
+        else:
+            retired = list(derived)
+        graphs = set()
+        for np_uri in retired:
+            graphs.update(derived[np_uri])
+
+        for fileid in self._file_ids(graphs):
+            fileid = str(fileid)
+            if self.app.file_depot.exists(fileid):
+                self.app.file_depot.delete(fileid)
+            elif self.app.nanopub_depot.exists(fileid):
+                self.app.nanopub_depot.delete(fileid)
+
+        labeled = self._labeled_subjects(graphs)
+        described = self._described_subjects(graphs)
+        for batch in _chunks(self._sparql_terms(graphs), self.app.config.get('retire_batch_size', 1000)):
+            self.db.update(' ;\n'.join(['DROP SILENT GRAPH %s' % x for x in batch]))
         self.db.commit()
-        # data = [('c', c.n3()) for c in graphs]
-        # session = requests.session()
-        # session.keep_alive = False
-        # session.delete(self.db.store.endpoint, data=[('c', c.n3()) for c in graphs])
+        self._invalidate_labels(labeled)
+        self._invalidate_descriptions(described)
+        self._remove_archived(*retired)
+        # Requested nanopubs that are already gone from the store may
+        # still be in the index.
+        self._index_remove(*(retired + [x for x in nanopub_uris if rdflib.URIRef(x) not in derived]))
+        self.invalidate(*retired)
+        if retired:
+            self._changed()
+        _nanopubs.inc(len(retired), operation='retire')
+
+    _version_key = "nanopubs__version"
+
+    def _version_redis(self):
+        if self.app.config.get('conditional_get_redis', False):
+            return getattr(self.app, 'redis', None)
+
+    def _changed(self):
+        self._changes += 1
+        redis = self._version_redis()
+        if redis is not None:
+            redis.incr(self._version_key)
+
+    def version(self):
+        '''Returns a version of the knowledge graph that changes whenever
+        nanopublications are published or retired. Without Redis, only
+        changes made by this process are counted, so versions from
+        different processes never match.'''
+        redis = self._version_redis()
+        if redis is not None:
+            return 'redis %s' % int(redis.get(self._version_key) or 0)
+        return '%s %s' % (self._process_id, self._changes)
+
+    _index_key = "nanopubs__current"
+    _index_ready_key = "nanopubs__current_ready"
+    # While the index is rebuilt, it is read from the store into the
+    # rebuild set, and what is retired meanwhile is kept in the retired
+    # set, since the store may have been read before it was retired.
+    _index_rebuilding_key = "nanopubs__current_rebuilding"
+    _index_rebuild_key = "nanopubs__current_rebuild"
+    _index_retired_key = "nanopubs__current_retired"
+    # A rebuild that died is forgotten after a day.
+    _index_rebuild_timeout = 24 * 60 * 60
+
+    def _index(self):
+        if self.app.config.get('nanopub_index_redis', False):
+            return getattr(self.app, 'redis', None)
+
+    def _index_add(self, *nanopub_uris):
+        index = self._index()
+        if index is not None and len(nanopub_uris) > 0:
+            values = [str(x) for x in nanopub_uris]
+            rebuilding = index.exists(self._index_rebuilding_key)
+            pipe = index.pipeline()
+            pipe.sadd(self._index_key, *values)
+            if rebuilding:
+                pipe.sadd(self._index_rebuild_key, *values)
+                pipe.srem(self._index_retired_key, *values)
+            pipe.execute()
+
+    def _index_remove(self, *nanopub_uris):
+        index = self._index()
+        if index is not None and len(nanopub_uris) > 0:
+            values = [str(x) for x in nanopub_uris]
+            rebuilding = index.exists(self._index_rebuilding_key)
+            pipe = index.pipeline()
+            pipe.srem(self._index_key, *values)
+            if rebuilding:
+                pipe.srem(self._index_rebuild_key, *values)
+                pipe.sadd(self._index_retired_key, *values)
+            pipe.execute()
+
+    def rebuild_index(self):
+        '''Rebuilds the Redis set of current nanopublications from the
+        knowledge graph. is_current() queries the store until the rebuild
+        is finished. Nanopublications published or retired during the
+        rebuild are kept track of, and the new set replaces the old one
+        at once. Returns the number of current nanopublications.'''
+        index = self._index()
+        if index is None:
+            return None
+        index.delete(self._index_ready_key, self._index_rebuild_key, self._index_retired_key)
+        index.set(self._index_rebuilding_key, 1, ex=self._index_rebuild_timeout)
+        batch_size = self.app.config.get('retire_batch_size', 1000)
+        nanopubs = self.db.subjects(rdflib.RDF.type, np.Nanopublication)
+        for batch in _chunks(nanopubs, batch_size):
+            index.sadd(self._index_rebuild_key, *[str(x) for x in batch])
+        # Pipelines are transactions, so no publish or retire comes
+        # between these.
+        pipe = index.pipeline()
+        pipe.sdiffstore(self._index_key, self._index_rebuild_key, self._index_retired_key)
+        pipe.delete(self._index_rebuilding_key, self._index_rebuild_key, self._index_retired_key)
+        pipe.set(self._index_ready_key, 1)
+        pipe.execute()
+        return index.scard(self._index_key)
 
     def is_current(self, nanopub_uri):
+        index = self._index()
+        if index is not None:
+            pipe = index.pipeline()
+            pipe.exists(self._index_ready_key)
+            pipe.sismember(self._index_key, str(nanopub_uri))
+            ready, member = pipe.execute()
+            if ready:
+                return bool(member)
         return (rdflib.URIRef(nanopub_uri), rdflib.RDF.type, np.Nanopublication) in self.db
 
+    @property
+    def archive_path(self):
+        return self.app.config.get('nanopub_archive_path', None)
+
     def get_path(self, nanopub_uri):
-        # print self.prefix, nanopub_uri
-        ident = nanopub_uri.replace(self.prefix, "")
+        '''Returns the path of a nanopublication in the local archive.
+        Files are addressed by the SHA-256 of the nanopub URI and sharded
+        into two levels of 3-character directories.'''
+        ident = hashlib.sha256(str(nanopub_uri).encode('utf8')).hexdigest()
         dir_name_length = 3
-        path = [ident[i:i + dir_name_length] for i in range(0, len(ident), dir_name_length)]
-        return [self.archive_path] + path[:-1] + [ident]
+        path = [ident[i:i + dir_name_length] for i in range(0, 2*dir_name_length, dir_name_length)]
+        return os.path.join(*([self.archive_path] + path + [ident + '.nq']))
+
+    def _open_archive(self, nanopub_uri, archived):
+        if self.archive_path is None:
+            return None
+        path = self.get_path(nanopub_uri)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        archived.append((tmp, path))
+        return os.fdopen(fd, 'wb')
+
+    def _remove_archived(self, *nanopub_uris):
+        if self.archive_path is None:
+            return
+        for nanopub_uri in nanopub_uris:
+            path = self.get_path(nanopub_uri)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def restore_archive(self):
+        '''Loads every nanopublication in the local archive into the
+        knowledge graph, as-is, and rebuilds the index of current
+        nanopublications. Returns the number of nanopublications loaded.'''
+        index = self._index()
+        if index is not None:
+            # The restored nanopublications are not in the index yet.
+            index.delete(self._index_ready_key)
+        count = 0
+        with self._chunked_publisher() as publisher:
+            for dirpath, dirnames, filenames in os.walk(self.archive_path):
+                for filename in sorted(filenames):
+                    if not filename.endswith('.nq'):
+                        continue
+                    with open(os.path.join(dirpath, filename), 'rb') as f:
+                        for row in f:
+                            publisher.write(row)
+                    publisher.boundary()
+                    count += 1
+        self._changed()
+        self.rebuild_index()
+        return count
+
+    def _find_replaced(self, parts):
+        np_query = '''select distinct ?np where {
+  values ?x { %s }
+  ?np np:hasAssertion|np:hasProvenance|np:hasPublicationInfo ?x.
+}'''
+        replacing = set()
+        for batch in _chunks(self._sparql_terms(parts), self.app.config.get('replacement_batch_size', 1000)):
+            replacing.update([x for x, in self._query(np_query % ' '.join(batch), initNs=dict(np=np))])
+        return replacing
+
+    def _find_revised(self, assertions):
+        revised_query = '''select distinct ?assertion ?np where {
+  values ?assertion { %s }
+  ?np np:hasAssertion ?assertion.
+}'''
+        revised = collections.defaultdict(list)
+        for batch in _chunks(self._sparql_terms(assertions), self.app.config.get('replacement_batch_size', 1000)):
+            for assertion, nanopub_uri in self._query(revised_query % ' '.join(batch), initNs=dict(np=np)):
+                revised[assertion].append(nanopub_uri)
+        return revised
+
+    def _open_chunk(self):
+        if 'load_dir' in self.app.config:
+            return open(self.app.config['load_dir']+'/'+create_id()+'.nq', 'a+b')
+        return tempfile.NamedTemporaryFile(delete=True)
+
+    def _chunked_publisher(self):
+        return ChunkedPublisher(self.db.store.publish,
+                                max_quads=self.app.config.get('publish_chunk_quads', 100000),
+                                max_bytes=self.app.config.get('publish_chunk_bytes', 64*1024*1024),
+                                max_pending=self.app.config.get('publish_pipeline_depth', 1),
+                                open_chunk=self._open_chunk,
+                                split_anywhere=self.app.config.get('BNODE_REWRITE', False))
+
+    def _write_quads(self, publisher, stores, np_graphs, archived):
+        bnode_cache = {}
+        def skolemize(x):
+            if isinstance(x, rdflib.BNode):
+                if x not in bnode_cache:
+                    bnode_cache[x] = rdflib.URIRef('bnode:' + uuid4().hex)
+                return bnode_cache[x]
+            return x
+
+        def write_graph(graph, archive=None):
+            for s, p, o in graph:
+                if self.app.config.get('BNODE_REWRITE', False):
+                    s = skolemize(s)
+                    o = skolemize(o)
+                    # predicates can't be bnodes, and contexts have already been rewritten.
+                row = nquads._nq_row((s,p,o), graph.identifier).encode('utf8')
+                publisher.write(row)
+                if archive is not None:
+                    archive.write(row)
+
+        # Write each nanopub's graphs together so that chunks are only
+        # split between nanopubs, then anything else left in the stores.
+        written = set()
+        # The same rows are written to the local archive, if there is one.
+        for np_graph in np_graphs:
+            archive = self._open_archive(np_graph.identifier, archived)
+            try:
+                for identifier in [np_graph.identifier,
+                                   np_graph.assertion.identifier,
+                                   np_graph.provenance.identifier,
+                                   np_graph.pubinfo.identifier]:
+                    if (np_graph.store, identifier) not in written:
+                        written.add((np_graph.store, identifier))
+                        write_graph(rdflib.Graph(store=np_graph.store, identifier=identifier), archive)
+            finally:
+                if archive is not None:
+                    archive.close()
+            publisher.boundary()
+        for store in stores:
+            for context in rdflib.ConjunctiveGraph(store).contexts():
+                if (store, context.identifier) not in written:
+                    write_graph(context)
+            publisher.boundary()
+
+    @property
+    def write_behind(self):
+        if self._write_behind is None and self.app.config.get('nanopub_write_behind', False):
+            spool_dir = self.app.config.get('nanopub_spool_dir', None)
+            if spool_dir is None:
+                spool_dir = os.path.join(self.app.config.get('load_dir', '/data'), 'nanopub_spool')
+            self._write_behind = WriteBehindQueue(self._publish, spool_dir,
+                                                  window=self.app.config.get('nanopub_write_behind_window', 0.1),
+                                                  max_batch=self.app.config.get('nanopub_write_behind_batch', 1000))
+        return self._write_behind
 
     def publish(self, *nanopubs):
+        '''Publishes the given nanopublications, or graphs of
+        nanopublications, and returns a ``PublishHandle``. With
+        ``nanopub_write_behind`` enabled, the nanopublications are spooled
+        and published in the background, and callers that need to read
+        their writes should call ``wait()`` on the handle.'''
         # self.db.store.nsBindings = {}
         stores = set()
+        np_graphs = []
+        for npg in nanopubs:
+            stores.add(npg.store)
+            if isinstance(npg, Nanopublication):
+                to_process = [npg]
+            else:
+                to_process = [Nanopublication(store=npg.store, identifier=npuri)
+                              for npuri in npg.subjects(rdflib.RDF.type, np.Nanopublication)]
+            for np_graph in to_process:
+                # Files are added here, in the caller's context, since
+                # adding them checks the current user's permissions.
+                for entity in np_graph.assertion.subjects(self.app.NS.whyis.hasContent):
+                    localpart = self.db.qname(entity).split(":")[1]
+                    filename = secure_filename(localpart)
+                    f = DataURLStorage(np_graph.value(entity, self.app.NS.whyis.hasContent), filename=filename)
+                    print('adding file', filename)
+                    self.app.add_file(f, entity, np_graph)
+                    np_graph.assertion.remove((entity, self.app.NS.whyis.hasContent, None))
+                np_graphs.append(np_graph)
+
+        if self.write_behind is not None:
+            return self.write_behind.submit(stores)
+        self._publish(*np_graphs, stores=stores)
+        return PublishHandle(done=True)
+
+    @timed(_nanopub_seconds, _nanopub_errors, operation='publish')
+    def _publish(self, *np_graphs, stores=None):
+        if stores is None:
+            stores = set([x.store for x in np_graphs])
         full_list = []
-        with open(self.app.config['load_dir']+'/'+create_id()+'.nq', 'a+b') if 'load_dir' in self.app.config else tempfile.NamedTemporaryFile(delete=True) as data:
-            to_retire = set([x.identifier for x in nanopubs])
-            for npg in nanopubs:
-                stores.add(npg.store)
-                if isinstance(npg, Nanopublication):
-                    to_process = [npg]
-                else:
-                    to_process = [Nanopublication(store=npg.store, identifier=npuri)
-                                  for npuri in npg.subjects(rdflib.RDF.type, np.Nanopublication)]
-                for np_graph in to_process:
-                    for entity in np_graph.assertion.subjects(self.app.NS.whyis.hasContent):
-                        localpart = self.db.qname(entity).split(":")[1]
-                        filename = secure_filename(localpart)
-                        f = DataURLStorage(np_graph.value(entity, self.app.NS.whyis.hasContent), filename=filename)
-                        print('adding file', filename)
-                        self.app.add_file(f, entity, np_graph)
-                        np_graph.assertion.remove((entity, self.app.NS.whyis.hasContent, None))
-
-                    r = False
-                    now = rdflib.Literal(datetime.utcnow())
-                    for part in [np_graph.assertion.identifier,
-                                np_graph.pubinfo.identifier,
-                                np_graph.provenance.identifier]:
-                        np_query = '''select ?np where { ?np np:hasAssertion|np:hasProvenance|np:hasPublicationInfo ?x}'''
-                        replacing = [x for x, in self.db.query(np_query, initNs=dict(np=np), initBindings=dict(x=part))]
-                        to_retire = to_retire.union(replacing)
-                    
-                    for revised in np_graph.pubinfo.objects(np_graph.assertion.identifier, prov.wasRevisionOf):
-                        for nanopub_uri in self.db.subjects(predicate=np.hasAssertion, object=revised):
-                            np_graph.pubinfo.set((nanopub_uri, prov.invalidatedAtTime, now))
-                            to_retire.add(nanopub_uri)
-                            r = True
-                            print("Retiring", nanopub_uri)
-                    if r:
-                        np_graph.pubinfo.set((np_graph.assertion.identifier, dc.modified, now))
-                    else:
-                        np_graph.pubinfo.set((np_graph.assertion.identifier, dc.created, now))
-                    full_list.append(np_graph.identifier)
-
-            bnode_cache = {}
-            def skolemize(x):
-                if isinstance(x, rdflib.BNode):
-                    if x not in bnode_cache:
-                        bnode_cache[x] = rdflib.URIRef('bnode:' + uuid4().hex)
-                    return bnode_cache[x]
-                return x
-            for store in stores:
-                for s, p, o, c in rdflib.ConjunctiveGraph(store).quads():
-                    if self.app.config.get('BNODE_REWRITE', False):
-                        s = skolemize(s)
-                        o = skolemize(o)
-                        # predicates can't be bnodes, and contexts have already been rewritten.
-                    row = nquads._nq_row((s,p,o), c.identifier).encode('utf8')
-                    data.write(row)
-                data.write(b'\n')
-                data.flush()
-                # np_graph.serialize(data, format="trig")
-                # data.write('\n')
-                # data.flush()
-                # print data.name
-                # np_graph.serialize(data, format="trig")
-                # data.write('\n')
-                # data.flush()
-            self.retire(*to_retire)
-            data.seek(0)
-            self.db.store.publish(data)
+        to_retire = set([x.identifier for x in np_graphs])
+
+        parts = set()
+        revisions = set()
+        for np_graph in np_graphs:
+            parts.update([np_graph.assertion.identifier,
+                          np_graph.pubinfo.identifier,
+                          np_graph.provenance.identifier])
+            revisions.update(np_graph.pubinfo.objects(np_graph.assertion.identifier, prov.wasRevisionOf))
+        to_retire.update(self._find_replaced(parts))
+        revised_nanopubs = self._find_revised(revisions)
+
+        for np_graph in np_graphs:
+            r = False
+            now = rdflib.Literal(datetime.utcnow())
+            for revised in np_graph.pubinfo.objects(np_graph.assertion.identifier, prov.wasRevisionOf):
+                for nanopub_uri in revised_nanopubs[revised]:
+                    np_graph.pubinfo.set((nanopub_uri, prov.invalidatedAtTime, now))
+                    to_retire.add(nanopub_uri)
+                    r = True
+                    print("Retiring", nanopub_uri)
+            if r:
+                np_graph.pubinfo.set((np_graph.assertion.identifier, dc.modified, now))
+            else:
+                np_graph.pubinfo.set((np_graph.assertion.identifier, dc.created, now))
+            full_list.append(np_graph.identifier)
+
+        # Old versions have to be gone before the first chunk is loaded,
+        # since a nanopub can replace one with the same identifier.
+        self.retire(*to_retire)
+        # Archived copies are only moved into place once the upload has
+        # succeeded.
+        archived = []
+        try:
+            with self._chunked_publisher() as publisher:
+                self._write_quads(publisher, stores, np_graphs, archived)
+        except:
+            for tmp, path in archived:
+                os.remove(tmp)
+            raise
+        for tmp, path in archived:
+            os.replace(tmp, path)
+        self._index_add(*full_list)
+        self._changed()
+        _nanopubs.inc(len(full_list), operation='publish')
+        labels = getattr(self.app, 'label_service', None)
+        if labels is not None:
+            self._invalidate_labels(set([s for np_graph in np_graphs
+                                         for p in labels.properties + labels.name_properties
+                                         for s in np_graph.assertion.subjects(p)]))
+        self._invalidate_descriptions(set([s for np_graph in np_graphs
+                                           for s in self.described_subjects(np_graph)]))
 
         for n in full_list:
             self.update_listener(n)
 
     _idmap = {}
 
-    def get(self, nanopub_uri, graph=None):
-        nanopub_uri = rdflib.URIRef(nanopub_uri)
-        
-        if graph is None:
-            graph = rdflib.ConjunctiveGraph()
+    def _redis(self):
+        if self.app.config.get('nanopub_cache_redis', False):
+            return getattr(self.app, 'redis', None)
 
-        quads = self.db.query('''select ?s ?p ?o ?g where {
-        ?np np:hasAssertion?|np:hasProvenance?|np:hasPublicationInfo? ?g.
-        graph ?g { ?s ?p ?o}
-        }''', initNs={'np':np}, initBindings={'np':nanopub_uri})
+    def _redis_key(self, nanopub_uri):
+        return "nanopub__"+nanopub_uri
+
+    def invalidate(self, *nanopub_uris):
+        '''Removes the given nanopublications from the cache.'''
+        self._cache_generation += 1
+        for nanopub_uri in nanopub_uris:
+            self.cache.delete(rdflib.URIRef(nanopub_uri))
+        redis = self._redis()
+        if redis is not None and len(nanopub_uris) > 0:
+            redis.delete(*[self._redis_key(x) for x in nanopub_uris])
+
+    def cache_stats(self):
+        stats = self.cache.stats()
+        stats['redis_hits'] = self.redis_hits
+        stats['redis_misses'] = self.redis_misses
+        return stats
+
+    def _cached_quads(self, nanopub_uri):
+        entry = self.cache.get(nanopub_uri)
+        if entry is not None:
+            if time.time() - entry[1] <= self.local_ttl:
+                return entry[0]
+            self.cache.delete(nanopub_uri)
+        redis = self._redis()
+        if redis is None:
+            return None
+        data = redis.get(self._redis_key(nanopub_uri))
+        if data is None:
+            self.redis_misses += 1
+            return None
+        self.redis_hits += 1
+        graph = rdflib.ConjunctiveGraph()
+        graph.parse(data=data.decode('utf8'), format='nquads')
+        quads = tuple((s, p, o, c.identifier) for s, p, o, c in graph.quads())
+        self.cache.set(nanopub_uri, (quads, time.time()))
+        return quads
+
+    def _cache_quads(self, nanopub_uri, quads, generation):
+        if len(quads) == 0 or generation != self._cache_generation:
+            return
+        self.cache.set(nanopub_uri, (quads, time.time()))
+        redis = self._redis()
+        if redis is not None:
+            data = ''.join([nquads._nq_row((s, p, o), g) for s, p, o, g in quads])
+            redis.set(self._redis_key(nanopub_uri), data.encode('utf8'),
+                      ex=self.app.config.get('nanopub_cache_ttl', 3600*24))
+
+    def _unskolemize(self, quads):
+        result = []
         for s, p, o, g in quads:
             if self.app.config.get('BNODE_REWRITE', False):
                 if isinstance(s, rdflib.URIRef) and s.startswith('bnode:'):
                     s = rdflib.BNode(s.replace('bnode:','',1))
                 if isinstance(o, rdflib.URIRef) and o.startswith('bnode:'):
                     o = rdflib.BNode(o.replace('bnode:','',1))
+            result.append((s,p,o,g))
+        return tuple(result)
+
+    def _read_archive(self, nanopub_uri):
+        if self.archive_path is None:
+            return None
+        path = self.get_path(nanopub_uri)
+        if not os.path.exists(path):
+            return None
+        graph = rdflib.ConjunctiveGraph()
+        try:
+            graph.parse(path, format='nquads')
+        except FileNotFoundError:
+            # retired while we were reading it
+            return None
+        return self._unskolemize([(s, p, o, c.identifier) for s, p, o, c in graph.quads()])
+
+    def _fetch_quads(self, nanopub_uri):
+        quads = self._read_archive(nanopub_uri)
+        if quads is not None:
+            return quads
+        quads = self._query('''select distinct ?s ?p ?o ?g where {
+        ?np np:hasAssertion?|np:hasProvenance?|np:hasPublicationInfo? ?g.
+        graph ?g { ?s ?p ?o}
+        }''', initNs={'np':np}, initBindings={'np':nanopub_uri})
+        return self._unskolemize(quads)
+
+    def get(self, nanopub_uri, graph=None):
+        nanopub_uri = rdflib.URIRef(nanopub_uri)
+        
+        if graph is None:
+            graph = rdflib.ConjunctiveGraph()
+
+        quads = self._cached_quads(nanopub_uri)
+        if quads is None:
+            generation = self._cache_generation
+            quads = self._fetch_quads(nanopub_uri)
+            self._cache_quads(nanopub_uri, quads, generation)
+        for s, p, o, g in quads:
             graph.add((s,p,o,g))
         nanopub = Nanopublication(store=graph.store, identifier=nanopub_uri)
         return nanopub
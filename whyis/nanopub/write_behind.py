@@ -0,0 +1,219 @@
+# -*- coding:utf-8 -*-
+
+import atexit
+import fcntl
+import os
+import queue
+import tempfile
+import threading
+import time
+
+import rdflib
+from rdflib.plugins.serializers import nquads
+
+from whyis.namespace import np
+from .nanopublication import Nanopublication
+
+
+class PublishHandle(object):
+    '''Returned by ``NanopublicationManager.publish()``. ``wait()`` blocks
+    until the nanopublications are in the knowledge graph, and raises the
+    error if publishing them failed.'''
+
+    def __init__(self, done=False):
+        self._event = threading.Event()
+        self._error = None
+        if done:
+            self._event.set()
+
+    def done(self):
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        if not self._event.wait(timeout):
+            return False
+        if self._error is not None:
+            raise self._error
+        return True
+
+    def _finish(self, error=None):
+        self._error = error
+        self._event.set()
+
+
+class _Spooled(object):
+    def __init__(self, path, f, handle):
+        self.path = path
+        self.file = f
+        self.handle = handle
+
+
+class WriteBehindQueue(object):
+    '''Spools published nanopublications to ``spool_dir`` and publishes
+    them from a background thread, merging everything that arrives within
+    ``window`` seconds (up to ``max_batch`` spool files) into one call to
+    ``publish``.
+
+    Each spool file is fsynced before ``submit()`` returns and is locked
+    by the process that owns it until it has been published. Unlocked
+    spool files left behind by a process that died are picked up when the
+    queue starts, and temporary files left by a ``submit()`` that died are
+    removed. If a batch fails to publish, its spool files are published
+    one at a time, and those that still fail are renamed to ``.failed``
+    so they can be inspected and loaded by hand.'''
+
+    # Temporary files are locked just after they are created, so older
+    # unlocked ones were left behind.
+    stale_tmp_age = 60
+
+    def __init__(self, publish, spool_dir, window=0.1, max_batch=1000):
+        self.publish = publish
+        self.spool_dir = spool_dir
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if not os.path.exists(spool_dir):
+            os.makedirs(spool_dir)
+
+    def _start(self):
+        with self._lock:
+            # Threads don't survive a fork, so each process starts its own.
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._recover()
+            self._thread = threading.Thread(target=self._run, name="whyis-write-behind", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _claim(self, path):
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            # Published and removed by its owner after it was listed.
+            return None
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return None
+        if not os.path.exists(path):
+            # Published and removed by its owner before we got the lock.
+            f.close()
+            return None
+        return f
+
+    def _remove_stale(self, path):
+        try:
+            if time.time() - os.path.getmtime(path) < self.stale_tmp_age:
+                return
+        except FileNotFoundError:
+            return
+        f = self._claim(path)
+        if f is not None:
+            os.remove(path)
+            f.close()
+
+    def _recover(self):
+        for filename in sorted(os.listdir(self.spool_dir)):
+            path = os.path.join(self.spool_dir, filename)
+            if filename.endswith('.tmp'):
+                self._remove_stale(path)
+                continue
+            if not filename.endswith('.nq'):
+                continue
+            f = self._claim(path)
+            if f is not None:
+                self._queue.put(_Spooled(path, f, PublishHandle()))
+
+    def submit(self, stores):
+        '''Durably spools the contents of ``stores`` and returns a
+        ``PublishHandle`` for when they have been published.'''
+        self._start()
+        fd, tmp = tempfile.mkstemp(dir=self.spool_dir, suffix='.tmp')
+        f = os.fdopen(fd, 'w+b')
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            for store in stores:
+                for s, p, o, c in rdflib.ConjunctiveGraph(store).quads():
+                    f.write(nquads._nq_row((s, p, o), c.identifier).encode('utf8'))
+            f.flush()
+            os.fsync(f.fileno())
+            path = tmp[:-len('.tmp')] + '.nq'
+            os.rename(tmp, path)
+        except:
+            f.close()
+            os.remove(tmp)
+            raise
+        handle = PublishHandle()
+        self._queue.put(_Spooled(path, f, handle))
+        return handle
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        if batch[0] is None:
+            return None
+        deadline = time.time() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._commit(batch)
+
+    def _load(self, spooled):
+        graph = rdflib.ConjunctiveGraph()
+        spooled.file.seek(0)
+        graph.parse(spooled.file, format='nquads')
+        return [Nanopublication(store=graph.store, identifier=npuri)
+                for npuri in graph.subjects(rdflib.RDF.type, np.Nanopublication)]
+
+    def _commit(self, batch):
+        try:
+            nanopubs = []
+            for spooled in batch:
+                nanopubs.extend(self._load(spooled))
+            self.publish(*nanopubs)
+        except Exception as e:
+            if len(batch) > 1:
+                # Publishing is idempotent, so the others can be published
+                # again without the one that failed.
+                for spooled in batch:
+                    self._commit([spooled])
+                return
+            spooled = batch[0]
+            os.rename(spooled.path, spooled.path + '.failed')
+            spooled.file.close()
+            spooled.handle._finish(e)
+            return
+        for spooled in batch:
+            os.remove(spooled.path)
+            spooled.file.close()
+            spooled.handle._finish()
+
+    def close(self):
+        '''Publishes everything that has been submitted and stops the
+        background thread.'''
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
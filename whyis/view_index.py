@@ -0,0 +1,109 @@
+# -*- coding:utf-8 -*-
+
+import collections
+
+from rdflib import Literal
+from rdflib.namespace import RDFS
+
+from whyis.cache import LRUCache
+from whyis.namespace import NS
+
+__all__ = ["ViewIndex", "ViewMatch"]
+
+ViewMatch = collections.namedtuple('ViewMatch', ['id', 'view', 'rank', 'cls', 'type'])
+
+
+def _closure(start, edges):
+    '''Returns what is reachable from ``start`` through ``edges``, in the
+    order it is reached, including ``start``.'''
+    seen = collections.OrderedDict([(start, None)])
+    queue = collections.deque([start])
+    while queue:
+        node = queue.popleft()
+        for next in edges.get(node, ()):
+            if next not in seen:
+                seen[next] = None
+                queue.append(next)
+    return list(seen)
+
+
+class ViewIndex(object):
+    '''Chooses views for resources from the vocabulary without querying it.
+
+    A view is found on a type or one of its superclasses, through
+    ``whyis:hasView`` or one of its subproperties, whose
+    ``dc:identifier`` is the view name. Matches are ranked as the view
+    query used to rank them: the type's priority plus the number of
+    classes between the type and the class with the view, counting
+    both, so that views closer to the type come first.
+
+    The vocabulary is read once, so a new index has to be made if it
+    changes.'''
+
+    def __init__(self, graph, cache_size=10000):
+        self._superclasses = collections.defaultdict(list)
+        for cls, superclass in graph.subject_objects(RDFS.subClassOf):
+            self._superclasses[cls].append(superclass)
+
+        subproperties = collections.defaultdict(list)
+        for prop, superprop in graph.subject_objects(RDFS.subPropertyOf):
+            subproperties[superprop].append(prop)
+
+        # (class, view name) -> views, one for each view property.
+        self._views = collections.defaultdict(list)
+        for prop in _closure(NS.whyis.hasView, subproperties):
+            for id in graph.objects(prop, NS.dc.identifier):
+                for cls, view in graph.subject_objects(prop):
+                    self._views[(cls, id)].append(view)
+
+        self._ancestors = LRUCache(cache_size)
+        self._matches = LRUCache(cache_size)
+
+    def ancestors(self, cls):
+        '''Returns ``cls`` and all its superclasses.'''
+        ancestors = self._ancestors.get(cls)
+        if ancestors is None:
+            ancestors = _closure(cls, self._superclasses)
+            self._ancestors.set(cls, ancestors)
+        return ancestors
+
+    def classes(self, view):
+        '''Returns the classes that have a view called ``view``.'''
+        id = Literal(view)
+        return set(cls for cls, name in self._views if name == id)
+
+    def _type_matches(self, type, id):
+        '''Returns (class, view, count) for each class of ``type`` with a
+        view called ``id``, where count is the number of classes from
+        ``type`` to that class times the number of its views.'''
+        key = (type, id)
+        matches = self._matches.get(key)
+        if matches is None:
+            matches = []
+            ancestors = self.ancestors(type)
+            for cls in ancestors:
+                views = self._views.get((cls, id))
+                if not views:
+                    continue
+                between = len([mid for mid in ancestors if cls in self.ancestors(mid)])
+                matches.append((cls, views[0], between * len(views)))
+            self._matches.set(key, matches)
+        return matches
+
+    def views(self, types, view='view'):
+        '''Returns the matches for ``types``, a list of (type, priority)
+        pairs, and the view name ``view``, best first. A type that is
+        given twice keeps its first priority, and ties keep the order of
+        ``types``.'''
+        id = Literal(view)
+        priorities = collections.OrderedDict()
+        repeats = collections.Counter()
+        for type, priority in types:
+            priorities.setdefault(type, priority)
+            repeats[type] += 1
+        results = []
+        for type, priority in priorities.items():
+            for cls, match, count in self._type_matches(type, id):
+                results.append(ViewMatch(id, match, count * repeats[type] + priority, cls, type))
+        results.sort(key=lambda match: match.rank)
+        return results